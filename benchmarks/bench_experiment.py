@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of finding an experiment, its components and its variables.
+
+Each benchmark runs on synthetic experiment trees with about 1k, 10k and
+100k files in ``outdata/echam``, see ``synthetic.make_experiment``.
+"""
+
+import os
+import shutil
+
+from esm_analysis.components.echam import EchamAnalysis
+from esm_analysis.esm_analysis import EsmAnalysis, walk_up
+from esm_analysis.experiments import find_top_of_tree, scan
+
+from .synthetic import make_experiment
+
+NFILES = [1000, 10000, 100000]
+
+
+def fesom_available():
+    """Whether the FESOM component can be imported in this environment"""
+    try:
+        import esm_analysis.components.fesom  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TimeDiscovery(object):
+    """Finding the experiment, its components, and the files of a variable"""
+
+    params = NFILES
+    param_names = ["nfiles"]
+    timeout = 600
+
+    def setup_cache(self):
+        # FESOM is left out where it cannot be imported, since looking up a
+        # variable fails then:
+        fesom_variables = ("sst", "sss", "ssh") if fesom_available() else ()
+        return {
+            nfiles: make_experiment(
+                "exp_%s" % nfiles, nfiles=nfiles, fesom_variables=fesom_variables
+            )
+            for nfiles in NFILES
+        }
+
+    def setup(self, tops, nfiles):
+        self.top = tops[nfiles]
+        self.analyser = EsmAnalysis(exp_base=self.top)
+        self.analyser.initialize_analysis_components()
+        self.echam = EchamAnalysis(exp_base=self.top)
+        # Fills the catalog:
+        self.analyser.get_component_for_variable_short_name("temp2")
+
+    def time_walk_up(self, tops, nfiles):
+        for _, _, files in walk_up(os.path.join(tops[nfiles], "outdata", "echam")):
+            if ".top_of_exp_tree" in files:
+                break
+
+    def time_find_top_of_tree(self, tops, nfiles):
+        find_top_of_tree(os.path.join(tops[nfiles], "outdata", "echam"))
+
+    def time_init(self, tops, nfiles):
+        EsmAnalysis(exp_base=tops[nfiles])
+
+    def time_initialize_analysis_components(self, tops, nfiles):
+        self.analyser.initialize_analysis_components()
+
+    def time_echam_init(self, tops, nfiles):
+        EchamAnalysis(exp_base=tops[nfiles])
+
+    def time_determine_variable_dict_from_code_files(self, tops, nfiles):
+        self.echam.determine_variable_dict_from_code_files()
+
+    def time_resolve_variable(self, tops, nfiles):
+        self.analyser.get_component_for_variable_short_name("temp2")
+
+
+class TimeColdCatalog(object):
+    """Finding the files of a variable with an empty catalog"""
+
+    params = NFILES
+    param_names = ["nfiles"]
+    timeout = 600
+    number = 1
+    warmup_time = 0
+
+    setup_cache = TimeDiscovery.setup_cache
+
+    def setup(self, tops, nfiles):
+        analysis_dir = os.path.join(tops[nfiles], "analysis")
+        shutil.rmtree(analysis_dir, ignore_errors=True)
+        self.analyser = EsmAnalysis(exp_base=tops[nfiles])
+        self.analyser.initialize_analysis_components()
+
+    def time_resolve_variable(self, tops, nfiles):
+        self.analyser.get_component_for_variable_short_name("temp2")
+
+
+class TimeScan(object):
+    """Finding all experiments of a project"""
+
+    params = [10, 100]
+    param_names = ["nexperiments"]
+    timeout = 600
+
+    def setup_cache(self):
+        # Experiments spread over a few users, with their output:
+        projects = {}
+        for nexperiments in self.params:
+            project = os.path.abspath("project_%s" % nexperiments)
+            for index in range(nexperiments):
+                make_experiment(
+                    os.path.join(project, "user%s" % (index % 5)),
+                    "EXP%03d" % index,
+                    nfiles=100,
+                    fesom_variables=(),
+                    log_lines=10,
+                )
+            projects[nexperiments] = project
+        return projects
+
+    def time_scan(self, projects, nexperiments):
+        scan([projects[nexperiments]])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the logfile parser.
+
+Writes synthetic logfiles of both formats with the given number of lines,
+and reports how many lines per second ``Logfile.from_file`` parses, and
+the peak memory it allocates while doing so::
+
+    $ python -m benchmarks.bench_logfile --lines 1000000
+
+``TimeLogfile`` runs the same under ``asv``, for 1k, 10k and 100k lines.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from esm_analysis.logfile import Logfile
+
+from .synthetic import write_synthetic_log
+
+
+class TimeLogfile(object):
+    """Parsing and statistics of logfiles of growing length"""
+
+    params = ([1000, 10000, 100000], [True, False])
+    param_names = ["lines", "esm_style"]
+
+    def setup(self, lines, esm_style):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, "EXP_compute.log")
+        write_synthetic_log(self.fname, lines, esm_style=esm_style)
+        self.log = Logfile.from_file(self.fname, esm_style=esm_style)
+
+    def teardown(self, lines, esm_style):
+        self.tmpdir.cleanup()
+
+    def time_from_file(self, lines, esm_style):
+        Logfile.from_file(self.fname, esm_style=esm_style)
+
+    def peakmem_from_file(self, lines, esm_style):
+        Logfile.from_file(self.fname, esm_style=esm_style)
+
+    def time_run_stats(self, lines, esm_style):
+        self.log.run_stats()
+
+
+def benchmark(fname, esm_style=True):
+    """
+    Returns
+    -------
+    tuple
+        The seconds needed to read ``fname``, and the peak memory in bytes
+        (measured in a second, traced, run)
+    """
+    start = time.perf_counter()
+    Logfile.from_file(fname, esm_style=esm_style)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    Logfile.from_file(fname, esm_style=esm_style)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=1000000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, esm_style in (("ESM tools", True), ("MPI-Met", False)):
+            fname = os.path.join(tmpdir, "EXP_compute.log")
+            write_synthetic_log(fname, args.lines, esm_style=esm_style)
+            seconds, peak = benchmark(fname, esm_style=esm_style)
+            print(
+                "%-10s %9d lines (%5.1f MB): %6.2f s, %10.0f lines/s, peak %7.1f MB"
+                % (
+                    name,
+                    args.lines,
+                    os.path.getsize(fname) / 1024**2,
+                    seconds,
+                    args.lines / seconds,
+                    peak / 1024**2,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the operators, with each engine.
+
+The experiments hold small fields (8 x 12 points, one time step per file),
+so that the benchmarks measure the overhead per file and per call rather
+than the arithmetic. The ``cdo`` engine uses the fake ``cdo`` in
+``fakebin``, unless the environment variable ``CDO`` points to a real one.
+"""
+
+import os
+import shutil
+
+from esm_analysis.esm_analysis import EsmAnalysis
+
+from .synthetic import ECHAM_STREAMS, make_experiment, use_fake_cdo
+
+ENGINES = ["cdo", "xarray", "streaming"]
+OPERATORS = ["fldmean", "yearmean", "ymonmean", "ymonstd", "yseasmean", "timmean"]
+
+
+def make_data_experiment(name, years):
+    """An experiment with only the main ECHAM stream, with data"""
+    streams = {"echam": ECHAM_STREAMS["echam"]}
+    return make_experiment(
+        name,
+        # A .grb and a .codes file per month:
+        nfiles=2 * 12 * years,
+        streams=streams,
+        netcdf_streams=(),
+        fesom_variables=(),
+        data=True,
+    )
+
+
+class _Operators(object):
+    timeout = 1200
+    number = 1
+    warmup_time = 0
+
+    def _analyser(self, top, engine):
+        # Without the result cache, every call computes its result again:
+        shutil.rmtree(os.path.join(top, "analysis", ".cache"), ignore_errors=True)
+        use_fake_cdo()
+        analyser = EsmAnalysis(exp_base=top, engine=engine)
+        analyser.initialize_analysis_components()
+        # Fills the catalog:
+        analyser.get_component_for_variable_short_name("temp2")
+        return analyser
+
+
+class TimeOperators(_Operators):
+    """Each operator on ten years of monthly files"""
+
+    params = (ENGINES, OPERATORS)
+    param_names = ["engine", "operator"]
+
+    def setup_cache(self):
+        return make_data_experiment("operators", 10)
+
+    def setup(self, top, engine, operator):
+        self.analyser = self._analyser(top, engine)
+
+    def time_operator(self, top, engine, operator):
+        getattr(self.analyser, operator)("temp2")
+
+    def time_three_variables(self, top, engine, operator):
+        getattr(self.analyser, operator)(["temp2", "aprl", "aprc"])
+
+
+class TimeFldmeanScaling(_Operators):
+    """``fldmean`` on 10 and 100 years of monthly files"""
+
+    params = (ENGINES, [10, 100])
+    param_names = ["engine", "years"]
+
+    def setup_cache(self):
+        return {
+            years: make_data_experiment("fldmean_%s" % years, years)
+            for years in self.params[1]
+        }
+
+    def setup(self, tops, engine, years):
+        self.analyser = self._analyser(tops[years], engine)
+
+    def time_fldmean(self, tops, engine, years):
+        self.analyser.fldmean("temp2")
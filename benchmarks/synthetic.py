@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic experiment trees for the benchmarks.
+
+``make_experiment`` lays out an experiment the way the ESM runscripts do::
+
+    <EXP_ID>/.top_of_exp_tree
+    <EXP_ID>/outdata/echam/<EXP_ID>_echam6_<stream>_<YYYYMM>.grb   (and .codes)
+    <EXP_ID>/outdata/echam/<EXP_ID>_echam6_<stream>_<YYYYMM>.nc
+    <EXP_ID>/outdata/fesom/<EXP_ID>_fesom_<variable>_<YYYY>0101.nc
+    <EXP_ID>/scripts/<EXP_ID>_compute.log
+
+The output files are empty, unless ``data`` is set; then they hold a small
+field for each variable (in NetCDF, also in the ``.grb`` files, which is
+fine for ``cdo`` and for the fake ``cdo`` in ``fakebin``).
+"""
+
+import datetime
+import os
+
+import numpy as np
+
+FAKE_CDO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakebin", "cdo")
+"""A stand-in for ``cdo`` which needs only ``xarray``, see ``use_fake_cdo``"""
+
+ECHAM_STREAMS = {
+    "echam": [
+        ("167", "1", "temp2", "2m temperature"),
+        ("142", "1", "aprl", "large scale precipitation"),
+        ("143", "1", "aprc", "convective precipitation"),
+    ],
+    "co2": [("5", "1", "co2_flux", "CO2 flux")],
+    "jsbach": [("12", "1", "cover_fract", "cover fraction")],
+}
+"""The GRIB streams of ECHAM, with the code table of each"""
+
+NETCDF_STREAMS = ("accw",)
+"""The streams of ECHAM written as NetCDF (and without a code table)"""
+
+FESOM_VARIABLES = ("sst", "sss", "ssh")
+
+_DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+
+def use_fake_cdo():
+    """
+    Makes ``cdo.Cdo()`` use the fake ``cdo``, unless the environment
+    variable ``CDO`` already points to a real one.
+    """
+    os.environ.setdefault("CDO", FAKE_CDO)
+
+
+def files_per_month(streams=ECHAM_STREAMS, netcdf_streams=NETCDF_STREAMS):
+    """The number of ECHAM output files written for each month"""
+    return 2 * len(streams) + len(netcdf_streams)
+
+
+def make_experiment(
+    base,
+    exp_id="BENCH",
+    nfiles=1000,
+    streams=ECHAM_STREAMS,
+    netcdf_streams=NETCDF_STREAMS,
+    fesom_variables=FESOM_VARIABLES,
+    log_lines=1000,
+    data=False,
+    start_year=1850,
+):
+    """
+    Writes a synthetic experiment below ``base``
+
+    Parameters
+    ----------
+    base : str
+        The directory to put the experiment in
+    exp_id : str
+    nfiles : int
+        About how many files to write to ``outdata/echam``: a ``.grb`` and a
+        ``.codes`` file per month for each of ``streams``, and a ``.nc``
+        file per month for each of ``netcdf_streams``.
+    streams : dict
+        The GRIB streams, with the code table (code number, levels, short
+        name and long name of each variable) of each
+    netcdf_streams : tuple of str
+    fesom_variables : tuple of str
+        A yearly file is written to ``outdata/fesom`` for each; no FESOM
+        output if empty.
+    log_lines : int
+        The length of the logfile, see ``write_synthetic_log``
+    data : bool
+        Whether to write a small field for each variable and month into the
+        output files (which is much slower), or leave them empty.
+    start_year : int
+
+    Returns
+    -------
+    str
+        The top of the experiment tree
+    """
+    top = os.path.join(os.path.abspath(base), exp_id)
+    echam = os.path.join(top, "outdata", "echam")
+    fesom = os.path.join(top, "outdata", "fesom")
+    scripts = os.path.join(top, "scripts")
+    for directory in (echam, scripts, os.path.join(top, "config")):
+        os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(top, ".top_of_exp_tree"), "w") as f:
+        f.write("# Top of experiment %s\n" % exp_id)
+
+    nmonths = max(1, nfiles // files_per_month(streams, netcdf_streams))
+    for month in range(nmonths):
+        year, month = start_year + month // 12, month % 12 + 1
+        date = "%04d%02d" % (year, month)
+        for stream, codes in streams.items():
+            fname = os.path.join(echam, "%s_echam6_%s_%s" % (exp_id, stream, date))
+            write_code_table(fname + ".codes", codes)
+            _write_output(
+                fname + ".grb", [code[2] for code in codes], year, month, data
+            )
+        for stream in netcdf_streams:
+            fname = os.path.join(echam, "%s_echam6_%s_%s.nc" % (exp_id, stream, date))
+            _write_output(fname, [stream], year, month, data)
+
+    if fesom_variables:
+        os.makedirs(fesom, exist_ok=True)
+        for year in range(start_year, start_year + max(1, nmonths // 12)):
+            for variable in fesom_variables:
+                fname = os.path.join(
+                    fesom, "%s_fesom_%s_%04d0101.nc" % (exp_id, variable, year)
+                )
+                _write_output(fname, [variable], year, 1, data)
+
+    if log_lines:
+        write_synthetic_log(os.path.join(scripts, exp_id + "_compute.log"), log_lines)
+    return top
+
+
+def write_code_table(fname, codes):
+    """Writes a ``.codes`` file, as ``cdo`` or ``afterburner`` would"""
+    with open(fname, "w") as f:
+        for code_number, levels, short_name, long_name in codes:
+            f.write(
+                "%5s %3s  %-8s 0 0  %s\n" % (code_number, levels, short_name, long_name)
+            )
+
+
+def _write_output(fname, varnames, year, month, data):
+    if not data:
+        open(fname, "w").close()
+        return
+    import pandas as pd
+    import xarray as xr
+
+    rng = np.random.default_rng(year * 100 + month)
+    lat, lon = np.linspace(-80, 80, 8), np.arange(0, 360, 30.0)
+    time = pd.DatetimeIndex([pd.Timestamp(year=year, month=month, day=15)])
+    xr.Dataset(
+        {
+            varname: (("time", "lat", "lon"), rng.normal(index, 1, (1, 8, 12)))
+            for index, varname in enumerate(varnames)
+        },
+        coords={"time": time, "lat": lat, "lon": lon},
+    ).to_netcdf(fname, engine="netcdf4")
+
+
+def write_synthetic_log(fname, nlines, esm_style=True):
+    """
+    Writes a logfile with ``nlines`` lines: a header, and a start and done
+    line for each run, every 10th run being started twice.
+    """
+    separator, state_separator = (" : ", " - ") if esm_style else (" :  ", " -  ")
+    time_step = datetime.timedelta(minutes=17)
+    now = datetime.datetime(2019, 3, 20, 10, 0, 0)
+    with open(fname, "w") as f:
+        f.write(now.strftime(_DATE_FORMAT) + separator + "# Beginning of Experiment\n")
+        written, run = 1, 0
+        while written < nlines:
+            run += 1
+            states = ["start", "start", "done"] if run % 10 == 0 else ["start", "done"]
+            for state in states[: nlines - written]:
+                now += time_step
+                f.write(
+                    "%s%s%s %s %s%s%s\n"
+                    % (
+                        now.strftime(_DATE_FORMAT),
+                        separator,
+                        run,
+                        18500101 + 10000 * run,
+                        4700000 + run,
+                        state_separator,
+                        state,
+                    )
+                )
+                written += 1
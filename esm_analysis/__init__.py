@@ -6,4 +6,18 @@ __author__ = """Paul Gierz"""
 __email__ = "pgierz@awi.de"
 __version__ = "0.4.2"
 
-from .esm_analysis import EsmAnalysis
+__all__ = ["AsyncEsmAnalysis", "EsmAnalysis"]
+
+
+def __getattr__(name):
+    # ``EsmAnalysis`` brings in cdo and yaml; it is only imported when it is
+    # first used, so that e.g. ``esm_analysis --help`` starts quickly.
+    if name == "EsmAnalysis":
+        from .esm_analysis import EsmAnalysis
+
+        return EsmAnalysis
+    if name == "AsyncEsmAnalysis":
+        from .async_analysis import AsyncEsmAnalysis
+
+        return AsyncEsmAnalysis
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
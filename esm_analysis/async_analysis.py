@@ -0,0 +1,242 @@
+"""
+An ``asyncio`` interface to the analyses of an experiment.
+
+``AsyncEsmAnalysis`` has the same operators as ``EsmAnalysis``, as
+coroutines, so that many analyses can be started from one event loop (e.g.
+in Jupyter, or a web service) and awaited together::
+
+    >>> analyser = AsyncEsmAnalysis(exp_base="/work/ab0123/LGM_011")
+    >>> t2m, precip, clim = await asyncio.gather(
+    ...     analyser.fldmean("temp2"),
+    ...     analyser.ymonmean(["aprl", "aprc"]),
+    ...     analyser.newest_climatology("temp2"),
+    ... )
+
+The results are the same paths (or datasets) the methods of ``EsmAnalysis``
+return. Each analysis runs in a worker thread, where it spends most of its
+time waiting for ``cdo``; at most ``max_concurrency`` of them run at once.
+Analyses which read files in this process (the Python engines, FESOM)
+take turns, as in ``EsmAnalysis.run``, and so do analyses of the same
+variable, so that a repeated request is answered from the result cache.
+"""
+
+import asyncio
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .esm_analysis import OPERATORS, EsmAnalysis
+
+
+class AsyncEsmAnalysis(object):
+    """
+    Coroutines for the analyses of one experiment
+
+    Parameters
+    ----------
+    exp_base, preferred_analysis_dir, engine
+        See ``EsmAnalysis``
+    max_concurrency : int, optional
+        How many analyses run at the same time, by default ``MAX_WORKERS``
+        of the experiment
+    analyser : EsmAnalysis, optional
+        Use this (already set up) analyser, instead of creating one
+
+    The analyser is available as the ``analyser`` attribute. Call ``close``
+    (or use ``async with``) to stop the worker threads when done.
+    """
+
+    def __init__(
+        self,
+        exp_base=None,
+        preferred_analysis_dir=None,
+        engine=None,
+        max_concurrency=None,
+        analyser=None,
+    ):
+        if analyser is None:
+            analyser = EsmAnalysis(
+                exp_base=exp_base,
+                preferred_analysis_dir=preferred_analysis_dir,
+                engine=engine,
+            )
+            analyser.initialize_analysis_components(
+                preferred_analysis_dir=preferred_analysis_dir
+            )
+        self.analyser = analyser
+        self.max_concurrency = max_concurrency or analyser.MAX_WORKERS
+        # One more thread than analyses, for looking up files meanwhile:
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency + 1)
+        # Looking up files may construct components, so lookups take turns;
+        # so do analyses which are not thread safe, and analyses of the same
+        # variable (which may write the same output files):
+        self._lookup_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._variable_locks = {}
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the worker threads, once running analyses are done"""
+        self._executor.shutdown(wait=False)
+
+    def _semaphore(self):
+        """The semaphore limiting the analyses of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    def _locate(self, varnames):
+        with self._lookup_lock:
+            return collections.OrderedDict(
+                (varname, self.analyser.get_component_for_variable_short_name(varname))
+                for varname in varnames
+            )
+
+    def _call(self, component, varnames, function):
+        with contextlib.ExitStack() as stack:
+            # Always in the same order, so that no two analyses wait for
+            # each other:
+            for varname in sorted(set(varnames)):
+                stack.enter_context(
+                    self._variable_locks.setdefault(
+                        (component.NAME, varname), threading.Lock()
+                    )
+                )
+            if not component.THREAD_SAFE:
+                stack.enter_context(self._lock)
+            return function()
+
+    async def _apply(self, operator, component, flist, varnames, kwargs):
+        """``EsmAnalysis._apply_to_group`` in a worker thread"""
+        function = functools.partial(
+            EsmAnalysis._apply_to_group, operator, component, flist, varnames, **kwargs
+        )
+        async with self._semaphore():
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._call, component, varnames, function
+            )
+
+    async def analyze(self, operator, varname, **kwargs):
+        """
+        Runs ``EsmAnalysis.<operator>(varname, **kwargs)``
+
+        Variables stored in the same files are handed to their component
+        together, and the analyses of different files run concurrently, as
+        in ``EsmAnalysis.run``.
+
+        Parameters
+        ----------
+        operator : str
+            One of ``esm_analysis.esm_analysis.OPERATORS``
+        varname : str or list
+
+        Returns
+        -------
+        The result of the analysis, for a list of variables a dictionary of
+        the result of each.
+        """
+        if operator not in OPERATORS:
+            raise ValueError(
+                "Unknown analysis %s, use one of %s" % (operator, ", ".join(OPERATORS))
+            )
+        varnames = [varname] if isinstance(varname, str) else list(varname)
+        located = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._locate, varnames
+        )
+        if operator == "newest_climatology":
+            # Each climatology finds its own (most recent) files:
+            groups = [
+                (component, flist, [name])
+                for name, (flist, component) in located.items()
+            ]
+        else:
+            groups = EsmAnalysis._group_by_stream(located)
+        logging.debug("%s of %s in %s groups", operator, varnames, len(groups))
+        results = {}
+        for group_results in await asyncio.gather(
+            *(
+                self._apply(operator, component, flist, group, kwargs)
+                for component, flist, group in groups
+            )
+        ):
+            results.update(group_results)
+        if isinstance(varname, str):
+            return results[varname]
+        return {name: results[name] for name in varnames}
+
+    async def run(self, jobs):
+        """
+        Runs several analyses at once, as ``EsmAnalysis.run``
+
+        Parameters
+        ----------
+        jobs : iterable of tuple
+            ``(operator, varname)`` pairs
+
+        Returns
+        -------
+        dict
+            For each operator, a dictionary of the result of each variable
+        """
+        by_operator = collections.OrderedDict()
+        for operator, varname in jobs:
+            if operator not in OPERATORS:
+                raise ValueError(
+                    "Unknown analysis %s, use one of %s"
+                    % (operator, ", ".join(OPERATORS))
+                )
+            by_operator.setdefault(operator, []).append(varname)
+        results = await asyncio.gather(
+            *(
+                self.analyze(operator, list(dict.fromkeys(varnames)))
+                for operator, varnames in by_operator.items()
+            )
+        )
+        return collections.OrderedDict(
+            (operator, collections.OrderedDict(result.items()))
+            for operator, result in zip(by_operator, results)
+        )
+
+    async def fldmean(self, varname, **kwargs):
+        """``EsmAnalysis.fldmean``, e.g. ``await analyser.fldmean("temp2")``"""
+        return await self.analyze("fldmean", varname, **kwargs)
+
+    async def yearmean(self, varname, **kwargs):
+        """``EsmAnalysis.yearmean``"""
+        return await self.analyze("yearmean", varname, **kwargs)
+
+    async def ymonmean(self, varname):
+        """``EsmAnalysis.ymonmean``"""
+        return await self.analyze("ymonmean", varname)
+
+    async def yseasmean(self, varname):
+        """``EsmAnalysis.yseasmean``"""
+        return await self.analyze("yseasmean", varname)
+
+    async def timmean(self, varname):
+        """``EsmAnalysis.timmean``"""
+        return await self.analyze("timmean", varname)
+
+    async def ymonstd(self, varname):
+        """``EsmAnalysis.ymonstd``"""
+        return await self.analyze("ymonstd", varname)
+
+    async def reductions(self, varname, operators=None):
+        """``EsmAnalysis.reductions``"""
+        kwargs = {} if operators is None else {"operators": operators}
+        return await self.analyze("reductions", varname, **kwargs)
+
+    async def newest_climatology(self, varname):
+        """``EsmAnalysis.newest_climatology``"""
+        return await self.analyze("newest_climatology", varname)
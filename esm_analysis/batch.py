@@ -0,0 +1,230 @@
+"""
+The same analysis of many experiments.
+
+Model intercomparisons apply the same diagnostic to tens of experiments.
+``run_across_experiments`` runs it for each of them, several at a time::
+
+    >>> from esm_analysis.batch import run_across_experiments
+    >>> results = run_across_experiments(["/work/ab0123/PMIP"], "fldmean", "temp2")
+    >>> for result in results:
+    ...     print(result.exp_id, result.output or result.error)
+
+or, from the command line::
+
+    $ esm_analysis batch --experiments /work/ab0123/PMIP fldmean temp2
+
+Each experiment is set up and analysed in a process of its own, so that a
+failure (or a crash, e.g. after running out of memory) only affects that
+experiment. The experiments running at the same time share the CPUs: each
+analysis gets ``ESM_ANALYSIS_MAX_WORKERS`` set to its share, which limits
+the processes it starts for chunks of files (see
+``EchamAnalysis._reduce_chunks``). ``memory_limit`` additionally caps the
+address space of each of these processes, including the ``cdo`` processes.
+"""
+
+import collections
+import logging
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .daemon import output_files
+
+BatchResult = collections.namedtuple(
+    "BatchResult", ["experiment", "exp_id", "output", "error", "seconds"]
+)
+BatchResult.__doc__ = """
+The outcome of an analysis of one experiment
+
+``output`` holds the output file (or, for several variables or reductions,
+a dictionary of them), ``error`` is ``None`` on success, and a description
+of what went wrong otherwise.
+"""
+
+
+def find_experiments(paths):
+    """
+    The experiments in ``paths``
+
+    Parameters
+    ----------
+    paths : list of str
+        Experiments (directories with a ``.top_of_exp_tree`` file), IDs of
+        experiments in the experiment catalog, or directories containing
+        experiments (at any depth, see ``esm_analysis.experiments.scan``)
+
+    Returns
+    -------
+    list of str
+
+    Raises
+    ------
+    ValueError
+        If one of ``paths`` is neither a directory nor a known experiment
+    """
+    from .experiments import resolve_experiment, scan
+
+    experiments = []
+    for path in paths:
+        if os.path.isdir(path):
+            experiments.extend(scan([path]))
+        else:
+            experiments.append(resolve_experiment(path))
+    return experiments
+
+
+def _init_worker(max_workers, memory_limit):
+    os.environ["ESM_ANALYSIS_MAX_WORKERS"] = str(max_workers)
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _analyze_experiment(experiment, method, varname, options, kwargs):
+    """Runs ``EsmAnalysis.<method>`` for ``experiment``, in a worker process"""
+    from .esm_analysis import EsmAnalysis
+
+    start = time.perf_counter()
+    output = error = None
+    try:
+        analyser = EsmAnalysis(exp_base=experiment, **options)
+        analyser.initialize_analysis_components(
+            preferred_analysis_dir=options.get("preferred_analysis_dir")
+        )
+        output = output_files(getattr(analyser, method)(varname, **kwargs))
+    except Exception as exception:
+        logging.debug("%s failed", experiment, exc_info=True)
+        error = "%s: %s" % (type(exception).__name__, exception)
+    return BatchResult(
+        experiment,
+        os.path.basename(os.path.normpath(experiment)),
+        output,
+        error,
+        time.perf_counter() - start,
+    )
+
+
+def _run_isolated(experiment, method, varname, options, kwargs, limits):
+    """``_analyze_experiment`` in a new process, surviving its crash"""
+    with ProcessPoolExecutor(
+        max_workers=1, initializer=_init_worker, initargs=limits
+    ) as pool:
+        future = pool.submit(
+            _analyze_experiment, experiment, method, varname, options, kwargs
+        )
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            logging.error("The analysis of %s crashed", experiment)
+            return BatchResult(
+                experiment,
+                os.path.basename(os.path.normpath(experiment)),
+                None,
+                "The worker process died (out of memory?)",
+                None,
+            )
+
+
+def run_across_experiments(
+    paths,
+    method,
+    varname,
+    max_workers=None,
+    memory_limit=None,
+    preferred_analysis_dir=None,
+    engine=None,
+    **kwargs
+):
+    """
+    Runs ``EsmAnalysis.<method>(varname, **kwargs)`` for many experiments
+
+    Parameters
+    ----------
+    paths : list of str
+        Experiments, their IDs, or directories containing experiments, see
+        ``find_experiments``
+    method : str
+        One of ``esm_analysis.esm_analysis.OPERATORS``, e.g. ``fldmean``
+    varname : str or list
+    max_workers : int, optional
+        How many experiments are analysed at the same time; by default
+        ``ESM_ANALYSIS_MAX_WORKERS``, or the number of CPUs.
+    memory_limit : int or str, optional
+        Maximum address space of each process, e.g. ``"8G"``
+    preferred_analysis_dir, engine
+        See ``EsmAnalysis``
+    **kwargs
+        Further arguments of ``method``, e.g. ``incremental=True``
+
+    Returns
+    -------
+    list of BatchResult
+        One per experiment, in the order found
+    """
+    from .esm_analysis import OPERATORS
+    from .result_cache import parse_size
+
+    if method not in OPERATORS:
+        raise ValueError(
+            "Unknown analysis %s, use one of %s" % (method, ", ".join(OPERATORS))
+        )
+    experiments = find_experiments(paths)
+    if max_workers is None:
+        max_workers = int(
+            os.environ.get("ESM_ANALYSIS_MAX_WORKERS", os.cpu_count() or 1)
+        )
+    workers = max(1, min(max_workers, len(experiments)))
+    limits = (max(1, (os.cpu_count() or 1) // workers), parse_size(memory_limit))
+    options = {"preferred_analysis_dir": preferred_analysis_dir, "engine": engine}
+    logging.info(
+        "Running %s of %s for %s experiments, %s at a time",
+        method,
+        varname,
+        len(experiments),
+        workers,
+    )
+    # Each thread waits for the process analysing one experiment:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                lambda experiment: _run_isolated(
+                    experiment, method, varname, options, kwargs, limits
+                ),
+                experiments,
+            )
+        )
+
+
+def summary(results):
+    """
+    The results as rows for a table, e.g. with ``tabulate``
+
+    Parameters
+    ----------
+    results : list of BatchResult
+
+    Returns
+    -------
+    list of dict
+        The experiment, the time taken, and the output files or the error
+    """
+    rows = []
+    for result in results:
+        if result.error is not None:
+            outcome = result.error
+        elif isinstance(result.output, dict):
+            outcome = "\n".join(
+                "%s: %s" % (key, value) for key, value in result.output.items()
+            )
+        else:
+            outcome = result.output
+        rows.append(
+            {
+                "experiment": result.exp_id,
+                "seconds": None if result.seconds is None else round(result.seconds, 1),
+                "status": "failed" if result.error is not None else "ok",
+                "output": outcome,
+            }
+        )
+    return rows
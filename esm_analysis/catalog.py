@@ -0,0 +1,397 @@
+"""
+Persistent catalog of the files found in an experiment's ``outdata`` tree.
+
+Looking up which files contain a certain variable used to mean listing the
+entire ``OUTDATA_DIR`` of every component and matching each file against a
+freshly compiled regular expression. On large experiment trees, this is
+slow. The ``OutdataCatalog`` keeps an on-disk SQLite index of each file's
+component, stream, date, size and modification time, together with the
+variables available in each stream, so that the question "which files have
+variable X between dates A and B" is a single indexed query. The stream of
+each file is taken from its name, see ``esm_analysis.streams``.
+
+The catalog is refreshed incrementally: a component directory is only
+re-listed if its modification time changed since the last scan. Entries are
+kept by directory, so that one catalog (e.g. in a shared analysis directory)
+can hold the ``echam`` output of several experiments.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from . import profiling
+from .streams import classify
+
+SCHEMA_VERSION = 3
+"""Catalogs of an older version are emptied and filled again when opened"""
+
+_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_TABLES = ("directories", "files", "stream_variables")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    component TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    component TEXT NOT NULL,
+    stream TEXT,
+    date INTEGER,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stream_variables (
+    directory TEXT NOT NULL,
+    component TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    code_number TEXT,
+    levels TEXT,
+    long_name TEXT,
+    PRIMARY KEY (directory, stream, variable)
+);
+CREATE INDEX IF NOT EXISTS files_by_stream_date ON files (directory, stream, date);
+CREATE INDEX IF NOT EXISTS stream_variables_by_variable ON stream_variables (variable);
+"""
+
+# The last group of 4, 6, 8 or 10 digits (YYYY[MM[DD[HH]]]), and only if it
+# is not part of a longer group:
+_TRAILING_DATE = re.compile(r"(?<!\d)(\d{4}(?:\d\d){0,3})\D*$")
+
+_DATE_LENGTHS = (4, 6, 8, 10)
+
+
+def parse_date_from_filename(fname):
+    """
+    Parses the date encoded in a model output filename.
+
+    The last group of digits in the file's basename is used if it has 4, 6,
+    8 or 10 digits (``YYYY``, ``YYYYMM``, ``YYYYMMDD`` or ``YYYYMMDDHH``),
+    e.g. ``LGM_011_echam6_echam_185001.grb`` gives ``18500101`` and
+    ``LGM_011_fesom_temp_18500101.nc`` gives ``18500101``.
+
+    Parameters
+    ----------
+    fname : str
+        The filename to parse, with or without directory
+
+    Returns
+    -------
+    int or None
+        The date as an integer of the form ``YYYYMMDD``, or ``None`` if no
+        date could be found.
+    """
+    match = _TRAILING_DATE.search(os.path.basename(fname))
+    if not match:
+        return None
+    return date_key(match.group(1))
+
+
+def date_key(date):
+    """
+    Converts a date given as ``YYYY``, ``YYYYMM``, ``YYYYMMDD``,
+    ``YYYYMMDDHH`` (optionally with dashes, e.g. ``1850-01``) or integer into
+    a sortable ``YYYYMMDD`` integer.
+
+    Parameters
+    ----------
+    date : str or int or None
+
+    Returns
+    -------
+    int or None
+
+    Raises
+    ------
+    ValueError
+        If ``date`` has any other number of digits
+    """
+    if date is None:
+        return None
+    digits = _date_digits(date)
+    if len(digits) == 4:
+        return int(digits) * 10000 + 101
+    if len(digits) == 6:
+        return int(digits) * 100 + 1
+    return int(digits[:8])
+
+
+def _date_digits(date):
+    digits = str(date).replace("-", "")
+    if not digits.isdigit() or len(digits) not in _DATE_LENGTHS:
+        raise ValueError(
+            "Cannot understand date %s, use YYYY, YYYYMM, YYYYMMDD or YYYYMMDDHH" % date
+        )
+    return digits
+
+
+class OutdataCatalog(object):
+    """
+    SQLite index of model output files, by component, stream, variable and date
+
+    Parameters
+    ----------
+    db_path : str
+        Where the SQLite database should be stored. It is created if it does
+        not exist yet.
+    exp_id : str, optional
+        The experiment, needed to split the filenames into their parts if
+        its ID contains underscores (see ``esm_analysis.streams``)
+
+    The catalog can be used from several threads; its methods take turns.
+    """
+
+    def __init__(self, db_path, exp_id=None):
+        self.db_path = db_path
+        self.exp_id = exp_id
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self._conn.executescript(_META_SCHEMA)
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'schema_version'"
+        ).fetchone()
+        if row is None or row[0] != str(SCHEMA_VERSION):
+            # The tables of older versions have other columns:
+            for table in _TABLES:
+                self._conn.execute("DROP TABLE IF EXISTS %s" % table)
+            if row is not None:
+                logging.info("Catalog %s is outdated, emptying it", db_path)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(SCHEMA_VERSION),),
+        )
+        self._conn.commit()
+
+    def close(self):
+        """Closes the underlying database connection"""
+        self._conn.close()
+
+    @profiling.timed
+    def refresh(self, component, outdata_dir, get_variables):
+        """
+        Brings the catalog entries of a single component directory up to date.
+
+        The directory is only listed again if its modification time has
+        changed since the last refresh. Files which have been added, removed,
+        or modified since then are updated; everything else is left alone.
+
+        Parameters
+        ----------
+        component : str
+            The component name, e.g. ``echam`` or ``fesom``
+        outdata_dir : str
+            The directory holding the output files of this component. The
+            entries of each directory are kept apart, also if several have
+            the same component.
+        get_variables : callable
+            Called without arguments only if the directory needs to be
+            rescanned. Needs to return a dictionary in the same format as the
+            ``_variables`` attribute of the component analysis classes: the
+            outer key is a stream (e.g. ``echam6_echam.grb``, see
+            ``esm_analysis.streams.OutputFile.key``), the inner key is the
+            variable short name.
+
+        Returns
+        -------
+        bool
+            ``True`` if the directory was rescanned, ``False`` otherwise.
+        """
+        # Concurrent refreshes of one component would both rescan it:
+        with self._lock:
+            return self._refresh(component, outdata_dir, get_variables)
+
+    def _refresh(self, component, outdata_dir, get_variables):
+        directory = os.path.normpath(outdata_dir)
+        try:
+            dir_mtime = os.stat(outdata_dir).st_mtime_ns
+        except FileNotFoundError:
+            logging.warning("Cannot catalog missing directory %s", outdata_dir)
+            return False
+        row = self._conn.execute(
+            "SELECT component, mtime_ns FROM directories WHERE path = ?", (directory,)
+        ).fetchone()
+        if row is not None and tuple(row) == (component, dir_mtime):
+            logging.debug("Catalog for %s is up to date", component)
+            return False
+
+        logging.info("Refreshing catalog for %s in %s", component, outdata_dir)
+        variables = get_variables()
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self._conn.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE directory = ?",
+                (directory,),
+            )
+        }
+        known_streams = {
+            stream
+            for (stream,) in self._conn.execute(
+                "SELECT DISTINCT stream FROM stream_variables WHERE directory = ?",
+                (directory,),
+            )
+        }
+        if known_streams != set(variables):
+            # The streams themselves changed (e.g. a new .codes file showed
+            # up), so every file needs to be classified again:
+            logging.debug("Streams of %s changed, reclassifying all files", component)
+            known = {path: None for path in known}
+        rows = []
+        seen = set()
+        with os.scandir(outdata_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                path = entry.path
+                seen.add(path)
+                stat = entry.stat()
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                stream, date = classify(entry.name, self.exp_id) or (None, None)
+                rows.append(
+                    (
+                        path,
+                        directory,
+                        component,
+                        stream,
+                        date_key(date),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    )
+                )
+        removed = [(path,) for path in known if path not in seen]
+
+        with self._conn:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(path, directory, component, stream, date, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "DELETE FROM stream_variables WHERE directory = ?", (directory,)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO stream_variables "
+                "(directory, component, stream, variable, code_number, levels, "
+                "long_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        directory,
+                        component,
+                        stream,
+                        short_name,
+                        info.get("code_number"),
+                        info.get("levels"),
+                        info.get("long_name"),
+                    )
+                    for stream, short_names in variables.items()
+                    for short_name, info in short_names.items()
+                ],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO directories (path, component, mtime_ns) "
+                "VALUES (?, ?, ?)",
+                (directory, component, dir_mtime),
+            )
+        logging.debug(
+            "Catalog for %s: %s new or changed, %s removed",
+            component,
+            len(rows),
+            len(removed),
+        )
+        return True
+
+    def components_for_variable(self, variable):
+        """
+        Returns the (sorted) names of all components with a stream containing
+        ``variable``
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT component FROM stream_variables "
+                "WHERE variable = ? ORDER BY component",
+                (variable,),
+            ).fetchall()
+        return [component for (component,) in rows]
+
+    @profiling.timed
+    def files_for_variable(
+        self, variable, component=None, start=None, end=None, directories=None
+    ):
+        """
+        Finds all files containing a variable, optionally limited to a date range.
+
+        Parameters
+        ----------
+        variable : str
+            The variable short name, e.g. ``temp2``
+        component : str, optional
+            Only look in this component
+        start, end : str or int, optional
+            Inclusive date limits, e.g. ``"1850"``, ``"1850-06"`` or
+            ``18500601``. Files without a parsable date are only included if
+            no limits are given.
+        directories : list of str, optional
+            Only look in these outdata directories, e.g. those of one
+            experiment
+
+        Returns
+        -------
+        list of tuple
+            One ``(component, stream, files)`` tuple per matching stream (of
+            each directory), where ``files`` is sorted by path.
+        """
+        query = (
+            "SELECT f.directory, f.component, f.stream, f.path FROM files AS f "
+            "JOIN stream_variables AS v "
+            "ON f.directory = v.directory AND f.stream = v.stream "
+            "WHERE v.variable = ?"
+        )
+        params = [variable]
+        if component is not None:
+            query += " AND f.component = ?"
+            params.append(component)
+        if directories is not None:
+            directories = [os.path.normpath(d) for d in directories]
+            query += " AND f.directory IN (%s)" % ", ".join("?" * len(directories))
+            params.extend(directories)
+        if start is not None:
+            query += " AND f.date >= ?"
+            params.append(date_key(start))
+        if end is not None:
+            # An end date of e.g. 1850 should include all of 1850:
+            query += " AND f.date <= ?"
+            params.append(_inclusive_end(end))
+        query += " ORDER BY f.directory, f.stream, f.path"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        results, groups = [], []
+        for directory, comp, stream, path in rows:
+            if not groups or groups[-1] != (directory, stream):
+                groups.append((directory, stream))
+                results.append((comp, stream, []))
+            results[-1][2].append(path)
+        return results
+
+
+def _inclusive_end(end):
+    digits = _date_digits(end)
+    if len(digits) == 4:
+        return int(digits) * 10000 + 1231
+    if len(digits) == 6:
+        return int(digits) * 100 + 31
+    return int(digits[:8])
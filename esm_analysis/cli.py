@@ -16,44 +16,148 @@ This section describes how to use the command line interface
 There are 2 top level flags that can be set: ``--debug`` or ``--verbose``. If
 both are given, ``--debug`` has precedence.
 
+With ``--profile``, a tree of the time spent in each stage (finding the
+experiment, looking up variables, each ``cdo`` call, ...) is printed at the
+end; ``--profile-output`` also writes all timings to a file, as JSON or as
+a Chrome trace (``--profile-format chrome``). See ``esm_analysis.profiling``.
+
+If an analysis daemon is running (``esm_analysis daemon start --detach``), the
+analyses are sent to it, which keeps the experiments loaded between calls; see
+``esm_analysis.daemon``. ``--no-daemon`` (or ``ESM_ANALYSIS_DAEMON=0``) runs
+them in the command itself, as does ``--profile``.
+
 Entering ``esm_viz --help`` prints a list of currently implemented methods.
 
 The individual operators are documented below.
 """
+import glob
 import logging
+import os
 import sys
+import time
 
 import click
-from esm_analysis.logfile import Logfile
-import tabulate
 
-from esm_analysis import EsmAnalysis
+# Only modules without heavy dependencies are imported here; each command
+# imports what it needs (``EsmAnalysis`` with cdo and xarray, the logfile
+# statistics with pandas), so that e.g. ``--help`` and the daemon client
+# start quickly.
+from esm_analysis import daemon, profiling
 
 
 @click.group()
 @click.option("--debug", default=False, is_flag=True)
 @click.option("--verbose", default=False, is_flag=True)
+@click.option(
+    "--profile",
+    default=False,
+    is_flag=True,
+    help="Print how long each stage of the analysis took.",
+)
+@click.option(
+    "--profile-output",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timings of all stages to this file (implies --profile).",
+)
+@click.option(
+    "--profile-format",
+    default="json",
+    type=click.Choice(["json", "chrome"]),
+    help="Span tree as JSON, or a Chrome trace (chrome://tracing, ui.perfetto.dev).",
+)
+@click.option(
+    "--daemon/--no-daemon",
+    "use_daemon",
+    default=True,
+    envvar="ESM_ANALYSIS_DAEMON",
+    help="Send analyses to the analysis daemon, if it is running (the default).",
+)
 @click.version_option()
-def main(args=None, verbose=False, debug=False):
+@click.pass_context
+def main(
+    ctx,
+    args=None,
+    verbose=False,
+    debug=False,
+    profile=False,
+    profile_output=None,
+    profile_format="json",
+    use_daemon=True,
+):
     """Console script for esm_analysis."""
+    # Profiles are only recorded in this process:
+    ctx.obj = {"use_daemon": use_daemon and not (profile or profile_output)}
     if debug:
         logging.basicConfig(level=logging.DEBUG)
     elif verbose:
         logging.basicConfig(level=logging.INFO)
+    if profile or profile_output:
+        profiling.enable()
+        ctx.call_on_close(lambda: _report_profile(profile_output, profile_format))
     return 0
 
 
+def _report_profile(fname, fmt):
+    """Prints the profile summary, and writes it to ``fname`` in ``fmt``"""
+    profiler = profiling.disable()
+    click.echo(profiler.summary(), err=True)
+    if fname:
+        if fmt == "chrome":
+            profiler.write_chrome_trace(fname)
+        else:
+            profiler.write_json(fname)
+        click.echo("Profile written to %s" % fname, err=True)
+
+
+def _analyze(method, varname, preferred_analysis_dir=None, **kwargs):
+    """
+    Runs ``EsmAnalysis.<method>`` for the experiment around the current
+    directory: in the analysis daemon if it is running, otherwise here.
+    """
+    if click.get_current_context().find_root().obj["use_daemon"]:
+        try:
+            return daemon.analyze(
+                method, varname, preferred_analysis_dir=preferred_analysis_dir, **kwargs
+            )
+        except daemon.DaemonError as error:
+            raise click.ClickException(str(error))
+        except OSError as error:
+            logging.debug("No analysis daemon: %s", error)
+    from esm_analysis import EsmAnalysis
+
+    analyzer = EsmAnalysis(preferred_analysis_dir=preferred_analysis_dir)
+    analyzer.initialize_analysis_components(
+        preferred_analysis_dir=preferred_analysis_dir
+    )
+    return getattr(analyzer, method)(varname, **kwargs)
+
+
+def _varname(varnames):
+    """A single variable name by itself, several as a list"""
+    return varnames[0] if len(varnames) == 1 else list(varnames)
+
+
 @main.command()
-@click.argument("varname")
+@click.argument("varnames", nargs=-1, required=True)
 @click.option("--preferred_analysis_dir", default=None)
-def fldmean(varname, preferred_analysis_dir=None):
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Only process files which are new since the last run, and append them.",
+)
+def fldmean(varnames, preferred_analysis_dir=None, incremental=False):
     """Fldmean generator
 
     Parameters
     ----------
-    varname : str
-        The variable name to make a fldmean for. This will automatically figure
-        out which model ``varname`` belongs to.
+    varnames : str
+        The variable names to make a fldmean for. This will automatically
+        figure out which model each of them belongs to. Variables stored in
+        the same files are extracted in one pass.
+    incremental : bool
+        Only process new model output and append it to an existing fldmean.
 
     Examples
     --------
@@ -61,27 +165,62 @@ def fldmean(varname, preferred_analysis_dir=None):
     ..code ::
 
         $ esm_analysis fldmean temp2
+        $ esm_analysis fldmean temp2 aprl aprc
+        $ esm_analysis fldmean --incremental temp2
     """
-    click.echo("This will generate a fldmean for: %s" % varname)
+    click.echo("This will generate a fldmean for: %s" % ", ".join(varnames))
     click.echo("You passed in preferred_analysis_dir: %s" % preferred_analysis_dir)
-    analyzer = EsmAnalysis(preferred_analysis_dir=preferred_analysis_dir)
-    analyzer.initialize_analysis_components(
-        preferred_analysis_dir=preferred_analysis_dir
+    _analyze(
+        "fldmean", _varname(varnames), preferred_analysis_dir, incremental=incremental
     )
-    analyzer.fldmean(varname)
 
 
 @main.command()
-@click.argument("varname")
+@click.argument("varnames", nargs=-1, required=True)
 @click.option("--preferred_analysis_dir", default=None)
-def ymonmean(varname, preferred_analysis_dir=None):
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Only process files which are new since the last run, and append them.",
+)
+def yearmean(varnames, preferred_analysis_dir=None, incremental=False):
+    """Yearmean generator
+
+    Parameters
+    ----------
+    varnames : str
+        The variable names to make a yearmean for. This will automatically
+        figure out which model each of them belongs to.
+    incremental : bool
+        Only process new model output and update the existing yearmean.
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis yearmean --incremental temp2
+    """
+    click.echo("This will generate a yearmean for: %s" % ", ".join(varnames))
+    if preferred_analysis_dir:
+        click.echo("You passed in preferred_analysis_dir: %s" % preferred_analysis_dir)
+    _analyze(
+        "yearmean", _varname(varnames), preferred_analysis_dir, incremental=incremental
+    )
+
+
+@main.command()
+@click.argument("varnames", nargs=-1, required=True)
+@click.option("--preferred_analysis_dir", default=None)
+def ymonmean(varnames, preferred_analysis_dir=None):
     """Fldmean generator
 
     Parameters
     ----------
-    varname : str
-        The variable name to make a ymonmean for. This will automatically figure
-        out which model ``varname`` belongs to.
+    varnames : str
+        The variable names to make a ymonmean for. This will automatically
+        figure out which model each of them belongs to.
 
     Examples
     --------
@@ -90,27 +229,23 @@ def ymonmean(varname, preferred_analysis_dir=None):
 
         $ esm_analysis ymonmean temp2
     """
-    click.echo("This will generate a ymonmean for: %s" % varname)
+    click.echo("This will generate a ymonmean for: %s" % ", ".join(varnames))
     if preferred_analysis_dir:
         click.echo("You passed in preferred_analysis_dir: %s" % preferred_analysis_dir)
-    analyzer = EsmAnalysis(preferred_analysis_dir=preferred_analysis_dir)
-    analyzer.initialize_analysis_components(
-        preferred_analysis_dir=preferred_analysis_dir
-    )
-    analyzer.ymonmean(varname)
+    _analyze("ymonmean", _varname(varnames), preferred_analysis_dir)
 
 
 @main.command()
-@click.argument("varname")
+@click.argument("varnames", nargs=-1, required=True)
 @click.option("--preferred_analysis_dir", default=None)
-def yseasmean(varname, preferred_analysis_dir=None):
+def yseasmean(varnames, preferred_analysis_dir=None):
     """Fldmean generator
 
     Parameters
     ----------
-    varname : str
-        The variable name to make a yseasmean for. This will automatically figure
-        out which model ``varname`` belongs to.
+    varnames : str
+        The variable names to make a yseasmean for. This will automatically
+        figure out which model each of them belongs to.
 
     Examples
     --------
@@ -119,37 +254,489 @@ def yseasmean(varname, preferred_analysis_dir=None):
 
         $ esm_analysis yseasmean temp2
     """
-    click.echo("This will generate a yseasmean for: %s" % varname)
+    click.echo("This will generate a yseasmean for: %s" % ", ".join(varnames))
     if preferred_analysis_dir:
         click.echo("You passed in preferred_analysis_dir: %s" % preferred_analysis_dir)
-    analyzer = EsmAnalysis(preferred_analysis_dir=preferred_analysis_dir)
-    analyzer.initialize_analysis_components(
-        preferred_analysis_dir=preferred_analysis_dir
+    _analyze("yseasmean", _varname(varnames), preferred_analysis_dir)
+
+
+@main.command()
+@click.argument("varnames", nargs=-1, required=True)
+@click.option("--preferred_analysis_dir", default=None)
+@click.option(
+    "--operators",
+    default=None,
+    help="Comma separated reductions to make, e.g. fldmean,timmean",
+)
+def reductions(varnames, preferred_analysis_dir=None, operators=None):
+    """Several reductions from one read of the model output
+
+    Parameters
+    ----------
+    varnames : str
+        The variable names to make the reductions for. This will
+        automatically figure out which model each of them belongs to.
+    operators : str
+        Comma separated list of reductions. By default, fldmean, yearmean,
+        ymonmean, yseasmean and timmean are made.
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis reductions temp2
+        $ esm_analysis reductions --operators fldmean,yearmean temp2
+    """
+    click.echo("This will generate reductions for: %s" % ", ".join(varnames))
+    if preferred_analysis_dir:
+        click.echo("You passed in preferred_analysis_dir: %s" % preferred_analysis_dir)
+    _analyze(
+        "reductions",
+        _varname(varnames),
+        preferred_analysis_dir,
+        operators=operators.split(",") if operators else None,
     )
-    analyzer.yseasmean(varname)
 
 
 @main.command()
-@click.argument("varname")
+@click.argument("varnames", nargs=-1, required=True)
 @click.option("--preferred_analysis_dir", default=None)
-def climmean(varname, preferred_analysis_dir):
+def climmean(varnames, preferred_analysis_dir):
     """
     Newest climatology
     """
-    click.echo("This will generate the newest climatology for: %s" % varname)
-    analyzer = EsmAnalysis(preferred_analysis_dir=preferred_analysis_dir)
-    analyzer.initialize_analysis_components(
-        preferred_analysis_dir=preferred_analysis_dir
+    click.echo(
+        "This will generate the newest climatology for: %s" % ", ".join(varnames)
+    )
+    _analyze("newest_climatology", _varname(varnames), preferred_analysis_dir)
+
+
+def _parse_jobs(items):
+    """
+    ``(operator, varname)`` pairs from items like ``fldmean:temp2,aprl``
+    """
+    jobs = []
+    for item in items:
+        operator, _, varnames = item.partition(":")
+        if operator == "climmean":
+            # As the command of the same name:
+            operator = "newest_climatology"
+        if not varnames or operator not in daemon.METHODS or operator == "run":
+            raise click.BadParameter(
+                "%s is not OPERATOR:VARNAME[,VARNAME...], with OPERATOR one of %s"
+                % (item, ", ".join(m for m in daemon.METHODS if m != "run")),
+                param_hint="JOBS",
+            )
+        jobs.extend((operator, varname) for varname in varnames.split(","))
+    return jobs
+
+
+@main.command()
+@click.argument("jobs", nargs=-1)
+@click.option(
+    "--file",
+    "-f",
+    "job_file",
+    default=None,
+    type=click.File(),
+    help="Read further jobs from this file (- for stdin), one or more per "
+    "line; lines starting with # are ignored.",
+)
+@click.option("--preferred_analysis_dir", default=None)
+@click.option(
+    "--max-workers",
+    default=None,
+    type=int,
+    help="Number of analyses run at the same time.",
+)
+def run(jobs, job_file=None, preferred_analysis_dir=None, max_workers=None):
+    """Several analyses of several variables at once
+
+    Each job is given as ``OPERATOR:VARNAME[,VARNAME...]``. The experiment
+    is set up once, variables stored in the same files are extracted in one
+    pass for each operator, and independent analyses run concurrently (see
+    ``EsmAnalysis.run``).
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis run fldmean:temp2,aprl,aprc ymonmean:temp2 climmean:temp2
+        $ esm_analysis run --file analyses.txt
+    """
+    items = list(jobs)
+    if job_file is not None:
+        for line in job_file:
+            if not line.lstrip().startswith("#"):
+                items.extend(line.split())
+    jobs = _parse_jobs(items)
+    if not jobs:
+        raise click.UsageError("No jobs given")
+    click.echo(
+        "This will run %s analyses of %s variables"
+        % (len(jobs), len({varname for _, varname in jobs}))
     )
-    analyzer.newest_climatology(varname)
+    _analyze("run", jobs, preferred_analysis_dir, max_workers=max_workers)
 
 
 @main.command()
-@click.argument("fname", type=click.Path(exists=True))
-def logfile_stats(fname):
-    log = Logfile.from_file(fname)
-    run_stats = log.run_stats()
-    print(tabulate.tabulate(run_stats, headers="keys", tablefmt="psql"))
+@click.argument("operator")
+@click.argument("varnames", nargs=-1, required=True)
+@click.option(
+    "--experiments",
+    "-e",
+    multiple=True,
+    required=True,
+    help="Analyse this experiment (a directory, or its ID, see esm_analysis "
+    "experiments), or all experiments in this directory. Can be given several "
+    "times.",
+)
+@click.option(
+    "--max-workers",
+    default=None,
+    type=int,
+    help="Number of experiments analysed at the same time.",
+)
+@click.option(
+    "--memory-limit",
+    default=None,
+    help="Maximum memory of each process, e.g. 8G.",
+)
+def batch(operator, varnames, experiments, max_workers=None, memory_limit=None):
+    """The same analysis of many experiments
+
+    Each experiment is analysed in a process of its own, several at a time
+    (see ``esm_analysis.batch``). A failing experiment does not stop the
+    others; the outcome of each is shown in a table at the end.
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis batch --experiments /work/ab0123/PMIP fldmean temp2
+        $ esm_analysis batch -e PI -e LGM --memory-limit 8G ymonmean temp2 aprl
+    """
+    import tabulate
+
+    from esm_analysis.batch import run_across_experiments, summary
+
+    if operator == "climmean":
+        # As the command of the same name:
+        operator = "newest_climatology"
+    try:
+        results = run_across_experiments(
+            experiments,
+            operator,
+            _varname(varnames),
+            max_workers=max_workers,
+            memory_limit=memory_limit,
+        )
+    except ValueError as error:
+        # An unknown operator or experiment, or a memory limit which is not
+        # a size:
+        raise click.UsageError(str(error))
+    if not results:
+        raise click.UsageError("No experiments found")
+    print(tabulate.tabulate(summary(results), headers="keys", tablefmt="psql"))
+    failed = [result for result in results if result.error is not None]
+    if failed:
+        raise click.ClickException(
+            "%s of %s experiments failed" % (len(failed), len(results))
+        )
+
+
+def _expand_logfiles(patterns):
+    """The files matching each of ``patterns``, which may contain wildcards"""
+    fnames = []
+    for pattern in patterns:
+        if any(character in pattern for character in "*?["):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                logging.warning("No logfiles match %s", pattern)
+            fnames.extend(matches)
+        elif os.path.isfile(pattern):
+            fnames.append(pattern)
+        else:
+            raise click.BadParameter("%s does not exist" % pattern, param_hint="FNAMES")
+    return fnames
+
+
+def _export(table, fname):
+    """Writes ``table`` to a CSV or Parquet file, depending on the extension"""
+    if fname.endswith(".csv"):
+        table.to_csv(fname)
+    else:
+        try:
+            table.to_parquet(fname)
+        except ImportError as error:
+            raise click.ClickException("Cannot write %s: %s" % (fname, error))
+
+
+@main.command()
+@click.argument("fnames", nargs=-1)
+@click.option(
+    "--experiments",
+    "-e",
+    multiple=True,
+    help="Use the logfiles of this experiment (a directory, or its ID), or of "
+    "all experiments in this directory. Can be given several times.",
+)
+@click.option(
+    "--sort-by",
+    default=None,
+    help="Sort the table by this statistic (or a part of its name, e.g. "
+    "efficiency).",
+)
+@click.option(
+    "--descending", default=False, is_flag=True, help="Sort in descending order."
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the table to this .csv or .parquet file.",
+)
+@click.option(
+    "--max-workers",
+    default=None,
+    type=int,
+    help="Number of processes to read the logfiles with.",
+)
+@click.option(
+    "--follow",
+    "-f",
+    default=False,
+    is_flag=True,
+    help="Keep reading the logfiles as they grow, and refresh the statistics.",
+)
+@click.option(
+    "--interval",
+    default=10.0,
+    show_default=True,
+    help="Seconds between refreshes with --follow.",
+)
+def logfile_stats(
+    fnames,
+    experiments=(),
+    sort_by=None,
+    descending=False,
+    output=None,
+    max_workers=None,
+    follow=False,
+    interval=10.0,
+):
+    """Run statistics of one or more experiment logfiles
+
+    The logfiles are given as file names (or patterns such as
+    ``*/scripts/*.log``), or found in the ``scripts`` directory of the
+    experiments given with ``--experiments``. They are read in parallel, and
+    the statistics of all of them are shown in one table.
+
+    With ``--follow``, only the lines appended to each logfile are parsed at
+    every refresh, so that many running experiments can be watched at once.
+    """
+    import tabulate
+
+    from esm_analysis.logfile import (
+        combine_run_stats,
+        find_logfiles,
+        read_logfiles,
+        run_statistic,
+    )
+
+    try:
+        found = find_logfiles(experiments)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="--experiments")
+    # Each logfile only once, in the order given:
+    fnames = list(dict.fromkeys(_expand_logfiles(fnames) + found))
+    if not fnames:
+        raise click.UsageError("No logfiles given or found")
+    if sort_by is not None:
+        try:
+            sort_by = run_statistic(sort_by)
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint="--sort-by")
+    if output is not None and not output.endswith((".csv", ".parquet")):
+        raise click.BadParameter("Use a .csv or .parquet file", param_hint="--output")
+    logs = dict(zip(fnames, read_logfiles(fnames, max_workers=max_workers)))
+    while True:
+        if follow:
+            click.clear()
+        if len(logs) == 1 and logs[fnames[0]] is not None:
+            table = logs[fnames[0]].run_stats()
+        else:
+            table = combine_run_stats(logs, sort_by=sort_by, ascending=not descending)
+        print(tabulate.tabulate(table, headers="keys", tablefmt="psql"))
+        if output is not None:
+            _export(table, output)
+        if not follow:
+            return
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            return
+        for log in logs.values():
+            if log is not None:
+                log.update()
+
+
+@main.group(name="experiments")
+def experiment_commands():
+    """Find experiments by ID, see ``esm_analysis.experiments``"""
+
+
+@experiment_commands.command(name="scan")
+@click.argument("roots", nargs=-1, required=True, type=click.Path(file_okay=False))
+@click.option(
+    "--max-workers",
+    default=None,
+    type=int,
+    help="Number of directories listed at the same time.",
+)
+def experiments_scan(roots, max_workers=None):
+    """Find the experiments below ROOTS and add them to the catalog
+
+    Experiments found in an earlier scan of ROOTS which are gone now are
+    removed from the catalog.
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis experiments scan /work/ab0123
+        $ esm_analysis batch -e PI -e LGM fldmean temp2
+    """
+    from esm_analysis.experiments import ExperimentCatalog
+
+    catalog = ExperimentCatalog()
+    try:
+        found = catalog.update(roots, max_workers=max_workers)
+    finally:
+        catalog.close()
+    click.echo("Found %s experiments, catalog: %s" % (len(found), catalog.db_path))
+
+
+@experiment_commands.command(name="list")
+@click.argument("exp_ids", nargs=-1)
+def experiments_list(exp_ids):
+    """Show the experiments in the catalog, or those called EXP_IDS"""
+    import tabulate
+
+    from esm_analysis.experiments import ExperimentCatalog
+
+    catalog = ExperimentCatalog()
+    try:
+        if exp_ids:
+            found = [e for exp_id in exp_ids for e in catalog.lookup(exp_id)]
+        else:
+            found = catalog.experiments()
+    finally:
+        catalog.close()
+    print(
+        tabulate.tabulate(
+            [
+                {
+                    "exp_id": experiment.exp_id,
+                    "components": ", ".join(experiment.components),
+                    "path": experiment.path,
+                }
+                for experiment in found
+            ],
+            headers="keys",
+            tablefmt="psql",
+        )
+    )
+
+
+@main.group(name="daemon")
+def daemon_commands():
+    """Keep experiments loaded between calls, see ``esm_analysis.daemon``"""
+
+
+@daemon_commands.command(name="start")
+@click.option("--socket", "socket_path", default=None, help="Socket to listen on.")
+@click.option(
+    "--max-workers",
+    default=None,
+    type=int,
+    help="Number of analyses run at the same time.",
+)
+@click.option(
+    "--detach",
+    default=False,
+    is_flag=True,
+    help="Run in the background, instead of until Ctrl-C.",
+)
+@click.option(
+    "--log-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Where the output of a detached daemon goes.",
+)
+def daemon_start(socket_path=None, max_workers=None, detach=False, log_file=None):
+    """Start the analysis daemon
+
+    Examples
+    --------
+
+    ..code ::
+
+        $ esm_analysis daemon start --detach --log-file ~/esm_analysis_daemon.log
+        $ esm_analysis fldmean temp2
+    """
+    try:
+        if detach:
+            pid = daemon.start(
+                socket_path=socket_path, max_workers=max_workers, log_file=log_file
+            )
+            click.echo("Analysis daemon %s started" % pid)
+            return
+        if not logging.getLogger().handlers:
+            logging.basicConfig(
+                level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+            )
+        server = daemon.AnalysisDaemon(socket_path=socket_path, max_workers=max_workers)
+        server.bind()
+    except (OSError, daemon.DaemonError) as error:
+        raise click.ClickException(str(error))
+    click.echo("Listening on %s, stop with Ctrl-C" % server.socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@daemon_commands.command(name="stop")
+@click.option("--socket", "socket_path", default=None, help="Socket of the daemon.")
+def daemon_stop(socket_path=None):
+    """Stop the analysis daemon"""
+    try:
+        daemon.request("shutdown", socket_path=socket_path)
+    except (OSError, daemon.DaemonError):
+        raise click.ClickException("No analysis daemon is running")
+    click.echo("Analysis daemon stopped")
+
+
+@daemon_commands.command(name="status")
+@click.option("--socket", "socket_path", default=None, help="Socket of the daemon.")
+def daemon_status(socket_path=None):
+    """Show whether the analysis daemon runs, and what it has loaded"""
+    try:
+        status = daemon.request("status", socket_path=socket_path, timeout=5)
+    except (OSError, daemon.DaemonError):
+        raise click.ClickException("No analysis daemon is running")
+    click.echo(
+        "Analysis daemon %(pid)s on %(socket)s, up for %(uptime).0f s, "
+        "%(max_workers)s workers" % status
+    )
+    for exp_base in status["experiments"]:
+        click.echo("  " + exp_base)
 
 
 if __name__ == "__main__":
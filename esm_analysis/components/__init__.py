@@ -6,7 +6,20 @@
 # @Last modified time: 2020-02-10T11:55:02+01:00
 """
 Specific implementations for the various components each get their own submodule
+
+The submodules are only imported when their analysis class is first used, so
+that e.g. an ECHAM analysis does not need the FESOM dependencies.
 """
 
-from .echam import EchamAnalysis
-from .fesom import FesomAnalysis
+import importlib
+
+_SUBMODULES = {"EchamAnalysis": "echam", "FesomAnalysis": "fesom"}
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        module = importlib.import_module("." + _SUBMODULES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
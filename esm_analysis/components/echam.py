@@ -1,12 +1,24 @@
 """ Analysis Class for ECHAM """
 
-import glob
+import collections
+import itertools
+import json
 import logging
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import xarray as xr
 
+from .. import profiling
+from ..catalog import parse_date_from_filename
 from ..esm_analysis import EsmAnalysis
+from ..result_cache import cache_key, detach
+from ..xarray_engine import check_variables
+
+CDO_OPTIONS = "-f nc -t echam6"
+"""Options used for all CDO calls on ECHAM6 output"""
 
 # FIXME: move this somewhere else:
 def chunks(lst, n):
@@ -15,6 +27,95 @@ def chunks(lst, n):
         yield lst[i : i + n]
 
 
+def year_chunks(lst, n):
+    """
+    Yield successive chunks of at most n files from lst, without splitting the
+    files of one year (as given by their names) across chunks. A single year
+    with more than n files is kept together in one chunk.
+    """
+    chunk = []
+    for _, year_files in itertools.groupby(lst, key=_year):
+        year_files = list(year_files)
+        if chunk and len(chunk) + len(year_files) > n:
+            yield chunk
+            chunk = []
+        chunk.extend(year_files)
+    if chunk:
+        yield chunk
+
+
+# Operators over groups of time steps (all of them, each calendar month or
+# each season), and the operator summing over the same groups. In chunks of
+# files, the sums of each chunk are summed again by group, so a chunk need not
+# cover every group: the mean is the sum divided by the number of time steps,
+# the standard deviation follows from the sums of the values and their squares.
+_GROUP_SUMS = {
+    "timmean": "timsum",
+    "ymonmean": "ymonsum",
+    "yseasmean": "yseassum",
+    "timstd": "timsum",
+    "ymonstd": "ymonsum",
+    "yseasstd": "yseassum",
+}
+
+
+REDUCTIONS = ["fldmean", "yearmean", "ymonmean", "yseasmean", "timmean"]
+"""The reductions computed by ``EchamAnalysis.reductions`` by default"""
+
+
+# Each worker process of the chunk pool gets its own CDO:
+_WORKER_CDO = None
+
+
+def _init_chunk_worker(cdo_threads):
+    global _WORKER_CDO
+    import cdo
+
+    os.environ["OMP_NUM_THREADS"] = str(cdo_threads)
+    _WORKER_CDO = cdo.Cdo()
+
+
+def _reduce_chunk(operator, varname, files, options, output):
+    logging.debug(
+        "Running %s on %s from %s files into %s", operator, varname, len(files), output
+    )
+    select = "-select,name=" + varname + " " + " ".join(files)
+    if operator is None:
+        _WORKER_CDO.select(
+            "name=" + varname, options=options, input=files, output=output
+        )
+    else:
+        getattr(_WORKER_CDO, operator)(options=options, input=select, output=output)
+    return output
+
+
+def _sum_chunk(operator, varname, files, options, output):
+    """
+    The sum of ``varname`` over each time group of ``operator`` (e.g. each
+    calendar month for ``ymonmean``) into ``output``, and the number of
+    (valid) time steps in each group into ``<output>_count.nc``; for a
+    standard deviation, also the sum of the squares into
+    ``<output>_squares.nc``. All are chained to the selection, so that the
+    selected data is never written.
+    """
+    logging.debug(
+        "Summing %s for %s from %s files into %s", varname, operator, len(files), output
+    )
+    select = "-select,name=" + varname + " " + " ".join(files)
+    count = output[: -len(".nc")] + "_count.nc"
+    group_sum = getattr(_WORKER_CDO, _GROUP_SUMS[operator])
+    # In double precision, since the sums are combined later:
+    options += " -b F64"
+    group_sum(options=options, input=select, output=output)
+    # Missing values stay missing, and are not counted:
+    group_sum(options=options, input="-addc,1 -mulc,0 " + select, output=count)
+    if not operator.endswith("std"):
+        return output, count
+    squares = output[: -len(".nc")] + "_squares.nc"
+    group_sum(options=options, input="-sqr " + select, output=squares)
+    return output, count, squares
+
+
 class EchamAnalysis(EsmAnalysis):
     """
     Analysis of ECHAM6 simulations
@@ -26,6 +127,10 @@ class EchamAnalysis(EsmAnalysis):
     NAME = "echam6"
     DOMAIN = "atmosphere"
 
+    CHUNK_SIZE = 1000
+    """File lists longer than this are processed in chunks"""
+
+    @profiling.timed
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -40,6 +145,7 @@ class EchamAnalysis(EsmAnalysis):
 
     ################################################################################
     # Special Analyses
+    @profiling.timed
     def newest_climatology(self, varname, number_of_years=30):
         """
         Generates a climatological average (time mean) for a specific variable
@@ -65,245 +171,577 @@ class EchamAnalysis(EsmAnalysis):
         for f in required_files:
             logging.debug("- %s", f)
         logging.debug("Starting CDO")
-        return self.CDO.timmean(
-            options="-v -f nc -t echam6",
-            input="-select,name=" + varname + " " + " ".join(required_files),
-            output=self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_climmean.nc",
-            returnXDataset=True,
-        )
+        output = self._analysis_file(varname, "climmean")
 
-    ################################################################################
-    # Spatial Averages:
-    def fldmean(self, varname, file_list):
-        if not os.path.isfile(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_fldmean.nc"
-        ):
-            if len(file_list) > 1000:
-                print("Processing chunks...")
-                tmp_list = []
-                for files in chunks(file_list, 1000):
-                    print("These files are next:")
-                    for f in files:
-                        print(f)
-                    tmp_chunk = self.CDO.select(
-                        "name=" + varname, options="-f nc -t echam6", input=files
-                    )
-                    tmp_list.append(tmp_chunk)
-                tmp = self.CDO.cat(input=" ".join(tmp_list))
-            else:
-                tmp = self.CDO.select(
-                    "name=" + varname, options="-f nc -t echam6", input=file_list
+        def compute():
+            if self.python_engine is not None:
+                return self.python_engine.reduce(
+                    "timmean", [varname], required_files, output
                 )
-            logging.info("Finished with generation of 'tmp' file for fldmean")
-            self.CDO.fldmean(
-                input=tmp,
-                output=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_fldmean.nc",
+            return self.CDO.timmean(
+                options="-v " + CDO_OPTIONS,
+                input="-select,name=" + varname + " " + " ".join(required_files),
+                output=output,
             )
-        return (
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_fldmean.nc"
+
+        self._cached(
+            ["timmean", "select,name=" + varname],
+            varname,
+            required_files,
+            output,
+            compute,
+            options=self._cache_options,
         )
+        return xr.open_dataset(output)
 
     ################################################################################
-    # Temporal Averages
-    def yearmean(self, varname, file_list):
-        if not os.path.isfile(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_yearmean.nc"
+    # Helpers
+    @property
+    def _cache_options(self):
+        """The options which go into the cache key of a result"""
+        if self.python_engine is not None:
+            return "engine=" + self.ENGINE
+        return CDO_OPTIONS
+
+    @profiling.timed
+    def _select_and_reduce(self, operator, varname, file_list, output, **kwargs):
+        """
+        Applies the CDO ``operator`` to ``varname`` selected from ``file_list``
+
+        The selection and reduction are chained into a single CDO call
+        (``-operator -select,name=varname files...``), so the selected raw
+        data is never written to disk.
+
+        Lists with more than ``CHUNK_SIZE`` files are processed in chunks of
+        whole years, see ``_reduce_chunks``. For ``fldmean`` and ``yearmean``,
+        each chunk is reduced and the chunk results are concatenated. For
+        the means and standard deviations over time (``timmean``,
+        ``ymonmean``, ``yseasmean``, ``ymonstd`` etc.), the sum and the number
+        of time steps of each month/season (and the sum of the squares) are
+        computed for each chunk, and summed up over all chunks by
+        month/season. The mean is the total sum divided by the total number
+        of time steps, which is the same as the mean over all files, also if
+        the files hold different numbers of time steps or a chunk misses some
+        months (e.g. an incomplete last year). Only these reduced
+        intermediates are written. Other operators are run on all files at
+        once.
+
+        With the xarray or streaming engines, the files are not chunked here;
+        these engines deal with large inputs by themselves.
+        """
+        if self.python_engine is not None:
+            return self.python_engine.reduce(
+                operator, varname.split(","), file_list, output
+            )
+        if len(file_list) <= self.CHUNK_SIZE or not (
+            operator in ("fldmean", "yearmean") or operator in _GROUP_SUMS
         ):
-            if len(file_list) > 1000:
-                print("Processing chunks...")
-                tmp_list = []
-                for files in chunks(file_list, 1000):
-                    print("These files are next:")
-                    for f in files:
-                        print(f)
-                    tmp_chunk = self.CDO.select(
-                        "name=" + varname, options="-f nc -t echam6", input=files
-                    )
-                    tmp_list.append(tmp_chunk)
-                tmp = self.CDO.cat(input=" ".join(tmp_list))
-            else:
-                tmp = self.CDO.select(
-                    "name=" + varname, options="-f nc -t echam6", input=file_list
+            return getattr(self.CDO, operator)(
+                options=CDO_OPTIONS,
+                input="-select,name=" + varname + " " + " ".join(file_list),
+                output=output,
+                **kwargs
+            )
+        print("Processing chunks...")
+        file_chunks = list(year_chunks(file_list, self.CHUNK_SIZE))
+        chunk_dir = tempfile.mkdtemp(prefix="esm_analysis_chunks_")
+        try:
+            if operator in ("fldmean", "yearmean"):
+                tmp_list = self._reduce_chunks(
+                    operator, varname, file_chunks, chunk_dir
+                )
+                logging.info("Finished with chunks for %s", operator)
+                return self.CDO.cat(
+                    options="-f nc", input=" ".join(tmp_list), output=output, **kwargs
+                )
+            parts = zip(
+                *self._reduce_chunks(
+                    operator, varname, file_chunks, chunk_dir, worker=_sum_chunk
+                )
+            )
+            logging.info("Finished with chunks for %s", operator)
+            group_sum = getattr(self.CDO, _GROUP_SUMS[operator])
+            totals = [
+                group_sum(
+                    options="-f nc -b F64",
+                    input="-cat " + " ".join(chunk_parts),
+                    output=os.path.join(chunk_dir, name + ".nc"),
+                )
+                for name, chunk_parts in zip(("sum", "count", "squares"), parts)
+            ]
+            if not operator.endswith("std"):
+                return self.CDO.div(
+                    options="-f nc", input=" ".join(totals), output=output, **kwargs
                 )
-            logging.info("Finished with generation of 'tmp' file for yearmean")
-            self.CDO.yearmean(
-                input=tmp,
-                output=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_yearmean.nc",
+            total, count, squares = totals
+            mean = self.CDO.div(
+                options="-f nc -b F64",
+                input=total + " " + count,
+                output=os.path.join(chunk_dir, "mean.nc"),
             )
-        return (
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_yearmean.nc"
+            # The variance is the mean of the squares minus the squared mean,
+            # which may come out slightly negative by rounding:
+            return self.CDO.sqrt(
+                options="-f nc",
+                input="-abs -sub -div %s %s -sqr %s" % (squares, count, mean),
+                output=output,
+                **kwargs
+            )
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    @profiling.timed
+    def _reduce_chunks(
+        self, operator, varname, file_chunks, chunk_dir, worker=_reduce_chunk
+    ):
+        """
+        Runs ``operator`` on ``varname`` for each chunk of files in a pool of
+        processes. If ``operator`` is ``None``, the variable is only selected.
+
+        The number of worker processes is ``MAX_WORKERS`` (at most one per
+        chunk), each running CDO with ``CDO_THREADS`` threads.
+
+        Parameters
+        ----------
+        operator, varname : str
+        file_chunks : list of list
+        chunk_dir : str
+            Where the chunk results are written
+        worker : callable
+            What is done with each chunk, ``_reduce_chunk`` or ``_sum_chunk``
+
+        Returns
+        -------
+        list
+            The chunk results in ``chunk_dir`` (as returned by ``worker``),
+            in the same order as ``file_chunks``
+        """
+        options = CDO_OPTIONS
+        if self.CDO_THREADS > 1:
+            options += " -P %s" % self.CDO_THREADS
+        outputs = [
+            os.path.join(chunk_dir, "chunk_%05d.nc" % index)
+            for index in range(len(file_chunks))
+        ]
+        workers = min(self.MAX_WORKERS, len(file_chunks))
+        logging.info(
+            "Running %s on %s in %s chunks with %s workers",
+            operator or "select",
+            varname,
+            len(file_chunks),
+            workers,
         )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_chunk_worker,
+            initargs=(self.CDO_THREADS,),
+        ) as pool:
+            futures = [
+                pool.submit(worker, operator, varname, files, options, output)
+                for files, output in zip(file_chunks, outputs)
+            ]
+            return [future.result() for future in futures]
 
-    def ymonmean(self, varname, file_list):
-        if not os.path.isfile(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_ymonmean.nc"
-        ):
-            tmp = self.CDO.select(
-                "name=" + varname, options="-f nc -t echam6", input=file_list
+    @profiling.timed
+    def _reduce(self, operator, varname, file_list):
+        """
+        Applies ``operator`` to ``varname`` from ``file_list``, using the
+        result cache. Returns the output file.
+
+        If ``varname`` is a list of variable names, see ``_reduce_many``.
+        """
+        if not isinstance(varname, str):
+            return self._reduce_many(operator, varname, file_list)
+        output = self._analysis_file(varname, operator)
+        return self._cached(
+            [operator, "select,name=" + varname],
+            varname,
+            file_list,
+            output,
+            lambda: self._select_and_reduce(operator, varname, file_list, output),
+            options=self._cache_options,
+        )
+
+    @profiling.timed
+    def _reduce_many(self, operator, varnames, file_list):
+        """
+        Applies ``operator`` to several variables from the same files in one
+        pass.
+
+        All variables which are not in the result cache yet are selected
+        together (``-select,name=a,b,c``), reduced, and the result is split
+        into one file per variable with ``splitname``. Each file ends up in
+        its usual place, and in the result cache under the same key as if the
+        variable had been processed on its own.
+
+        Returns
+        -------
+        dict
+            The output file of each variable
+        """
+        outputs, keys, missing = {}, {}, []
+        for varname in varnames:
+            outputs[varname] = self._analysis_file(varname, operator)
+            keys[varname] = cache_key(
+                [operator, "select,name=" + varname],
+                varname,
+                self._cache_options,
+                file_list,
+            )
+            if not self.result_cache.fetch(keys[varname], outputs[varname]):
+                missing.append(varname)
+        if len(missing) == 1:
+            detach(outputs[missing[0]])
+            self._select_and_reduce(
+                operator, missing[0], file_list, outputs[missing[0]]
             )
-            logging.info("Finished with generation of 'tmp' file for ymonmean")
-            self.CDO.ymonmean(
-                input=tmp,
-                output=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_ymonmean.nc",
+        elif missing:
+            logging.info("Running %s on %s in one pass", operator, ", ".join(missing))
+            split_dir = tempfile.mkdtemp(
+                prefix=".esm_analysis_split_", dir=self.ANALYSIS_DIR
+            )
+            try:
+                combined = self._select_and_reduce(
+                    operator,
+                    ",".join(missing),
+                    file_list,
+                    os.path.join(split_dir, "combined.nc"),
+                )
+                self._split(combined, {name: outputs[name] for name in missing})
+            finally:
+                shutil.rmtree(split_dir, ignore_errors=True)
+        for varname in missing:
+            self.result_cache.store(
+                keys[varname],
+                outputs[varname],
+                description=" ".join(
+                    [operator, "select,name=" + varname, self._cache_options]
+                ),
             )
-        return (
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_ymonmean.nc"
+        return outputs
+
+    @profiling.timed
+    def _split(self, combined, outputs):
+        """
+        Moves the variables in ``combined`` into one file each.
+
+        Parameters
+        ----------
+        combined : str
+            A file containing all variables in ``outputs``; it is consumed.
+        outputs : dict
+            The output file of each variable
+
+        Raises
+        ------
+        ValueError
+            If a variable is not in ``combined``, i.e. was not found in the
+            input files. No output is written then.
+        """
+        if len(outputs) == 1:
+            os.replace(combined, list(outputs.values())[0])
+            return
+        if self.python_engine is not None:
+            self.python_engine.split(combined, outputs)
+            return
+        prefix = combined + "_"
+        self.CDO.splitname(options="-f nc", input=combined, output=prefix)
+        # splitname names each file after its variable:
+        split = {varname: prefix + varname + ".nc" for varname in outputs}
+        check_variables(
+            outputs,
+            [varname for varname, fname in split.items() if os.path.isfile(fname)],
+            "the input files",
         )
+        for varname, output in outputs.items():
+            os.replace(split[varname], output)
+        os.remove(combined)
 
-    def timmean(self, varname, file_list):
-        if not os.path.isfile(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_timmean.nc"
-        ):
-            tmp = self.CDO.select(
-                "name=" + varname, options="-f nc -t echam6", input=file_list
+    @profiling.timed
+    def _select(self, varname, file_list, output):
+        """
+        Selects ``varname`` (or several, comma separated) from ``file_list``
+        into ``output``, in chunks if there are more than ``CHUNK_SIZE``
+        files.
+        """
+        if len(file_list) <= self.CHUNK_SIZE:
+            return self.CDO.select(
+                "name=" + varname, options=CDO_OPTIONS, input=file_list, output=output
             )
-            logging.info("Finished with generation of 'tmp' file for timmean")
-            self.CDO.timmean(
-                input=tmp,
-                output=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_timmean.nc",
+        print("Processing chunks...")
+        chunk_dir = tempfile.mkdtemp(prefix="esm_analysis_chunks_")
+        try:
+            tmp_list = self._reduce_chunks(
+                None,
+                varname,
+                list(year_chunks(file_list, self.CHUNK_SIZE)),
+                chunk_dir,
             )
-        return (
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_timmean.nc"
-        )
+            return self.CDO.cat(
+                options="-f nc", input=" ".join(tmp_list), output=output
+            )
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
 
-    def yseasmean(self, varname, file_list):
-        if not os.path.isfile(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_yseasmean.nc"
-        ):
-            if len(file_list) > 1000:
-                print("Processing chunks...")
-                tmp_list = []
-                for files in chunks(file_list, 1000):
-                    print("These files are next:")
-                    for f in files:
-                        print(f)
-                    tmp_chunk = self.CDO.select(
-                        "name=" + varname, options="-f nc -t echam6", input=files
-                    )
-                    tmp_list.append(tmp_chunk)
-                tmp = self.CDO.cat(input=" ".join(tmp_list))
-            else:
-                tmp = self.CDO.select(
-                    "name=" + varname, options="-f nc -t echam6", input=file_list
+    @profiling.timed
+    def reductions(self, varname, file_list, operators=REDUCTIONS):
+        """
+        Several reductions of ``varname`` from a single read of ``file_list``
+
+        The variable is selected from the model output only once, into a
+        temporary file in the analysis directory. All ``operators`` which
+        are not in the result cache yet are then applied to this much smaller
+        file, which is removed right afterwards, and each result is written to
+        its usual place (``<EXP_ID>_echam6_<varname>_<operator>.nc``) and put
+        into the result cache, under the same key as if the operator had been
+        run on its own.
+
+        Parameters
+        ----------
+        varname : str or list
+            A variable name, or a list of variable names which are all
+            contained in ``file_list``; these are then selected together.
+        file_list : list
+            The files to use
+        operators : list of str
+            Any of ``fldmean``, ``yearmean``, ``ymonmean``, ``ymonstd``,
+            ``yseasmean`` and ``timmean``
+
+        Returns
+        -------
+        dict
+            The output file of each operator. For a list of variables, a
+            dictionary of these for each variable.
+        """
+        varnames = [varname] if isinstance(varname, str) else list(varname)
+        outputs = {name: {} for name in varnames}
+        keys, missing = {}, collections.OrderedDict()
+        for operator in operators:
+            for name in varnames:
+                output = outputs[name][operator] = self._analysis_file(name, operator)
+                keys[name, operator] = cache_key(
+                    [operator, "select,name=" + name],
+                    name,
+                    self._cache_options,
+                    file_list,
                 )
-            logging.info("Finished with generation of 'tmp' file for yseasmean")
-            return self.CDO.yseasmean(
-                input=tmp,
-                output=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_yseasmean.nc",
-                returnXDataset=True,
+                if not self.result_cache.fetch(keys[name, operator], output):
+                    missing.setdefault(operator, []).append(name)
+        selected_names = [
+            name for name in varnames if any(name in m for m in missing.values())
+        ]
+        if missing:
+            logging.info(
+                "Running %s on %s from one read of %s files",
+                ", ".join(missing),
+                ", ".join(selected_names),
+                len(file_list),
+            )
+            # On the same file system as the outputs, so that the results
+            # can be moved there:
+            work_dir = tempfile.mkdtemp(
+                prefix=".esm_analysis_reductions_", dir=self.ANALYSIS_DIR
+            )
+            try:
+                results = {op: os.path.join(work_dir, op + ".nc") for op in missing}
+                if self.python_engine is not None:
+                    # The Python engines compute all operators from one read:
+                    self.python_engine.reductions(
+                        list(missing), selected_names, file_list, results
+                    )
+                else:
+                    selected = self._select(
+                        ",".join(selected_names),
+                        file_list,
+                        os.path.join(work_dir, "selected.nc"),
+                    )
+                    for operator, names in missing.items():
+                        source = selected
+                        if names != selected_names:
+                            source = "-select,name=" + ",".join(names) + " " + selected
+                        getattr(self.CDO, operator)(
+                            options="-f nc", input=source, output=results[operator]
+                        )
+                    # Only needed for the operators, and as large as the
+                    # selected variables of all files:
+                    os.remove(selected)
+                for operator, names in missing.items():
+                    self._split(
+                        results[operator],
+                        {name: outputs[name][operator] for name in names},
+                    )
+                    for name in names:
+                        self.result_cache.store(
+                            keys[name, operator],
+                            outputs[name][operator],
+                            description=" ".join(
+                                [operator, "select,name=" + name, self._cache_options]
+                            ),
+                        )
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        if isinstance(varname, str):
+            return outputs[varname]
+        return outputs
+
+    @profiling.timed
+    def _incremental(self, operator, varname, file_list):
+        """
+        Brings the output of a time series ``operator`` up to date.
+
+        The input files (with their size and modification time) which went
+        into an output file are recorded next to it, in
+        ``<output>.inputs.json``. On the next call, only files which are new
+        are processed, and the result is merged into the existing output
+        along the time axis. For ``yearmean``, all files of any year touched
+        by new files are processed again, and these years are replaced in the
+        existing output.
+
+        If recorded files were changed or removed, or there is no record yet,
+        everything is processed from scratch.
+
+        The result is also put into the result cache. For a list of variable
+        names, each variable is brought up to date on its own, and a
+        dictionary of output files is returned.
+        """
+        if not isinstance(varname, str):
+            return {
+                name: self._incremental(operator, name, file_list) for name in varname
+            }
+        output = self._analysis_file(varname, operator)
+        record_file = output + ".inputs.json"
+        current = {f: _file_signature(f) for f in file_list}
+        key = cache_key(
+            [operator, "select,name=" + varname],
+            varname,
+            self._cache_options,
+            file_list,
+        )
+        if self.result_cache.fetch(key, output):
+            with open(record_file, "w") as f:
+                json.dump({"inputs": current}, f)
+            return output
+        recorded = None
+        if os.path.isfile(output) and os.path.isfile(record_file):
+            with open(record_file) as f:
+                recorded = {k: tuple(v) for k, v in json.load(f)["inputs"].items()}
+        new_files = [f for f in file_list if f not in (recorded or {})]
+        years = sorted({_year(f) for f in new_files})
+        # The output is never written in place, since it may be a hard link
+        # to a result in the result cache:
+        tmp_output = output + ".tmp"
+        if (
+            recorded is None
+            or any(current.get(f) != signature for f, signature in recorded.items())
+            # yearmean: nothing would be left of the existing output
+            or (operator == "yearmean" and {_year(f) for f in recorded} <= set(years))
+        ):
+            logging.info("Processing all files for %s of %s", operator, varname)
+            self._select_and_reduce(operator, varname, file_list, tmp_output)
+            os.replace(tmp_output, output)
+        elif new_files:
+            logging.info(
+                "Appending %s new files to %s of %s", len(new_files), operator, varname
             )
-        return xr.open_dataset(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_yseasmean.nc"
+            existing = output
+            if operator == "yearmean":
+                new_files = [f for f in file_list if _year(f) in years]
+                existing = (
+                    "-delete,year="
+                    + ",".join(str(year) for year in years)
+                    + " "
+                    + output
+                )
+            with tempfile.TemporaryDirectory(
+                prefix=".esm_analysis_incremental_", dir=self.ANALYSIS_DIR
+            ) as work_dir:
+                new_part = self._select_and_reduce(
+                    operator, varname, new_files, os.path.join(work_dir, "new.nc")
+                )
+                if self.python_engine is not None:
+                    self.python_engine.mergetime(
+                        output,
+                        new_part,
+                        tmp_output,
+                        drop_years=years if operator == "yearmean" else None,
+                    )
+                else:
+                    self.CDO.mergetime(
+                        input=existing + " " + new_part, output=tmp_output
+                    )
+            os.replace(tmp_output, output)
+        else:
+            logging.info("%s of %s is up to date", operator, varname)
+        with open(record_file, "w") as f:
+            json.dump({"inputs": current}, f)
+        self.result_cache.store(
+            key, output, description=operator + " select,name=" + varname
         )
+        return output
+
+    ################################################################################
+    # Spatial Averages:
+    def fldmean(self, varname, file_list, incremental=False):
+        """
+        Field mean of ``varname``
+
+        Parameters
+        ----------
+        varname : str or list
+            A variable name, or a list of variable names which are all
+            contained in ``file_list``. These are extracted in one pass, and a
+            dictionary of output files is returned.
+        file_list : list
+            The files to use
+        incremental : bool
+            If ``True``, only files which are new since the last call are
+            processed and appended to the existing output. Otherwise, the
+            result is taken from the result cache if the input files did not
+            change, or computed from scratch.
+        """
+        if incremental:
+            return self._incremental("fldmean", varname, file_list)
+        return self._reduce("fldmean", varname, file_list)
+
+    ################################################################################
+    # Temporal Averages
+    def yearmean(self, varname, file_list, incremental=False):
+        """
+        Yearly mean of ``varname``, see ``fldmean`` for the parameters.
+        """
+        if incremental:
+            return self._incremental("yearmean", varname, file_list)
+        return self._reduce("yearmean", varname, file_list)
+
+    def ymonmean(self, varname, file_list):
+        return self._reduce("ymonmean", varname, file_list)
+
+    def timmean(self, varname, file_list):
+        return self._reduce("timmean", varname, file_list)
+
+    ################################################################################
+    # Temporal Variability
+    def ymonstd(self, varname, file_list):
+        """
+        Standard deviation of each calendar month of ``varname`` (normalized
+        by n, like ``cdo ymonstd``). With the streaming engine, this is
+        computed together with ``ymonmean`` at no extra cost, see
+        ``reductions``.
+        """
+        return self._reduce("ymonstd", varname, file_list)
+
+    def yseasmean(self, varname, file_list):
+        output = self._reduce("yseasmean", varname, file_list)
+        if isinstance(output, dict):
+            return {name: xr.open_dataset(path) for name, path in output.items()}
+        return xr.open_dataset(output)
+
+
+def _file_signature(fname):
+    stat = os.stat(fname)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _year(fname):
+    date = parse_date_from_filename(fname)
+    return None if date is None else date // 10000
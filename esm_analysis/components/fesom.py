@@ -11,15 +11,19 @@
 import logging
 import os
 
-import pyfesom as pf
-import f90nml
 import xarray as xr
 
 
+from .. import profiling
 from ..esm_analysis import EsmAnalysis
-from ..scripts.analysis_scripts.fesom import ANALYSIS_fesom_sfc_timmean
+from ..mesh_cache import MeshCache
+from ..streaming import StreamingEngine
+from ..streams import StreamIndex
+from .. import unstructured
 
-twodim_fesom_analysis = ANALYSIS_fesom_sfc_timmean.MainProgram
+# pyfesom, f90nml and the FESOM analysis scripts are only imported when they
+# are first needed, see ``MESH``, ``LEVELWISE_OUTPUT`` and
+# ``_run_analysis_script``.
 
 
 class FesomAnalysis(EsmAnalysis):
@@ -32,10 +36,15 @@ class FesomAnalysis(EsmAnalysis):
 
     NAME = "fesom"
     DOMAIN = "ocean"
+    # The analysis scripts and ``fldmean`` read netCDF files in this process:
+    THREAD_SAFE = False
 
     def test_meth(self):
+        from ..scripts.analysis_scripts.fesom import ANALYSIS_fesom_sfc_timmean
+
         print(ANALYSIS_fesom_sfc_timmean)
 
+    @profiling.timed
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -48,6 +57,20 @@ class FesomAnalysis(EsmAnalysis):
 
         self._config = self._config.get("fesom", {})
 
+        self.MESH_ROTATED = self._config.get("mesh_rotated", False)
+        self.NAMING_CONVENTION = self._config.get("naming_convention", "esm_new")
+
+        self._variables = self.determine_variable_dict_from_outdata_contents()
+
+        # The mesh and namelist are expensive to read, and not needed just to
+        # figure out which variables are available. They are loaded on first
+        # use, see the MESH and LEVELWISE_OUTPUT properties:
+        self._mesh = None
+        self._levelwise_output = None
+
+    @property
+    def MESH_DIR(self):
+        """The mesh directory, as given in the runscript"""
         runscript_file = [f for f in os.listdir(self.SCRIPT_DIR) if f.endswith("run")][
             0
         ]
@@ -55,47 +78,54 @@ class FesomAnalysis(EsmAnalysis):
             mesh_dir = [l.strip() for l in runscript.readlines() if "MESH_DIR" in l][
                 0
             ].split("=")[-1]
+        return mesh_dir
 
-        namelist_config = f90nml.read(self.CONFIG_DIR + "/namelist.config")
-        self.LEVELWISE_OUTPUT = namelist_config["inout"]["levelwise_output"]
-        self.MESH_ROTATED = self._config.get("mesh_rotated", False)
-        self.NAMING_CONVENTION = self._config.get("naming_convention", "esm_new")
+    @property
+    def LEVELWISE_OUTPUT(self):
+        """Whether 3D output is levelwise, as given in ``namelist.config``"""
+        if self._levelwise_output is None:
+            import f90nml
 
-        self._variables = self.determine_variable_dict_from_outdata_contents()
-        abg = [0, 0, 0] if self.MESH_ROTATED else [50, 15, -90]
-        self.MESH = pf.load_mesh(mesh_dir, usepickle=False, get3d=False, abg=abg)
+            namelist_config = f90nml.read(self.CONFIG_DIR + "/namelist.config")
+            self._levelwise_output = namelist_config["inout"]["levelwise_output"]
+        return self._levelwise_output
 
-    def _var_dict_esm_new(self):
-        all_outdata_variables = [
-            f.replace(self.EXP_ID + "_", "").split("fesom_")[1].replace(".nc", "")
-            for f in os.listdir(self.OUTDATA_DIR)
-            if f.startswith(self.EXP_ID)
-        ]
+    @property
+    @profiling.timed
+    def MESH(self):
+        """
+        The mesh, loaded on first use.
 
-        ret_variables = {}
-        variables = {
-            "".join(r"\d" if c.isdigit() else c for c in file_stream)
-            for file_stream in all_outdata_variables
-        }
-        just_variables = {
-            "".join("" if c.isdigit() else c for c in file_stream)[:-1]
-            for file_stream in all_outdata_variables
-        }
-
-        for just_variable, variable_pattern in zip(just_variables, variables):
-            file_pattern = (
-                self.OUTDATA_DIR
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + variable_pattern
-                + ".*nc"
+        The mesh arrays are memory-mapped from a ``MeshCache``, which is
+        filled with ``pyfesom.load_mesh`` if needed. The cache directory can
+        be set with ``mesh_cache_dir`` in the ``fesom`` section of
+        ``.top_of_exp_tree``, or with the environment variable
+        ``ESM_ANALYSIS_MESH_CACHE``.
+        """
+        if self._mesh is None:
+            import pyfesom as pf
+
+            mesh_dir = self.MESH_DIR
+            abg = [0, 0, 0] if self.MESH_ROTATED else [50, 15, -90]
+            self._mesh = MeshCache(self._config.get("mesh_cache_dir")).load(
+                mesh_dir,
+                abg,
+                lambda: pf.load_mesh(mesh_dir, usepickle=False, get3d=False, abg=abg),
             )
-            ret_variables[file_pattern] = {}
-            ret_variables[file_pattern][just_variable] = {"short_name": just_variable}
+        return self._mesh
+
+    def _var_dict_esm_new(self):
+        # Each variable is a stream of its own, e.g. EXP_fesom_sst_18500101.nc:
+        streams = StreamIndex(self.OUTDATA_DIR, self.EXP_ID)
+        ret_variables = {}
+        for stream in streams.with_extension(".nc"):
+            parsed = streams.first(stream)
+            if parsed.component != self.NAME:
+                continue
+            ret_variables[stream] = {parsed.stream: {"short_name": parsed.stream}}
         return ret_variables
 
+    @profiling.timed
     def determine_variable_dict_from_outdata_contents(self):
         # FIXME: File patterns are inconsistent, this is a "bad feature" in
         # esm-runscripts:fesom_post_processing.
@@ -104,109 +134,179 @@ class FesomAnalysis(EsmAnalysis):
         # and ask for it if not there.
         return getattr(self, "_var_dict_" + self.NAMING_CONVENTION)()
 
-    def newest_climatology(self, varname):
+    @profiling.timed
+    def _run_analysis_script(self, operator, varname, flist=None, **kwargs):
+        """
+        Runs the FESOM analysis script for ``varname``, using the result cache.
+
+        Parameters
+        ----------
+        operator : str
+            Used for the output file name and the cache key
+        varname : str
+        flist : list, optional
+            The input files. Only used for the cache key, since the script
+            finds the files by itself in ``OUTDATA_DIR``. If not given, they
+            are looked up.
+        **kwargs
+            Passed on to the analysis script, e.g. ``timintv="season"``
+
+        Returns
+        -------
+        xr.Dataset
+        """
         logging.debug("This method is trying to work on: %s", varname)
-        try:
-            p = twodim_fesom_analysis(
-                varname,
-                self.OUTDATA_DIR,
-                output_file=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_climmean.nc",
-                mesh=self.MESH,
-                levelwise_output=self.LEVELWISE_OUTPUT,
-                mesh_rotated=self.MESH_ROTATED,
-                naming_convention="esm_new",
+        if flist is None:
+            flist = self._get_files_for_variable_short_name_single_component(varname)
+        output = self._analysis_file(varname, operator)
+
+        def compute():
+            from ..scripts.analysis_scripts.fesom import ANALYSIS_fesom_sfc_timmean
+
+            try:
+                p = ANALYSIS_fesom_sfc_timmean.MainProgram(
+                    varname,
+                    self.OUTDATA_DIR,
+                    output_file=output,
+                    mesh=self.MESH,
+                    levelwise_output=self.LEVELWISE_OUTPUT,
+                    naming_convention="esm_new",
+                    mesh_rotated=self.MESH_ROTATED,
+                    **kwargs
+                )
+                p()
+            except:
+                logging.error("Something went wrong with the analysis!")
+                raise
+
+        self._cached(
+            [operator],
+            varname,
+            flist,
+            output,
+            compute,
+            options=" ".join(
+                "%s=%s" % (key, value) for key, value in sorted(kwargs.items())
             )
-            p()
-        except:
-            logging.error("Something went wrong with the analysis!")
-            raise
-        return xr.open_dataset(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_climmean.nc"
+            + " mesh_rotated=%s" % self.MESH_ROTATED,
         )
+        return xr.open_dataset(output)
 
-    def yseasmean(self, varname, flist):
-        logging.debug("This method is trying to work on: %s", varname)
-        try:
-            p = twodim_fesom_analysis(
+    @profiling.timed
+    def _time_statistic(self, operator, varname, flist, engine=None, name=None):
+        """
+        Computes ``operator`` (e.g. ``ymonmean``) of ``varname`` from
+        ``flist`` with a Python engine, using the result cache.
+
+        Parameters
+        ----------
+        engine : XarrayEngine or StreamingEngine, optional
+            Defaults to ``python_engine``.
+        name : str, optional
+            Used instead of ``operator`` in the output file name
+
+        Returns
+        -------
+        xr.Dataset
+        """
+        engine = engine or self.python_engine
+        output = self._analysis_file(varname, name or operator)
+        self._cached(
+            [operator],
+            varname,
+            flist,
+            output,
+            lambda: engine.reduce(operator, [varname], flist, output),
+            # Not the type, which is a proxy when profiling:
+            options="engine=" + engine.NAME,
+        )
+        return xr.open_dataset(output)
+
+    def newest_climatology(self, varname, number_of_years=30):
+        """
+        Climatological average of ``varname``.
+
+        With the ``cdo`` engine, this runs the FESOM analysis script. With
+        the xarray or streaming engines, it is the time mean of the newest
+        ``number_of_years`` (yearly) files.
+        """
+        if self.python_engine is not None:
+            flist = self._get_files_for_variable_short_name_single_component(varname)
+            return self._time_statistic(
+                "timmean", varname, flist[-number_of_years:], name="climmean"
+            )
+        return self._run_analysis_script("climmean", varname)
+
+    def fldmean(self, varname, file_list, incremental=False):
+        """
+        Area weighted field mean of ``varname``
+
+        Each node is weighted by the area of its cluster, taken from the
+        (cached) mesh. For 3D variables, both the global (volume weighted)
+        mean and the mean of each level (``<varname>_levels``) are
+        generated. The files are read block by block, so that long time
+        series don't need to fit into memory; see
+        ``esm_analysis.unstructured.fldmean``.
+
+        Parameters
+        ----------
+        varname : str
+        file_list : list
+            The files to use, e.g. the yearly
+            ``<EXP_ID>_fesom_<varname>_<year>0101.nc``
+        incremental : bool
+            Not supported for FESOM; the result is taken from the result
+            cache if the input files did not change, or computed from
+            scratch.
+
+        Returns
+        -------
+        xr.Dataset
+        """
+        if incremental:
+            logging.warning("Incremental fldmean is not supported for FESOM")
+        output = self._analysis_file(varname, "fldmean")
+
+        def compute():
+            mesh = self.MESH
+            result = unstructured.fldmean(
+                sorted(file_list),
                 varname,
-                self.OUTDATA_DIR,
-                output_file=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_yseasmean.nc",
-                timintv="season",
-                mesh=self.MESH,
-                levelwise_output=self.LEVELWISE_OUTPUT,
-                naming_convention="esm_new",
-                mesh_rotated=self.MESH_ROTATED,
+                mesh.node_areas,
+                n32=getattr(mesh, "n32", None),
+                depths=getattr(mesh, "zlevs", None),
             )
-            p()
-        except:
-            logging.error("Something went wrong with the analysis!")
-            raise
-        return xr.open_dataset(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_yseasmean.nc"
+            result.to_netcdf(output)
+
+        self._cached(
+            ["fldmean"],
+            varname,
+            file_list,
+            output,
+            compute,
+            options="mesh_rotated=%s" % self.MESH_ROTATED,
+        )
+        return xr.open_dataset(output)
+
+    def yseasmean(self, varname, flist):
+        if self.python_engine is not None:
+            return self._time_statistic("yseasmean", varname, flist)
+        return self._run_analysis_script(
+            "yseasmean", varname, flist, timintv="season"
         )
 
     def ymonmean(self, varname, flist):
-        logging.debug("This method is trying to work on: %s", varname)
-        # Note that the argument flist isn't used, but needed for echam
-        try:
-            p = twodim_fesom_analysis(
-                varname,
-                self.OUTDATA_DIR,
-                output_file=self.ANALYSIS_DIR
-                + "/"
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + varname
-                + "_ymonmean.nc",
-                timintv="month",
-                mesh=self.MESH,
-                levelwise_output=self.LEVELWISE_OUTPUT,
-                naming_convention="esm_new",
-                mesh_rotated=self.MESH_ROTATED,
-            )
-            p()
-        except:
-            logging.error("Something went wrong with the analysis!")
-            raise
-        return xr.open_dataset(
-            self.ANALYSIS_DIR
-            + "/"
-            + self.EXP_ID
-            + "_"
-            + self.NAME
-            + "_"
-            + varname
-            + "_ymonmean.nc"
+        if self.python_engine is not None:
+            return self._time_statistic("ymonmean", varname, flist)
+        return self._run_analysis_script("ymonmean", varname, flist, timintv="month")
+
+    def ymonstd(self, varname, flist):
+        """
+        Standard deviation of each calendar month of ``varname``, computed
+        with the streaming engine unless the xarray engine is selected.
+        """
+        return self._time_statistic(
+            "ymonstd", varname, flist, engine=self.python_engine or StreamingEngine()
         )
 
     def AMOC(self):
@@ -0,0 +1,489 @@
+"""
+A long-lived analysis daemon, and its client.
+
+Every ``esm_analysis`` command normally starts from scratch: it imports
+``cdo`` and ``xarray``, finds the top of the experiment, reads its
+configuration and ``.codes`` files, and (for FESOM) loads the mesh, before
+any analysis starts. The daemon keeps this state in memory between calls.
+It listens on a Unix socket only the user can access, and keeps one
+``EsmAnalysis`` per experiment (with its components, catalog, result cache
+and meshes) loaded. Each request runs on a pool of worker threads.
+
+Start it with::
+
+    $ esm_analysis daemon start --detach
+
+From then on, commands like ``esm_analysis fldmean temp2`` are sent to the
+daemon, and only pay for the analysis itself. Without a running daemon (or
+with ``esm_analysis --no-daemon ...``), they run as before.
+
+The socket is ``$ESM_ANALYSIS_SOCKET``, or ``esm_analysis-<uid>.sock`` in
+``$XDG_RUNTIME_DIR``. Without ``$XDG_RUNTIME_DIR``, it is in the directory
+``esm_analysis-<uid>`` in the temporary directory, which only the user may
+access. Clients only connect to sockets owned by the user. Requests and
+responses are single lines of JSON.
+
+Requests for the same experiment run one after the other, since the
+analysis objects are not thread safe; requests for different experiments
+(and loading them) run in parallel. New output is still found, as the
+catalog rescans changed directories on every lookup, and an experiment is
+loaded again if its ``.top_of_exp_tree`` changed. Environment variables such as
+``ESM_ANALYSIS_CACHE_QUOTA`` are those of the daemon; only the engine is
+taken from the client.
+"""
+
+import collections
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+METHODS = (
+    "fldmean",
+    "yearmean",
+    "ymonmean",
+    "yseasmean",
+    "timmean",
+    "ymonstd",
+    "reductions",
+    "newest_climatology",
+    "run",
+)
+"""The ``EsmAnalysis`` methods which can be run by the daemon"""
+
+MAX_EXPERIMENTS = 8
+"""How many experiments are kept loaded; the least recently used is dropped"""
+
+
+class DaemonError(Exception):
+    """A request to the daemon failed"""
+
+
+def default_socket_path():
+    """
+    The socket of the daemon of the current user
+
+    Raises
+    ------
+    PermissionError
+        If the private directory in the temporary directory belongs to
+        someone else, or others may access it
+    """
+    if os.environ.get("ESM_ANALYSIS_SOCKET"):
+        return os.environ["ESM_ANALYSIS_SOCKET"]
+    # The temporary directory is shared with all users, who could replace
+    # the socket there:
+    directory = os.environ.get("XDG_RUNTIME_DIR") or _private_directory(
+        os.path.join(tempfile.gettempdir(), "esm_analysis-%s" % os.getuid())
+    )
+    return os.path.join(directory, "esm_analysis-%s.sock" % os.getuid())
+
+
+def _private_directory(path):
+    """Creates the directory ``path`` only the user may access, if needed"""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(
+            errno.EACCES,
+            "Not a directory only the user may access, remove it or set "
+            "XDG_RUNTIME_DIR or ESM_ANALYSIS_SOCKET",
+            path,
+        )
+    return path
+
+
+def _check_owner(socket_path):
+    """Makes sure that the socket belongs to the user, not to another daemon"""
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(
+            errno.EACCES, "The socket belongs to another user", socket_path
+        )
+
+
+################################################################################
+# Client
+
+
+def request(command, socket_path=None, timeout=None, **params):
+    """
+    Sends a request to the daemon, and waits for the response.
+
+    Parameters
+    ----------
+    command : str
+        ``analyze``, ``status`` or ``shutdown``
+    socket_path : str, optional
+        Defaults to ``default_socket_path()``
+    timeout : float, optional
+        Seconds to wait for the response; by default, as long as it takes.
+    **params
+        The parameters of the request, see ``analyze``
+
+    Returns
+    -------
+    The result of the request
+
+    Raises
+    ------
+    OSError
+        If the daemon cannot be reached, or the socket belongs to another
+        user
+    DaemonError
+        If the request failed
+    """
+    socket_path = socket_path or default_socket_path()
+    _check_owner(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(dict(params, command=command)) + "\n").encode())
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+    if not line:
+        raise DaemonError("The daemon closed the connection")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise DaemonError(response["error"])
+    return response["result"]
+
+
+def is_running(socket_path=None):
+    """Whether a daemon answers on ``socket_path``"""
+    try:
+        request("status", socket_path=socket_path, timeout=5)
+    except (OSError, DaemonError, ValueError):
+        return False
+    return True
+
+
+def analyze(
+    method,
+    varname,
+    exp_base=None,
+    cwd=None,
+    preferred_analysis_dir=None,
+    engine=None,
+    socket_path=None,
+    **kwargs
+):
+    """
+    Runs ``EsmAnalysis.<method>(varname, **kwargs)`` in the daemon
+
+    Parameters
+    ----------
+    method : str
+        One of ``METHODS``
+    varname : str or list
+    exp_base : str, optional
+        The top of the experiment; by default, it is searched upwards from
+        ``cwd``.
+    cwd : str, optional
+        Defaults to the current directory
+    preferred_analysis_dir, engine
+        See ``EsmAnalysis``. The engine defaults to ``ESM_ANALYSIS_ENGINE``
+        of the client.
+    socket_path : str, optional
+    **kwargs
+        Further arguments of ``method``, e.g. ``incremental=True``
+
+    Returns
+    -------
+    The output file(s) of the analysis, in the same structure as ``method``
+    returns them (datasets are replaced by the files they were read from).
+    """
+    return request(
+        "analyze",
+        socket_path=socket_path,
+        method=method,
+        varname=varname,
+        exp_base=exp_base,
+        cwd=cwd or os.getcwd(),
+        preferred_analysis_dir=preferred_analysis_dir,
+        engine=engine or os.environ.get("ESM_ANALYSIS_ENGINE"),
+        kwargs=kwargs,
+    )
+
+
+def start(socket_path=None, max_workers=None, log_file=None, wait=30.0):
+    """
+    Starts a daemon in the background, and waits until it answers.
+
+    Returns
+    -------
+    int
+        The process id of the daemon
+    """
+    socket_path = socket_path or default_socket_path()
+    if is_running(socket_path):
+        raise DaemonError("A daemon is already running on " + socket_path)
+    command = [sys.executable, "-m", "esm_analysis.cli", "daemon", "start"]
+    command += ["--socket", socket_path]
+    if max_workers:
+        command += ["--max-workers", str(max_workers)]
+    log_file = log_file or os.devnull
+    with open(os.devnull) as stdin, open(log_file, "a") as log:
+        process = subprocess.Popen(
+            command, stdin=stdin, stdout=log, stderr=log, start_new_session=True
+        )
+    deadline = time.monotonic() + wait
+    while not is_running(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise DaemonError(
+                "The daemon did not start, see %s for its output" % log_file
+            )
+        time.sleep(0.1)
+    return process.pid
+
+
+################################################################################
+# Server
+
+
+class _Experiment(object):
+    """An ``EsmAnalysis`` kept loaded, and the lock serializing its use"""
+
+    def __init__(self, exp_base, preferred_analysis_dir, engine):
+        from .esm_analysis import EsmAnalysis
+
+        self.lock = threading.Lock()
+        self.analyser = EsmAnalysis(
+            exp_base=exp_base,
+            preferred_analysis_dir=preferred_analysis_dir,
+            engine=engine,
+        )
+        self.config = _config(exp_base)
+        self.preferred_analysis_dir = preferred_analysis_dir
+
+    def run(self, method, varname, kwargs):
+        with self.lock:
+            # Picks up components which appeared since the last request:
+            self.analyser.initialize_analysis_components(
+                preferred_analysis_dir=self.preferred_analysis_dir
+            )
+            return getattr(self.analyser, method)(varname, **kwargs)
+
+
+def _config(exp_base):
+    # The contents, not the modification time, since each EsmAnalysis
+    # rewrites the file (see clean_top_of_tree):
+    with open(os.path.join(exp_base, ".top_of_exp_tree")) as f:
+        return f.read()
+
+
+def _find_top(cwd):
+    from .experiments import find_top_of_tree
+
+    if cwd is None:
+        raise DaemonError("Neither the experiment nor a directory in it was given")
+    top = find_top_of_tree(cwd)
+    if top is None:
+        raise DaemonError("%s is not within an experiment (no .top_of_exp_tree)" % cwd)
+    return top
+
+
+def output_files(result):
+    """
+    ``result`` with datasets replaced by the file they were read from, so
+    that it can be sent to another process
+    """
+    if isinstance(result, dict):
+        return {key: output_files(value) for key, value in result.items()}
+    if result is None or isinstance(result, (str, int, float, bool)):
+        return result
+    encoding = getattr(result, "encoding", None)
+    if isinstance(encoding, dict) and "source" in encoding:
+        result.close()
+        return encoding["source"]
+    return repr(result)
+
+
+class AnalysisDaemon(object):
+    """
+    Serves analysis requests on a Unix socket, see the module documentation
+
+    Parameters
+    ----------
+    socket_path : str, optional
+        Defaults to ``default_socket_path()``
+    max_workers : int, optional
+        The number of requests run at the same time; defaults to
+        ``ESM_ANALYSIS_MAX_WORKERS``, or the number of CPUs.
+    max_experiments : int
+        How many experiments are kept loaded
+    """
+
+    def __init__(self, socket_path=None, max_workers=None, max_experiments=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.max_workers = max_workers or int(
+            os.environ.get("ESM_ANALYSIS_MAX_WORKERS", os.cpu_count() or 1)
+        )
+        self.max_experiments = max_experiments or MAX_EXPERIMENTS
+        self.started = time.time()
+        self._experiments = collections.OrderedDict()
+        # One lock per experiment, held while it is loaded:
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._server = None
+
+    def bind(self):
+        """
+        Creates the socket, accessible only by the current user.
+
+        Raises
+        ------
+        DaemonError
+            If another daemon is already listening on it
+        """
+        if os.path.exists(self.socket_path):
+            if is_running(self.socket_path):
+                raise DaemonError("A daemon is already running on " + self.socket_path)
+            os.remove(self.socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if line:
+                    response = daemon.respond(line)
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+
+        umask = os.umask(0o077)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(
+                self.socket_path, Handler
+            )
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+
+    def serve_forever(self):
+        """Answers requests until ``shutdown`` (or SIGTERM), then removes the socket"""
+        if self._server is None:
+            self.bind()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self._shutdown_soon())
+        logging.info("Analysis daemon listening on %s", self.socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._pool.shutdown(wait=False)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            logging.info("Analysis daemon stopped")
+
+    def shutdown(self):
+        """Stops ``serve_forever``; must not be called from the serving thread"""
+        self._server.shutdown()
+
+    def _shutdown_soon(self):
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def respond(self, line):
+        """The response (a dictionary) to a request (a line of JSON)"""
+        try:
+            params = json.loads(line)
+            command = params.pop("command")
+            if command == "status":
+                result = self.status()
+            elif command == "shutdown":
+                self._shutdown_soon()
+                result = None
+            elif command == "analyze":
+                result = self._pool.submit(self._analyze, **params).result()
+            else:
+                raise DaemonError("Unknown command %s" % command)
+        except Exception as error:
+            logging.exception("Request failed: %s", line)
+            return {"ok": False, "error": "%s: %s" % (type(error).__name__, error)}
+        return {"ok": True, "result": result}
+
+    def status(self):
+        """The process id, uptime and loaded experiments of the daemon"""
+        with self._lock:
+            experiments = [key[0] for key in self._experiments]
+        return {
+            "pid": os.getpid(),
+            "socket": self.socket_path,
+            "uptime": time.time() - self.started,
+            "max_workers": self.max_workers,
+            "experiments": experiments,
+        }
+
+    def _analyze(
+        self,
+        method,
+        varname,
+        exp_base=None,
+        cwd=None,
+        preferred_analysis_dir=None,
+        engine=None,
+        kwargs=None,
+    ):
+        if method not in METHODS:
+            raise DaemonError("Unknown analysis %s" % method)
+        start = time.perf_counter()
+        if exp_base:
+            from .experiments import resolve_experiment
+
+            exp_base = resolve_experiment(exp_base)
+        experiment = self._experiment(
+            os.path.realpath(exp_base or _find_top(cwd)),
+            preferred_analysis_dir,
+            engine,
+        )
+        result = output_files(experiment.run(method, varname, kwargs or {}))
+        logging.info(
+            "%s of %s in %s: %.3f s",
+            method,
+            varname,
+            experiment.analyser.EXP_ID,
+            time.perf_counter() - start,
+        )
+        return result
+
+    def _experiment(self, exp_base, preferred_analysis_dir, engine):
+        """
+        The loaded experiment, loading it (again) if needed. Only requests
+        for the same experiment wait for it to be loaded.
+        """
+        key = (exp_base, preferred_analysis_dir, engine)
+        config = _config(exp_base)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            with self._lock:
+                experiment = self._experiments.get(key)
+                if experiment is not None and experiment.config == config:
+                    self._experiments.move_to_end(key)
+                    return experiment
+            if experiment is not None:
+                logging.info("Configuration of %s changed, reloading", exp_base)
+            logging.info("Loading experiment %s", exp_base)
+            experiment = _Experiment(exp_base, preferred_analysis_dir, engine)
+            with self._lock:
+                self._experiments[key] = experiment
+                self._experiments.move_to_end(key)
+                while len(self._experiments) > self.max_experiments:
+                    dropped, _ = self._experiments.popitem(last=False)
+                    self._loading.pop(dropped, None)
+            return experiment
@@ -30,18 +30,49 @@ name.
 
 
     >>> t2m_fldmean = analyser.fldmean("temp2")
+
+Several variables can be given at once; variables stored in the same files
+are then extracted in one pass, and a dictionary is returned::
+
+    >>> fldmeans = analyser.fldmean(["temp2", "aprl", "aprc"])
 """
 
-import glob
+import collections
+import functools
 import importlib
 import logging
 import os
-import re
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import cdo
 import yaml
 
+from .catalog import OutdataCatalog
+from .experiments import find_top_of_tree, resolve_experiment
+from . import profiling
+from .result_cache import DEFAULT_QUOTA, ResultCache, cache_key, detach
+from .streams import StreamIndex
+
+
+ENGINES = ("cdo", "xarray", "streaming")
+"""The available analysis engines, see the ``engine`` argument of ``EsmAnalysis``"""
+
+OPERATORS = (
+    "fldmean",
+    "yearmean",
+    "ymonmean",
+    "yseasmean",
+    "timmean",
+    "ymonstd",
+    "reductions",
+    "newest_climatology",
+)
+"""The analyses which can be run by name, see ``EsmAnalysis.run``"""
+
+DATA_EXTENSIONS = (".grb", ".nc")
+"""Extensions of the data files described by a ``.codes`` file, preferred first"""
+
 
 def clean_top_of_tree(basedir):
     """
@@ -105,19 +136,19 @@ def walk_up(bottom):
     """
     bottom = os.path.realpath(bottom)
 
-    # Get files in current dir
+    # Get files in current dir; scandir knows which entries are directories
+    # without a stat call for each:
+    dirs, nondirs = [], []
     try:
-        names = os.listdir(bottom)
+        with os.scandir(bottom) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    nondirs.append(entry.name)
     except Exception as e:
         print(e)
         return
-
-    dirs, nondirs = [], []
-    for name in names:
-        if os.path.isdir(os.path.join(bottom, name)):
-            dirs.append(name)
-        else:
-            nondirs.append(name)
     yield bottom, dirs, nondirs
 
     new_path = os.path.realpath(os.path.join(bottom, ".."))
@@ -147,7 +178,8 @@ class AnalysisComponent(object):
 
 
 class EsmAnalysis(object):
-    def __init__(self, exp_base=None, preferred_analysis_dir=None):
+    @profiling.timed
+    def __init__(self, exp_base=None, preferred_analysis_dir=None, engine=None):
         """
         Base Class for Analysis, other component specific analysis classes
         should inherit from this one
@@ -165,16 +197,26 @@ class EsmAnalysis(object):
 
         Parameters
         ----------
+        exp_base : str
+            The top of the experiment, or its ``EXP_ID`` if it is in the
+            experiment catalog (see ``esm_analysis.experiments``). By
+            default, the experiment around the current directory.
         preferred_analysis_dir : str
             Where the analysis files should be stored, defaults to the current experiment.
+        engine : str
+            How reductions are computed: ``"cdo"`` (the default), ``"xarray"``
+            (see ``esm_analysis.xarray_engine``) or ``"streaming"`` (see
+            ``esm_analysis.streaming``). Defaults to ``engine`` in the
+            ``.top_of_exp_tree`` file, or the environment variable
+            ESM_ANALYSIS_ENGINE.
         """
         # Figure out what the top of the experiment is by finding upwards a
         # file called .top_of_exp_tree
         if not exp_base:
-            for bottom, _, files in walk_up(os.getcwd()):
-                if ".top_of_exp_tree" in files:
-                    self.EXP_BASE = bottom
-                    break
+            with profiling.span("find_top_of_tree"):
+                bottom = find_top_of_tree(os.getcwd())
+            if bottom is not None:
+                self.EXP_BASE = bottom
             else:
                 self.EXP_BASE = input(
                     "Enter the top-level directory of your experiment: "
@@ -195,7 +237,8 @@ class EsmAnalysis(object):
                 except PermissionError:
                     print("Sorry, you don't have permission to write here!")
         else:
-            self.EXP_BASE = exp_base
+            # Either a path, or the ID of an experiment in the catalog:
+            self.EXP_BASE = resolve_experiment(exp_base)
 
         self.EXP_ID = os.path.basename(self.EXP_BASE)
 
@@ -212,16 +255,124 @@ class EsmAnalysis(object):
         self.RESTART_DIR = self.EXP_BASE + "/restart/"
         self.SCRIPT_DIR = self.EXP_BASE + "/scripts/"
 
-        # Here's yer CDO:
-        self.CDO = cdo.Cdo()
+        # Here's yer CDO (created on first use, see the ``CDO`` property):
+        self._cdo = None
 
         # Ensure that the analysis directory exists for the top:
         logging.info("Before call: %s", self.ANALYSIS_DIR)
         self.create_analysis_dir(preferred_analysis_dir=preferred_analysis_dir)
         logging.info("After call: %s", self.ANALYSIS_DIR)
 
-        # Make a list to hold the analysis components
-        self._analysis_components = []
+        # The file catalog is shared by the experiment and all components, so
+        # it lives in the top-level analysis directory:
+        self.CATALOG_FILE = os.path.join(self.ANALYSIS_DIR, ".esm_catalog.sqlite")
+        self._catalog = None
+
+        # Same for the result cache. The quota can be given in the
+        # .top_of_exp_tree file as e.g. ``result_cache_quota: 50G`` (or
+        # ``none``), or with the environment variable ESM_ANALYSIS_CACHE_QUOTA:
+        self.RESULT_CACHE_DIR = os.path.join(self.ANALYSIS_DIR, ".cache")
+        self.RESULT_CACHE_QUOTA = os.environ.get(
+            "ESM_ANALYSIS_CACHE_QUOTA",
+            self._config.get("result_cache_quota", DEFAULT_QUOTA),
+        )
+        self._result_cache = None
+
+        # Parallelism for operators which can split up their work, e.g. by
+        # processing chunks of files. Can be given in the .top_of_exp_tree
+        # file as ``max_workers`` (default: number of CPUs) and ``cdo_threads``
+        # (threads per CDO process, default 1), or with the environment
+        # variables ESM_ANALYSIS_MAX_WORKERS and ESM_ANALYSIS_CDO_THREADS:
+        self.MAX_WORKERS = int(
+            os.environ.get(
+                "ESM_ANALYSIS_MAX_WORKERS",
+                self._config.get("max_workers", os.cpu_count() or 1),
+            )
+        )
+        self.CDO_THREADS = int(
+            os.environ.get(
+                "ESM_ANALYSIS_CDO_THREADS", self._config.get("cdo_threads", 1)
+            )
+        )
+
+        # The engine used for reductions, and the dask scheduler used by the
+        # xarray engine (``dask_scheduler: threads`` or ``processes``):
+        self.ENGINE = (
+            engine
+            or os.environ.get("ESM_ANALYSIS_ENGINE")
+            or self._config.get("engine", "cdo")
+        )
+        if self.ENGINE not in ENGINES:
+            raise ValueError(
+                "Unknown engine %s, choose from %s" % (self.ENGINE, ENGINES)
+            )
+        self.DASK_SCHEDULER = os.environ.get(
+            "ESM_ANALYSIS_DASK_SCHEDULER", self._config.get("dask_scheduler", "threads")
+        )
+        self._python_engine = None
+
+        # Components are registered by name and only constructed when they
+        # are first needed, see ``initialize_analysis_components``:
+        self._component_registry = {}
+        self._component_preferred_analysis_dir = None
+
+    @property
+    def CDO(self):
+        """The ``cdo.Cdo`` object used for analysis, created on first use"""
+        if self._cdo is None:
+            import cdo
+
+            with profiling.span("cdo.Cdo"):
+                self._cdo = cdo.Cdo()
+        # With profiling enabled, every call is recorded:
+        return profiling.instrument(self._cdo, "cdo")
+
+    @property
+    def python_engine(self):
+        """
+        The ``XarrayEngine`` or ``StreamingEngine`` used instead of ``cdo``,
+        depending on ``ENGINE``. ``None`` if ``ENGINE`` is ``"cdo"``.
+        """
+        if self._python_engine is None:
+            # The engines need xarray, which is only imported if they are used:
+            if self.ENGINE == "xarray":
+                from .xarray_engine import XarrayEngine
+
+                self._python_engine = XarrayEngine(
+                    scheduler=self.DASK_SCHEDULER, num_workers=self.MAX_WORKERS
+                )
+            elif self.ENGINE == "streaming":
+                from .streaming import StreamingEngine
+
+                self._python_engine = StreamingEngine()
+        if self._python_engine is None:
+            return None
+        return profiling.instrument(self._python_engine, self.ENGINE)
+
+    @property
+    def THREAD_SAFE(self):
+        """
+        Whether analyses of this component can run in several threads at
+        once (see ``run``). This is only the case if ``cdo`` does the work in
+        its own processes: the netCDF (HDF5) library is not thread-safe, and
+        the Python engines read and write netCDF files in this process.
+        """
+        return self.ENGINE == "cdo"
+
+    def __getattr__(self, name):
+        # Only called if normal attribute lookup fails. Allows access to
+        # components via e.g. ``analyser.fesom`` or ``analyser.echam6``, which
+        # are constructed on the fly:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        component = self._component_for_attribute(name)
+        if component is not None:
+            comp_analyzer = self._get_component(component)
+            if comp_analyzer is not None:
+                return comp_analyzer
+        raise AttributeError(
+            "%r object has no attribute %r" % (type(self).__name__, name)
+        )
 
     def create_analysis_dir(self, preferred_analysis_dir=None):
         """
@@ -245,53 +396,118 @@ class EsmAnalysis(object):
             logging.info("Creating directory: %s", self.ANALYSIS_DIR)
             os.makedirs(self.ANALYSIS_DIR)
 
+    @profiling.timed
     def initialize_analysis_components(self, preferred_analysis_dir=None):
         """
-        Creates analysis objects for each component found in the ``OUTDATA_DIR`` directory.
+        Registers analysis objects for each component found in the
+        ``OUTDATA_DIR`` directory.
+
+        The components are only discovered by name here. The actual analysis
+        object is constructed the first time it is needed, either by attribute
+        access (e.g. ``analyser.fesom``) or when a variable is looked up which
+        belongs to this component.
 
         It is assumed that the component analysis object can be initialized
         without any arguments. If no class has been defined yet, a warning is
-        sent.
+        sent once the component is first used.
         """
-        for component in os.listdir(self.OUTDATA_DIR):
+        self._component_preferred_analysis_dir = preferred_analysis_dir
+        for component in sorted(os.listdir(self.OUTDATA_DIR)):
+            if not os.path.isdir(os.path.join(self.OUTDATA_DIR, component)):
+                continue
+            logging.debug("Registering component %s", component)
+            self._component_registry.setdefault(component, None)
+
+    @property
+    def _analysis_components(self):
+        """
+        All registered components which can be analysed, constructing them if
+        needed
+        """
+        components = []
+        for component in list(self._component_registry):
+            comp_analyzer = self._get_component(component)
+            if comp_analyzer is not None:
+                components.append(comp_analyzer)
+        return components
+
+    def _component_for_attribute(self, name):
+        """Finds the registered component whose directory or ``NAME`` is ``name``"""
+        registry = self.__dict__.get("_component_registry", {})
+        if name in registry:
+            return name
+        for component in registry:
             try:
-                # TODO: I don't really like this, it'd be nicer with relative
-                # imports (maybe? I am not sure...)
-                logging.debug("Trying to import esm_analysis.components." + component)
-                comp_module = importlib.import_module(
-                    "esm_analysis.components." + component
-                )
-                logging.debug("Import worked!")
-                comp_analyzer = getattr(
-                    comp_module, component.capitalize() + "Analysis"
-                )(exp_base=self.EXP_BASE, preferred_analysis_dir=preferred_analysis_dir)
-                logging.debug("Init worked!")
-                # PG: Not sure I like the next two lines, they already confuse
-                # me 10 minutes after I wrote them...
-                if preferred_analysis_dir:
-                    component_analysis_dir = preferred_analysis_dir + "/" + component
-                    comp_analyzer.create_analysis_dir(
-                        preferred_analysis_dir=component_analysis_dir
-                    )
-                else:
-                    comp_analyzer.create_analysis_dir()
-
-                logging.debug("Finished setting up analysis dir for " + component)
-                # Make it a object attribute for access interactively:
-                setattr(self, comp_analyzer.NAME, comp_analyzer)
-                logging.debug("Setting attributes for the big analyser")
-
-                # Put it in the list for easy access from inside the class:
-                self._analysis_components.append(comp_analyzer)
-            except:
-                logging.warning(
-                    "Oops: Trouble initializing or no analysis class available for: %s"
-                    % component
+                comp_class = self._get_component_class(component)
+            except (ImportError, AttributeError):
+                continue
+            if comp_class.NAME == name:
+                return component
+        return None
+
+    @staticmethod
+    def _get_component_class(component):
+        # TODO: I don't really like this, it'd be nicer with relative
+        # imports (maybe? I am not sure...)
+        logging.debug("Trying to import esm_analysis.components." + component)
+        comp_module = importlib.import_module("esm_analysis.components." + component)
+        logging.debug("Import worked!")
+        return getattr(comp_module, component.capitalize() + "Analysis")
+
+    def _get_component(self, component):
+        """
+        Returns the analysis object for ``component``, constructing it on first access.
+
+        Parameters
+        ----------
+        component : str
+            The name of the component directory in ``OUTDATA_DIR``
+
+        Returns
+        -------
+        EsmAnalysis or None
+            The component analysis object, or ``None`` if it could not be
+            constructed.
+        """
+        comp_analyzer = self._component_registry.get(component)
+        if comp_analyzer is not None:
+            return comp_analyzer
+        preferred_analysis_dir = self._component_preferred_analysis_dir
+        try:
+            comp_analyzer = self._get_component_class(component)(
+                exp_base=self.EXP_BASE,
+                preferred_analysis_dir=preferred_analysis_dir,
+                engine=self.ENGINE,
+            )
+            logging.debug("Init worked!")
+            # PG: Not sure I like the next two lines, they already confuse
+            # me 10 minutes after I wrote them...
+            if preferred_analysis_dir:
+                component_analysis_dir = preferred_analysis_dir + "/" + component
+                comp_analyzer.create_analysis_dir(
+                    preferred_analysis_dir=component_analysis_dir
                 )
-                logging.error("Error was: %s", sys.exc_info()[0])
-                if component == "fesom":
-                    raise
+            else:
+                comp_analyzer.create_analysis_dir()
+
+            logging.debug("Finished setting up analysis dir for " + component)
+        except:
+            logging.warning(
+                "Oops: Trouble initializing or no analysis class available for: %s"
+                % component
+            )
+            logging.error("Error was: %s", sys.exc_info()[0])
+            if component == "fesom":
+                raise
+            # Don't try again on the next lookup:
+            self._component_registry.pop(component, None)
+            return None
+        # Make it a object attribute for access interactively:
+        setattr(self, comp_analyzer.NAME, comp_analyzer)
+        self._component_registry[component] = comp_analyzer
+        return comp_analyzer
 
+    @profiling.timed
     def determine_variable_dict_from_code_files(self):
         """
         A generic method to create a dictionary containing file patterns and
@@ -306,70 +522,37 @@ class EsmAnalysis(object):
 
         Returns
         -------
-        A nested dictionary. The outermost key is a file pattern, with the
+        A nested dictionary. The outermost key is a stream (e.g.
+        ``echam6_echam.grb``, see ``esm_analysis.streams``), with the
         value/inner key is the variable short name. The inner value is a
         dictionary of code_number, levels, short_name, long_name.
         """
         logging.debug("Starting to determine variable dict...")
         variables = {}
-        # CLEANUP: This is a lot of duplicate code...
-        all_code_files = glob.glob(
-            self.OUTDATA_DIR + self.EXP_ID + "_" + self.NAME + "*.codes"
-        )
-        # Remove the file path:
-        code_files = [
-            code_file.replace(self.OUTDATA_DIR, "") for code_file in all_code_files
-        ]
-        code_streams = [
-            code_file.replace(self.EXP_ID, "").replace(".codes", "")
-            for code_file in code_files
-        ]
-        code_streams_no_digits = {
-            "".join(r"\d" if c.isdigit() else c for c in code_file)
-            for code_file in code_streams
-        }
-        code_streams_full = {
-            self.OUTDATA_DIR + self.EXP_ID + stream + ".codes"
-            for stream in code_streams_no_digits
-        }
-        code_regexes = {re.compile(stream) for stream in code_streams_full}
-        deduped_streams = [
-            list(filter(r.match, all_code_files))[0] for r in code_regexes
-        ]
-
-        for f in deduped_streams:
+        # One listing of the directory gives the files of every stream; the
+        # code table of a stream describes its data files, which are GRIB
+        # unless only other formats were written:
+        streams = StreamIndex(self.OUTDATA_DIR, self.EXP_ID)
+        for codes in streams.with_extension(".codes"):
+            parsed = streams.first(codes)
+            if parsed.component != self.NAME:
+                continue
+            f = streams.files(codes)[0]
             logging.debug("Working on: %s", f)
-            file_stream = (
-                f.replace(self.OUTDATA_DIR, "")
-                .replace(self.EXP_ID + "_" + self.NAME + "_", "")
-                .replace(".codes", "")
-            )
-            file_stream = "".join(r"\d" if c.isdigit() else c for c in file_stream)
-            # BUG: This depends on knowing that the file extension is GRIB. This might not always be the case...
-            file_pattern = (
-                self.OUTDATA_DIR
-                + self.EXP_ID
-                + "_"
-                + self.NAME
-                + "_"
-                + file_stream
-                + ".grb"
-            )
-            # Replace digits with regex-able expression:
-            #
-            # POTENTIAL BUG: if two streams are very similar, e.g.
-            # EXP_ID_echam6_echam_stream123.grb and
-            # EXP_ID_echam6_echam_stream456.grb, these will end up being the
-            # same; and this fails...
-            logging.debug("File pattern will be: %s", file_pattern)
-            variables[file_pattern] = {}
+            name = codes[: -len(".codes")]
+            data_streams = [
+                name + ext for ext in DATA_EXTENSIONS if name + ext in streams
+            ]
+            stream = data_streams[0] if data_streams else name + ".grb"
+            logging.debug("Stream will be: %s", stream)
+            variables[stream] = {}
             with open(f) as code_file:
                 code_file_list = [" ".join(line.split()) for line in code_file]
                 for entry in code_file_list:
                     code_number, levels, short_name, _, _, long_name = entry.split(
                         " ", 5
                     )
-                    variables[file_pattern][short_name] = {
+                    variables[stream][short_name] = {
                         "code_number": code_number,
                         "levels": levels,
                         "short_name": short_name,
@@ -378,26 +561,96 @@ class EsmAnalysis(object):
         logging.debug("Variable dict given back will be: %s", variables)
         return variables
 
-    def _get_files_for_variable_short_name_single_component(self, varname):
-        fpattern_list = []
-        for (file_pattern, short_names_in_file_pattern) in self._variables.items():
-            for short_name in short_names_in_file_pattern:
-                logging.debug("Checking: %s = %s", short_name, varname)
-                if short_name == varname:
-                    fpattern_list.append(
-                        sorted(
-                            list(
-                                filter(
-                                    re.compile(file_pattern).match,
-                                    [
-                                        self.OUTDATA_DIR + f
-                                        for f in os.listdir(self.OUTDATA_DIR)
-                                    ],
-                                )
-                            )
-                        )
-                    )
-                    # fpattern_list.append(sorted(glob.glob(file_pattern)))
+    @property
+    def catalog(self):
+        """The ``OutdataCatalog`` of this experiment, opened on first use"""
+        if self._catalog is None:
+            self._catalog = OutdataCatalog(self.CATALOG_FILE, exp_id=self.EXP_ID)
+        return self._catalog
+
+    @property
+    def result_cache(self):
+        """The ``ResultCache`` of this experiment, opened on first use"""
+        if self._result_cache is None:
+            self._result_cache = ResultCache(
+                self.RESULT_CACHE_DIR, quota=self.RESULT_CACHE_QUOTA
+            )
+        return self._result_cache
+
+    def _analysis_file(self, varname, operator):
+        """The output file of ``operator`` applied to ``varname``"""
+        return (
+            self.ANALYSIS_DIR
+            + "/"
+            + self.EXP_ID
+            + "_"
+            + self.NAME
+            + "_"
+            + varname
+            + "_"
+            + operator
+            + ".nc"
+        )
+
+    def _cached(self, operators, varname, inputs, output, compute, options=""):
+        """
+        Runs ``compute`` to produce ``output``, unless the result cache has it.
+
+        Parameters
+        ----------
+        operators : list of str
+            The operator chain producing the output, part of the cache key
+        varname : str
+            The variable, part of the cache key
+        inputs : list of str
+            The input files, part of the cache key with their sizes and
+            modification times
+        output : str
+            The output file
+        compute : callable
+            Called without arguments on a cache miss, needs to write ``output``
+        options : str
+            Any further options changing the result, part of the cache key
+
+        Returns
+        -------
+        str
+            ``output``
+        """
+        key = cache_key(operators, varname, options, inputs)
+        if not self.result_cache.fetch(key, output):
+            detach(output)
+            compute()
+            self.result_cache.store(
+                key, output, description=" ".join(list(operators) + [options])
+            )
+        return output
+
+    def _refresh_catalog(self, component):
+        """
+        Updates the catalog entries for ``component`` if its ``OUTDATA_DIR``
+        changed
+        """
+        self.catalog.refresh(
+            os.path.basename(os.path.normpath(component.OUTDATA_DIR)),
+            component.OUTDATA_DIR,
+            lambda: component._variables,
+        )
+
+    @profiling.timed
+    def _get_files_for_variable_short_name_single_component(
+        self, varname, start=None, end=None
+    ):
+        self._refresh_catalog(self)
+        fpattern_list = [
+            flist
+            for (_, _, flist) in self.catalog.files_for_variable(
+                varname,
+                start=start,
+                end=end,
+                directories=[self.OUTDATA_DIR],
+            )
+        ]
         if len(fpattern_list) > 1:
             print("Multiple file patterns have requested variable %s" % varname)
             for index, fpattern in enumerate(fpattern_list):
@@ -406,7 +659,8 @@ class EsmAnalysis(object):
             return fpattern_list[index_choice]
         return fpattern_list[0]
 
-    def get_component_for_variable_short_name(self, varname):
+    @profiling.timed
+    def get_component_for_variable_short_name(self, varname, start=None, end=None):
         """
         Checks all known component and gets a list of files that should be used
         for a specific variable name.
@@ -414,13 +668,21 @@ class EsmAnalysis(object):
         There is currently an implicit assumption for the following to be true:
         1. Each ``component`` has a private attribute ``_variables``
         1. This attribute should be a dictionary
-        1. The dictionary needs to have a "file_pattern" as a key, and all
-           short names contained in this file pattern as values.
+        1. The dictionary needs to have a stream (e.g. ``echam6_echam.grb``,
+           see ``esm_analysis.streams``) as a key, and all short names
+           contained in this stream as values.
+
+        The files are looked up in the experiment's ``OutdataCatalog``, which
+        is refreshed for any component directory that changed since the last
+        lookup.
 
         Parameters
         ----------
         varname : str
             The short variable name which is being looked for
+        start, end : str or int, optional
+            Only return files dated within these (inclusive) limits, e.g.
+            ``"1850"`` or ``"1850-06"``.
 
         Returns
         -------
@@ -431,37 +693,29 @@ class EsmAnalysis(object):
                **probably** sorts alphabetically/numerically.
             2. The component object for analysis with these files.
         """
-        fpattern_list = []
-        logging.debug(self._analysis_components)
-        for component in self._analysis_components:
-            for (
-                file_pattern,
-                short_names_in_file_pattern,
-            ) in component._variables.items():
-                for short_name in short_names_in_file_pattern:
-                    logging.debug("Checking: %s = %s", short_name, varname)
-                    if short_name == varname:
-                        fpattern_list.append(
-                            (
-                                sorted(
-                                    list(
-                                        filter(
-                                            re.compile(file_pattern).match,
-                                            [
-                                                component.OUTDATA_DIR + f
-                                                for f in os.listdir(
-                                                    component.OUTDATA_DIR
-                                                )
-                                            ],
-                                        )
-                                    )
-                                ),
-                                component,
-                            )
-                        )
-                        # fpattern_list.append(
-                        #     (sorted(glob.glob(file_pattern)), component)
-                        # )
+        logging.debug(self._component_registry)
+        # Only the catalog is consulted here; a component is constructed if
+        # its directory changed since the last lookup (to re-read its
+        # variables), or if it holds the requested variable:
+        outdata_dirs = {
+            component: self.OUTDATA_DIR + component + "/"
+            for component in list(self._component_registry)
+        }
+        for component, outdata_dir in outdata_dirs.items():
+            self.catalog.refresh(
+                component,
+                outdata_dir,
+                lambda component=component: getattr(
+                    self._get_component(component), "_variables", {}
+                ),
+            )
+        fpattern_list = [
+            (flist, self._get_component(comp_name))
+            for (comp_name, _, flist) in self.catalog.files_for_variable(
+                varname, start=start, end=end, directories=list(outdata_dirs.values())
+            )
+            if comp_name in self._component_registry
+        ]
         multi_comps = []
         for index, (fpattern, component) in enumerate(fpattern_list):
             if component not in multi_comps:
@@ -475,30 +729,308 @@ class EsmAnalysis(object):
         else:
             return fpattern_list[0][0], multi_comps[0]
 
+    @staticmethod
+    def _group_by_stream(located):
+        """
+        Groups variables by the component and files they are found in.
+
+        Parameters
+        ----------
+        located : dict
+            The files and component of each variable, as returned by
+            ``get_component_for_variable_short_name``
+
+        Returns
+        -------
+        list of tuple
+            ``(component, files, varnames)`` for each group
+        """
+        groups = collections.OrderedDict()
+        for varname, (flist, component) in located.items():
+            group = groups.setdefault(
+                (component.NAME, tuple(flist)), (component, flist, [])
+            )
+            group[2].append(varname)
+        return list(groups.values())
+
+    @staticmethod
+    def _apply_to_group(operator, component, flist, varnames, **kwargs):
+        """
+        Applies the component's ``operator`` to variables stored in the same
+        files, in a single call if there are several of them.
+
+        Returns
+        -------
+        dict
+            The result for each variable name
+        """
+        if operator == "newest_climatology":
+            # Finds its files by itself:
+            return {
+                varname: component.newest_climatology(varname, **kwargs)
+                for varname in varnames
+            }
+        if len(varnames) == 1:
+            return {
+                varnames[0]: getattr(component, operator)(varnames[0], flist, **kwargs)
+            }
+        logging.info(
+            "Running %s on %s in one pass over %s files",
+            operator,
+            ", ".join(varnames),
+            len(flist),
+        )
+        return getattr(component, operator)(varnames, flist, **kwargs)
+
+    def _run_concurrently(self, tasks, max_workers=None):
+        """
+        Calls each of ``tasks``, ``(thread_safe, function)`` pairs, in a
+        thread pool with up to ``max_workers`` (by default ``MAX_WORKERS``)
+        threads. Functions which are not thread-safe take turns.
+
+        Returns
+        -------
+        list
+            The result of each function, in order. If functions fail, the
+            exception of the first one is raised once all of them are done.
+        """
+        workers = min(len(tasks), max_workers or self.MAX_WORKERS)
+        if workers <= 1 or not any(thread_safe for thread_safe, _ in tasks):
+            return [function() for _, function in tasks]
+        logging.debug("Running %s tasks in %s threads", len(tasks), workers)
+        lock = threading.Lock()
+
+        def call(thread_safe, function):
+            if thread_safe:
+                return function()
+            with lock:
+                return function()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(call, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def _for_each_stream(self, operator, varnames, **kwargs):
+        """
+        Applies ``operator`` to several variables, once per stream.
+
+        The variables are grouped by the component and files they are found
+        in. Each group is handed to the component's ``operator`` method in a
+        single call (as a list of variable names), so that components which
+        can extract several variables at once (e.g. ECHAM) only need to read
+        each stream once. Variables which are alone in their stream are
+        handed over by themselves. The groups run concurrently, see ``run``.
+
+        Returns
+        -------
+        dict
+            The result for each variable name, in the order given.
+        """
+        located = collections.OrderedDict(
+            (varname, self.get_component_for_variable_short_name(varname))
+            for varname in varnames
+        )
+        apply_to_group = functools.partial(self._apply_to_group, operator, **kwargs)
+        tasks = [
+            (
+                component.THREAD_SAFE,
+                functools.partial(apply_to_group, component, flist, group),
+            )
+            for component, flist, group in self._group_by_stream(located)
+        ]
+        results = {}
+        for group_results in self._run_concurrently(tasks):
+            results.update(group_results)
+        return {varname: results[varname] for varname in varnames}
+
+    @profiling.timed
+    def run(self, jobs, max_workers=None):
+        """
+        Runs several analyses on this experiment at once.
+
+        The files of all variables are looked up first. Then, for each
+        operator, variables stored in the same files are handed to their
+        component together (see ``_for_each_stream``), and all of these
+        calls run concurrently. Only components which are ``THREAD_SAFE``
+        (with the ``cdo`` engine, ECHAM) actually overlap; the others take
+        turns, and the xarray engine parallelizes each analysis with dask
+        instead.
+
+        Parameters
+        ----------
+        jobs : iterable of tuple
+            ``(operator, varname)`` pairs, where ``operator`` is one of
+            ``OPERATORS``, e.g. ``[("fldmean", "temp2"), ("ymonmean", "temp2")]``
+        max_workers : int, optional
+            The number of analyses run at the same time, by default
+            ``MAX_WORKERS``. Note that each of them may use several processes
+            itself (see ``EchamAnalysis._reduce_chunks``).
+
+        Returns
+        -------
+        dict
+            For each operator, a dictionary of the result of each variable,
+            e.g. ``results["fldmean"]["temp2"]``
+
+        Examples
+        --------
+        >>> results = analyser.run([("fldmean", "temp2"), ("ymonmean", "aprl")])
+        """
+        by_operator = collections.OrderedDict()
+        for operator, varname in jobs:
+            if operator not in OPERATORS:
+                raise ValueError(
+                    "Unknown analysis %s, use one of %s"
+                    % (operator, ", ".join(OPERATORS))
+                )
+            by_operator.setdefault(operator, []).append(varname)
+        # Looking up the files may ask which component to use, so it is done
+        # once per variable before any thread starts:
+        located = collections.OrderedDict()
+        for varnames in by_operator.values():
+            for varname in varnames:
+                if varname not in located:
+                    located[varname] = self.get_component_for_variable_short_name(
+                        varname
+                    )
+        keys = []
+        tasks = []
+        for operator, varnames in by_operator.items():
+            operator_located = collections.OrderedDict(
+                (varname, located[varname]) for varname in varnames
+            )
+            if operator == "newest_climatology":
+                # Each climatology finds its own (most recent) files:
+                groups = [
+                    (component, flist, [varname])
+                    for varname, (flist, component) in operator_located.items()
+                ]
+            else:
+                groups = self._group_by_stream(operator_located)
+            for component, flist, group in groups:
+                keys.append(operator)
+                tasks.append(
+                    (
+                        component.THREAD_SAFE,
+                        functools.partial(
+                            self._apply_to_group, operator, component, flist, group
+                        ),
+                    )
+                )
+        logging.info("Running %s analyses of %s variables", len(tasks), len(located))
+        results = collections.OrderedDict(
+            (operator, collections.OrderedDict()) for operator in by_operator
+        )
+        for operator, group_results in zip(
+            keys, self._run_concurrently(tasks, max_workers)
+        ):
+            results[operator].update(group_results)
+        return results
+
     # Some common operations. If a specific model needs to do this in a
     # different way, you can overload the methods (e.g. FESOM needs to do
     # weighting of the triangles to get correct fldmean)
-    def fldmean(self, varname):
+    #
+    # All of them also accept a list of variable names, and then return a
+    # dictionary of results; see ``_for_each_stream``.
+    @profiling.timed
+    def fldmean(self, varname, **kwargs):
         """
         Generates a field mean over the entire model domain for a the specified varname.
+
+        Further keyword arguments (e.g. ``incremental=True``) are passed on to
+        the component's ``fldmean``.
         """
+        if not isinstance(varname, str):
+            return self._for_each_stream("fldmean", varname, **kwargs)
         flist, component = self.get_component_for_variable_short_name(varname)
-        return component.fldmean(varname, flist)
+        return component.fldmean(varname, flist, **kwargs)
+
+    @profiling.timed
+    def yearmean(self, varname, **kwargs):
+        """
+        Generates a yearly mean for the specified varname.
 
+        Further keyword arguments (e.g. ``incremental=True``) are passed on to
+        the component's ``yearmean``.
+        """
+        if not isinstance(varname, str):
+            return self._for_each_stream("yearmean", varname, **kwargs)
+        flist, component = self.get_component_for_variable_short_name(varname)
+        return component.yearmean(varname, flist, **kwargs)
+
+    @profiling.timed
     def ymonmean(self, varname):
         """
         Generates a ymonmean over the entire model domain for the specified varname.
         """
+        if not isinstance(varname, str):
+            return self._for_each_stream("ymonmean", varname)
         flist, component = self.get_component_for_variable_short_name(varname)
         return component.ymonmean(varname, flist)
 
+    @profiling.timed
     def yseasmean(self, varname):
         """
         Generates a yseasmean over the entire model domain for the specified varname.
         """
+        if not isinstance(varname, str):
+            return self._for_each_stream("yseasmean", varname)
         flist, component = self.get_component_for_variable_short_name(varname)
         return component.yseasmean(varname, flist)
 
+    @profiling.timed
+    def timmean(self, varname):
+        """
+        Generates a time mean over all output for the specified varname.
+        """
+        if not isinstance(varname, str):
+            return self._for_each_stream("timmean", varname)
+        flist, component = self.get_component_for_variable_short_name(varname)
+        return component.timmean(varname, flist)
+
+    @profiling.timed
+    def ymonstd(self, varname):
+        """
+        Generates the standard deviation of each calendar month for the
+        specified varname.
+        """
+        if not isinstance(varname, str):
+            return self._for_each_stream("ymonstd", varname)
+        flist, component = self.get_component_for_variable_short_name(varname)
+        return component.ymonstd(varname, flist)
+
+    @profiling.timed
+    def reductions(self, varname, operators=None):
+        """
+        Generates several reductions (by default fldmean, yearmean, ymonmean,
+        yseasmean and timmean) of the specified varname from a single read of
+        the model output.
+
+        Parameters
+        ----------
+        varname : str or list
+            The variable name, or a list of variable names
+        operators : list of str, optional
+            The reductions to make; by default, the component decides.
+
+        Returns
+        -------
+        dict
+            The output of each operator. For a list of variable names, a
+            dictionary of these for each variable.
+        """
+        kwargs = {} if operators is None else {"operators": operators}
+        if not isinstance(varname, str):
+            return self._for_each_stream("reductions", varname, **kwargs)
+        flist, component = self.get_component_for_variable_short_name(varname)
+        return component.reductions(varname, flist, **kwargs)
+
+    @profiling.timed
     def newest_climatology(self, varname):
+        if not isinstance(varname, str):
+            return self.run([("newest_climatology", v) for v in varname])[
+                "newest_climatology"
+            ]
         _, component = self.get_component_for_variable_short_name(varname)
         return component.newest_climatology(varname)
@@ -0,0 +1,356 @@
+"""
+Catalog of the experiments below project directories.
+
+An experiment is a directory with a ``.top_of_exp_tree`` file. Finding one
+used to mean walking up from the current directory, or typing its full
+path. ``scan`` instead walks down from project roots such as
+``/work/ab0123`` with a pool of threads, each listing one directory with
+``os.scandir`` at a time. It does not descend into experiments (their
+``outdata``, ``restart`` and run directories hold most of the files), nor
+into directories named as in ``PRUNED_DIRS`` or hidden directories (e.g.
+``.snapshot``).
+
+The ``ExperimentCatalog`` keeps what was found in an SQLite database: the
+path, ``EXP_ID``, components and ``.top_of_exp_tree`` configuration of each
+experiment. Fill it with::
+
+    $ esm_analysis experiments scan /work/ab0123 /work/cd4567
+
+after which experiments can be given by their ID, e.g. as
+``EsmAnalysis(exp_base="LGM_011")`` or ``esm_analysis batch -e PI -e LGM``,
+see ``resolve_experiment``. The catalog is ``$ESM_ANALYSIS_EXPERIMENTS``, or
+``esm_analysis/experiments.sqlite`` in ``$XDG_CACHE_HOME`` (``~/.cache``).
+"""
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import profiling
+
+MARKER = ".top_of_exp_tree"
+"""The file marking the top of an experiment"""
+
+PRUNED_DIRS = ("outdata", "restart")
+"""Directories which are never searched for experiments"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    path TEXT PRIMARY KEY,
+    exp_id TEXT NOT NULL,
+    components TEXT NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_by_id ON experiments (exp_id);
+"""
+
+Experiment = collections.namedtuple(
+    "Experiment", ["exp_id", "path", "components", "config"]
+)
+Experiment.__doc__ = """
+An experiment found by ``scan``
+
+``components`` are the directories in its ``outdata``, ``config`` is the
+contents of its ``.top_of_exp_tree`` file.
+"""
+
+
+def default_catalog_path():
+    """The experiment catalog of the current user"""
+    return os.environ.get("ESM_ANALYSIS_EXPERIMENTS") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "esm_analysis",
+        "experiments.sqlite",
+    )
+
+
+def find_top_of_tree(path):
+    """
+    The experiment ``path`` is in, by looking for ``.top_of_exp_tree`` in
+    ``path`` and each of its parents
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str or None
+        The top of the experiment, or ``None`` if ``path`` is not in one
+    """
+    path = os.path.realpath(path)
+    while True:
+        if os.path.isfile(os.path.join(path, MARKER)):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _list_dir(path, prune):
+    """
+    Whether ``path`` is an experiment, and otherwise the directories in it
+    which need to be searched
+    """
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == MARKER:
+                    return path, True, []
+                if (
+                    entry.name.startswith(".")
+                    or entry.name in prune
+                    or not entry.is_dir(follow_symlinks=False)
+                ):
+                    continue
+                subdirs.append(entry.path)
+    except OSError as error:
+        logging.debug("Cannot search %s: %s", path, error)
+    return path, False, subdirs
+
+
+@profiling.timed
+def scan(roots, max_workers=None, prune=PRUNED_DIRS):
+    """
+    Finds all experiments in ``roots`` and the directories below them
+
+    Parameters
+    ----------
+    roots : list of str
+        Where to search, e.g. project directories
+    max_workers : int, optional
+        Number of directories listed at the same time. Listing directories
+        mostly waits for the file system, so by default 4 per CPU (at most
+        32) are used.
+    prune : iterable of str
+        Names of directories which are not searched
+
+    Returns
+    -------
+    list of str
+        The (absolute) paths of the experiments, sorted
+    """
+    if max_workers is None:
+        max_workers = min(32, 4 * (os.cpu_count() or 1))
+    prune = frozenset(prune)
+    experiments = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {
+            pool.submit(_list_dir, os.path.abspath(root), prune) for root in roots
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, is_experiment, subdirs = future.result()
+                if is_experiment:
+                    experiments.append(path)
+                pending.update(pool.submit(_list_dir, d, prune) for d in subdirs)
+    return sorted(experiments)
+
+
+def read_config(path):
+    """
+    The configuration in the ``.top_of_exp_tree`` file of the experiment
+    ``path``, or an empty dictionary if it cannot be read
+    """
+    import yaml
+
+    try:
+        with open(os.path.join(path, MARKER)) as f:
+            # The first line is not always a comment, see clean_top_of_tree:
+            lines = ["# " + line if line.startswith("Top of") else line for line in f]
+        config = yaml.load("".join(lines), Loader=yaml.SafeLoader)
+    except (OSError, yaml.YAMLError) as error:
+        logging.warning("Cannot read the configuration of %s: %s", path, error)
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def describe(path):
+    """The ``Experiment`` at ``path``"""
+    outdata = os.path.join(path, "outdata")
+    try:
+        with os.scandir(outdata) as entries:
+            components = sorted(entry.name for entry in entries if entry.is_dir())
+    except OSError:
+        components = []
+    return Experiment(os.path.basename(path), path, components, read_config(path))
+
+
+class ExperimentCatalog(object):
+    """
+    SQLite index of experiments, by path and ``EXP_ID``
+
+    Parameters
+    ----------
+    db_path : str, optional
+        Where the SQLite database is stored, by default
+        ``default_catalog_path()``. It is created if it does not exist yet.
+
+    The catalog can be used from several threads; its methods take turns.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_catalog_path()
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Closes the underlying database connection"""
+        self._conn.close()
+
+    @profiling.timed
+    def update(self, roots, max_workers=None, prune=PRUNED_DIRS):
+        """
+        Scans ``roots`` again, and replaces what the catalog knew about them
+
+        Experiments which were found below one of the ``roots`` before, but
+        not anymore, are removed from the catalog.
+
+        Parameters
+        ----------
+        roots : list of str
+        max_workers, prune
+            See ``scan``
+
+        Returns
+        -------
+        list of Experiment
+            The experiments found
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            experiments = list(
+                pool.map(describe, scan(roots, max_workers=max_workers, prune=prune))
+            )
+        rows = [
+            (
+                experiment.path,
+                experiment.exp_id,
+                json.dumps(experiment.components),
+                json.dumps(experiment.config, default=str),
+            )
+            for experiment in experiments
+        ]
+        with self._lock, self._conn:
+            for root in roots:
+                # A root inside another one is found again as part of it:
+                self._conn.execute(
+                    "DELETE FROM experiments WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                    (root, _like_prefix(root)),
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO experiments "
+                "(path, exp_id, components, config) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        logging.info("Found %s experiments in %s", len(rows), ", ".join(roots))
+        return experiments
+
+    def lookup(self, exp_id):
+        """
+        The experiments called ``exp_id``
+
+        Parameters
+        ----------
+        exp_id : str
+
+        Returns
+        -------
+        list of Experiment
+            Sorted by path; there may be several experiments with the same
+            ID in different projects.
+        """
+        return self._query("WHERE exp_id = ? ORDER BY path", (exp_id,))
+
+    def experiments(self, root=None):
+        """
+        All experiments in the catalog, or those below ``root``
+
+        Returns
+        -------
+        list of Experiment
+            Sorted by path
+        """
+        if root is None:
+            return self._query("ORDER BY path", ())
+        root = os.path.abspath(root)
+        return self._query(
+            "WHERE path = ? OR path LIKE ? ESCAPE '\\' ORDER BY path",
+            (root, _like_prefix(root)),
+        )
+
+    def _query(self, condition, params):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT exp_id, path, components, config FROM experiments " + condition,
+                params,
+            ).fetchall()
+        return [
+            Experiment(exp_id, path, json.loads(components), json.loads(config))
+            for exp_id, path, components, config in rows
+        ]
+
+
+def _like_prefix(root):
+    """A LIKE pattern matching everything below ``root``"""
+    prefix = root.rstrip(os.sep) + os.sep
+    for character in "\\%_":
+        prefix = prefix.replace(character, "\\" + character)
+    return prefix + "%"
+
+
+def resolve_experiment(exp_base, db_path=None):
+    """
+    The path of the experiment ``exp_base``
+
+    Parameters
+    ----------
+    exp_base : str
+        The path of an experiment, or its ``EXP_ID`` as found by
+        ``esm_analysis experiments scan``
+    db_path : str, optional
+        The experiment catalog, by default ``default_catalog_path()``
+
+    Returns
+    -------
+    str
+        ``exp_base`` itself if it is a directory, otherwise the path of the
+        experiment with this ID
+
+    Raises
+    ------
+    ValueError
+        If ``exp_base`` is neither a directory nor the ID of exactly one
+        experiment in the catalog
+    """
+    if os.path.isdir(exp_base):
+        return exp_base
+    db_path = db_path or default_catalog_path()
+    found = []
+    if os.sep not in exp_base and os.path.isfile(db_path):
+        catalog = ExperimentCatalog(db_path)
+        try:
+            found = catalog.lookup(exp_base)
+        finally:
+            catalog.close()
+    if not found:
+        raise ValueError(
+            "%s is neither a directory nor a known experiment (see "
+            "esm_analysis experiments scan)" % exp_base
+        )
+    if len(found) > 1:
+        raise ValueError(
+            "There are several experiments called %s, give one of: %s"
+            % (exp_base, ", ".join(experiment.path for experiment in found))
+        )
+    return found[0].path
@@ -1,9 +1,237 @@
 """
 Class for Logfiles
+
+Two formats of experiment logfiles are understood, each line saying when a
+run changed its state. Written by the ESM tools (``esm_style``)::
+
+    Wed Mar 20 10:25:20 2019 : 1 18500101 4711234 - start
+
+and by the MPI-Met run scripts::
+
+    Wed Mar 20 10:25:20 2019 :  1 18500101 4711234 -  start
+
+Both are parsed by ``parse_log``, with one compiled regular expression per
+format. The matches are converted block by block into typed columns: dates
+as written by ``date`` are decoded with array arithmetic, the run number is
+an integer and the state categorical. Even logs with millions of lines are
+thus parsed quickly and without much memory, see
+``benchmarks/bench_logfile.py``.
+
+A ``Logfile`` read with ``Logfile.from_file`` remembers how far the file was
+parsed. For a running experiment, ``Logfile.update`` then only parses the
+lines appended since, and the run statistics are updated from these::
+
+    >>> log = Logfile.from_file("EXP_compute.log")
+    >>> log.update()  # later
+    3
+    >>> log.run_stats()
 """
 import datetime
+import glob
+import itertools
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+from . import profiling
+from .batch import find_experiments
+
+BLOCK_CHARACTERS = 4 * 1024**2
+"""Approximate amount of text matched and converted at once"""
+
+DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
+"""The format of the dates in the logfiles, as written by ``date``"""
+
+_ESM_LINE = re.compile(
+    r"^(?P<date>.*?) : [ \t]*(?P<run>\d+)[ \t]+(?P<exp_date>\S+)[ \t]+"
+    r"(?P<job_id>\S+)[ \t]+\S+[ \t]+(?P<state>\S+)[ \t]*\r?$",
+    re.MULTILINE,
+)
+_MPIMET_LINE = re.compile(
+    r"^(?P<date>.*?) :  [ \t]*(?P<run>\d+)[ \t]+(?P<exp_date>\S+)[ \t]+"
+    r"(?P<job_id>\S+)[ \t]* -(?P<state>.*?)\r?$",
+    re.MULTILINE,
+)
+# The positions of the fields in dates like "Wed Mar  6 10:25:20 2019", and
+# the months by the character codes of their abbreviation:
+_DAY, _HOUR, _MINUTE, _SECOND, _YEAR = (8, 10), (11, 13), (14, 16), (17, 19), (20, 24)
+_DIGITS = [9, 11, 12, 14, 15, 17, 18, 20, 21, 22, 23]
+_MONTH_KEYS = np.array(
+    [
+        ord(name[0]) * 2**16 + ord(name[1]) * 2**8 + ord(name[2])
+        for name in ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        + ["Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    ]
+)
+RUN_STATISTICS = [
+    "Mean Walltime",
+    "Mean Queuing Time",
+    "Optimal Throughput",
+    "Actual Throughput (Last 10 Runs)",
+    "Run Efficiency (Last 10 Runs)",
+]
+"""The statistics given by ``Logfile.run_stats``"""
+
+_ESM_COLUMNS = ["Run Number", "Exp Date", "Job ID", "State"]
+_MPIMET_COLUMNS = ["State", "Run Number", "Exp Date", "Job ID"]
+
+
+def _blocks(text, size, start=0):
+    """
+    Splits ``text`` into pieces of about ``size`` characters, at newlines.
+    Bytes are decoded piece by piece.
+    """
+    newline = b"\n" if isinstance(text, bytes) else "\n"
+    while start < len(text):
+        end = text.find(newline, start + size)
+        end = len(text) if end < 0 else end + 1
+        block = text[start:end]
+        yield block.decode() if isinstance(block, bytes) else block
+        start = end
+
+
+def _integers(strings):
+    return np.fromiter(map(int, strings), np.int64, len(strings))
+
+
+def _shared(strings):
+    """``strings`` as an object array, in which equal strings are one object"""
+    codes, uniques = pd.factorize(np.array(strings, dtype=object))
+    return np.asarray(uniques, dtype=object).take(codes)
+
+
+def _number(codes, columns):
+    """The number in ``columns`` of the character ``codes`` (spaces as 0)"""
+    value = np.zeros(len(codes), dtype=np.int64)
+    for column in range(*columns):
+        digit = codes[:, column] - ord("0")
+        value = value * 10 + np.where(codes[:, column] == ord(" "), 0, digit)
+    return value
+
+
+def _date_unit():
+    """The resolution of dates parsed by pandas (which depends on the version)"""
+    return np.datetime_data(pd.to_datetime(["1970-01-01 00:00:00"]).dtype)[0]
+
+
+def _to_datetime(dates):
+    """
+    Converts the dates of a logfile to ``datetime64``.
+
+    Dates in ``DATE_FORMAT`` are decoded from the codes of their characters
+    with array arithmetic, other dates are left to ``pd.to_datetime``, one
+    by one.
+    """
+    unit = _date_unit()
+    strings = np.array(dates, dtype=str)
+    result = np.full(len(strings), np.datetime64("NaT"), dtype="M8[%s]" % unit)
+    fixed = np.char.str_len(strings) == 24
+    codes = strings[fixed].astype("U24").view(np.uint32).reshape(-1, 24)
+    codes = codes.astype(np.int64)
+    keys = codes[:, 4] * 2**16 + codes[:, 5] * 2**8 + codes[:, 6]
+    is_month = keys[:, np.newaxis] == _MONTH_KEYS
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    valid = (
+        is_month.any(axis=1)
+        & is_digit[:, _DIGITS].all(axis=1)
+        & (is_digit[:, 8] | (codes[:, 8] == ord(" ")))
+        & (codes[:, [3, 7, 10, 19]] == ord(" ")).all(axis=1)
+        & (codes[:, [13, 16]] == ord(":")).all(axis=1)
+    )
+    months = is_month.argmax(axis=1) + 1
+    codes, months = codes[valid], months[valid]
+    days = (
+        (_number(codes, _YEAR) - 1970).astype("M8[Y]") + (months - 1).astype("m8[M]")
+    ).astype("M8[D]") + (_number(codes, _DAY) - 1).astype("m8[D]")
+    seconds = (
+        _number(codes, _HOUR) * 3600
+        + _number(codes, _MINUTE) * 60
+        + _number(codes, _SECOND)
+    )
+    fixed[fixed] = valid
+    result[fixed] = days + seconds.astype("m8[s]")
+    if not fixed.all():
+        # FIXME: This needs a context manager to try different locales
+        others = pd.to_datetime(list(strings[~fixed]), format="mixed")
+        result[~fixed] = others.as_unit(unit)
+    return result
+
+
+def _concat(frames):
+    """Concatenates log dataframes, keeping ``State`` categorical"""
+    categories = frames[0]["State"].cat.categories
+    for frame in frames[1:]:
+        categories = categories.union(frame["State"].cat.categories)
+    return pd.concat(
+        [
+            frame.assign(State=frame["State"].cat.set_categories(categories))
+            for frame in frames
+        ]
+    )
+
+
+def parse_log(log, esm_style=True, header=True):
+    """
+    Parses the lines of a logfile into a dataframe
+
+    Lines which do not describe a run (such as ``# Experiment over``) are
+    skipped.
+
+    Parameters
+    ----------
+    log : str, bytes or list of str
+        The text of the logfile (UTF-8 encoded, if bytes), or its lines
+    esm_style : bool
+        ``True`` for logfiles of the ESM tools, ``False`` for those of the
+        MPI-Met run scripts
+    header : bool
+        If the first line is a header (``Start of Experiment``), which is
+        skipped
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by ``Date``, with the columns ``Run Number`` (integer),
+        ``Exp Date``, ``Job ID`` and ``State`` (categorical)
+    """
+    text = log if isinstance(log, (str, bytes)) else "".join(log)
+    start = 0
+    if header:
+        start = text.find(b"\n" if isinstance(text, bytes) else "\n") + 1 or len(text)
+    pattern, columns = (
+        (_ESM_LINE, _ESM_COLUMNS) if esm_style else (_MPIMET_LINE, _MPIMET_COLUMNS)
+    )
+    dates, runs, exp_dates, job_ids, states = [], [], [], [], []
+    for block in _blocks(text, BLOCK_CHARACTERS, start):
+        matches = pattern.findall(block)
+        if not matches:
+            continue
+        fields = dict(zip(pattern.groupindex, zip(*matches)))
+        del matches
+        dates.append(_to_datetime(fields["date"]))
+        runs.append(_integers(fields["run"]))
+        exp_dates.append(_shared(fields["exp_date"]))
+        job_ids.append(_shared(fields["job_id"]))
+        states.append(pd.Categorical(fields["state"]))
+    if not runs:
+        dates = [np.array([], dtype="M8[%s]" % _date_unit())]
+        runs, states = [np.array([], dtype=np.int64)], [pd.Categorical([])]
+        exp_dates = job_ids = [np.array([], dtype=object)]
+    return pd.DataFrame(
+        {
+            "Run Number": np.concatenate(runs),
+            "Exp Date": np.concatenate(exp_dates),
+            "Job ID": np.concatenate(job_ids),
+            "State": union_categoricals(states, sort_categories=True),
+        },
+        index=pd.DatetimeIndex(np.concatenate(dates), name="Date"),
+        columns=columns,
+    )
 
 
 class Logfile(object):
@@ -11,82 +239,151 @@ class Logfile(object):
 
     def __init__(self, log, esm_style=True):
         self.log = log
+        self.esm_style = esm_style
         if esm_style:
             self.log_df = self._generate_dataframe_from_esm_logfile()
         else:
             self.log_df = self._generate_dataframe_from_mpimet_logfile()
         del self.log
+        self._runs = self._run_times(self.log_df)
+        # Set by from_file, for update:
+        self.fname = None
+        self.offset = 0
+
+    def _generate_dataframe_from_esm_logfile(self, header=True):
+        return parse_log(self.log, esm_style=True, header=header)
+
+    def _generate_dataframe_from_mpimet_logfile(self, header=True):
+        return parse_log(self.log, esm_style=False, header=header)
+
+    @staticmethod
+    def _complete_lines(data):
+        """The complete (newline terminated) lines in the bytes ``data``, and
+        their length"""
+        length = data.rfind(b"\n") + 1
+        return data[:length], length
+
+    @classmethod
+    @profiling.timed
+    def from_file(cls, fin, esm_style=True):
+        """
+        Reads the logfile ``fin``
+
+        Only complete lines are parsed; a line which is still being written
+        is picked up by the next ``update``.
+        """
+        with open(fin, "rb") as f:
+            log, offset = cls._complete_lines(f.read())
+        logfile = cls(log, esm_style=esm_style)
+        logfile.fname, logfile.offset = fin, offset
+        return logfile
+
+    @profiling.timed
+    def update(self):
+        """
+        Parses the lines appended to the file since it was last read.
+
+        The file is read from the byte offset where parsing stopped, and the
+        new rows are added to ``log_df`` and the run times. If the file got
+        shorter in the meantime (e.g. it was replaced), it is read again
+        from the beginning.
+
+        Returns
+        -------
+        int
+            The number of new rows
+        """
+        if self.fname is None:
+            raise ValueError("Only a Logfile read with from_file can be updated")
+        with open(self.fname, "rb") as f:
+            if os.fstat(f.fileno()).st_size < self.offset:
+                fresh = self.from_file(self.fname, esm_style=self.esm_style)
+                self.__dict__.update(fresh.__dict__)
+                return len(self.log_df)
+            f.seek(self.offset)
+            self.log, length = self._complete_lines(f.read())
+        if not self.log:
+            del self.log
+            return 0
+        # The header is only there if nothing was read before:
+        header = self.offset == 0
+        if self.esm_style:
+            new_df = self._generate_dataframe_from_esm_logfile(header=header)
+        else:
+            new_df = self._generate_dataframe_from_mpimet_logfile(header=header)
+        del self.log
+        self.offset += length
+        if new_df.empty:
+            return 0
+        self.log_df = _concat([self.log_df, new_df]) if len(self.log_df) else new_df
+        self._runs = self._merge_run_times(self._runs, self._run_times(new_df))
+        return len(new_df)
 
-    def _generate_dataframe_from_esm_logfile(self):
-        df = pd.DataFrame(
-            [l.split(" : ") for l in self.log], columns=["Date", "Message"]
+    @staticmethod
+    def _run_times(log_df):
+        """
+        The last start and the first and last done time of each run in
+        ``log_df``, indexed by ``Run Number``
+        """
+        events = pd.DataFrame(
+            {
+                "Run Number": log_df["Run Number"].astype(int).values,
+                "Time": pd.DatetimeIndex(log_df.index).values,
+            }
         )
-        df2 = df["Message"].str.split(expand=True)
-        # We drop the first row since it says "Start of Experiment"
-        log_df = pd.concat([df[1:]["Date"], df2[1:]], axis=1)
-
-        # Checks if Experiment over is in last row and drops it if needed:
-        lastrow = df2.tail(1)
-        if "Experimentover" in str(lastrow).replace(" ", ""):
-            log_df = log_df.head(-1)
-
-        log_df.columns = [
-            "Date",
-            "Run Number",
-            "Exp Date",
-            "Job ID",
-            "Seperator",
-            "State",
-        ]
-        log_df.drop("Seperator", axis=1, inplace=True)
-        log_df.set_index("Date", inplace=True)
-        log_df.index = pd.to_datetime(log_df.index)
-        return log_df
-
-    def _generate_dataframe_from_mpimet_logfile(self):
-        log_df = pd.read_table(
-            self.log,
-            sep=r" :  | -",
-            skiprows=1,
-            infer_datetime_format=True,
-            names=["Date", "Message", "State"],
-            engine="python",
-            index_col=0,
+        is_start = log_df.State.str.contains("start", na=False).values
+        is_done = log_df.State.str.contains("done", na=False).values
+        starts = (
+            events[is_start]
+            .drop_duplicates(subset="Run Number", keep="last")
+            .set_index("Run Number")["Time"]
         )
-        middle_column = log_df["Message"].apply(lambda x: pd.Series(str(x).split()))
-        log_df.drop("Message", axis=1, inplace=True)
-        middle_column.columns = ["Run Number", "Exp Date", "Job ID"]
-        log_df = pd.concat([log_df, middle_column], axis=1)
-        # FIXME: This needs a context manager to try different locales
-        log_df.set_index(pd.to_datetime(log_df.index), inplace=True)
-        return log_df
+        dones = events[is_done].groupby("Run Number")["Time"]
+        return pd.DataFrame(
+            {"Start": starts, "First Done": dones.first(), "Last Done": dones.last()}
+        ).sort_index()
 
-    @classmethod
-    def from_file(cls, fin):
-        with open(fin) as f:
-            log = f.readlines()
-        return cls(log)
+    @staticmethod
+    def _merge_run_times(runs, new_runs):
+        """Run times from the earlier ``runs`` and the later ``new_runs``"""
+        return pd.DataFrame(
+            {
+                "Start": new_runs["Start"].combine_first(runs["Start"]),
+                "First Done": runs["First Done"].combine_first(new_runs["First Done"]),
+                "Last Done": new_runs["Last Done"].combine_first(runs["Last Done"]),
+            }
+        ).sort_index()
 
     def compute_throughput(self):
-        starts = self.log_df[self.log_df.State.str.contains("start")]
-        ends = self.log_df[self.log_df.State.str.contains("done")]
-        # Drop the duplicated starts:
-        starts.drop_duplicates(subset="Run Number", keep="last", inplace=True)
-        merged = pd.concat([starts, ends])
-        groupby = merged.groupby("Run Number")
-        run_diffs = {"Run Number": [], "Wall Time": [], "Queue Time": []}
-        for name, group in groupby:
-            if int(name) > 1:
-                previous_group = groupby.get_group(str(int(name) - 1))
-                run_diffs["Queue Time"].append(
-                    group.index[0] - previous_group.index[-1]
-                )
-            else:
-                run_diffs["Queue Time"].append(datetime.timedelta(0))
-            run_diffs["Run Number"].append(int(name))
-            run_diffs["Wall Time"].append(group.index[-1] - group.index[0])
-        diffs = (
-            pd.DataFrame(run_diffs).sort_values("Run Number").set_index("Run Number")
+        """
+        Computes the wall time and queuing time of each run.
+
+        The times are computed column-wise on all runs at once, from the
+        start and done time of each run (which ``update`` keeps up to date),
+        and the queuing time is the difference to the previous run's done
+        time.
+        If a run was started several times, only the last start counts. Runs
+        missing in the log get no row, and the run after them has no
+        queuing time (``NaT``).
+
+        Returns
+        -------
+        tuple
+            The mean wall and queuing time (as ``pd.DataFrame``), the
+            throughput (simulated runs per day), and the wall and queuing time
+            of each run, indexed by ``Run Number``.
+        """
+        runs = self._runs.index
+        # A run begins with its (last) start, or its first done if it was
+        # never started; it ends with its last done, or its start if it is
+        # not done yet:
+        begin = self._runs["Start"].fillna(self._runs["First Done"])
+        end = self._runs["Last Done"].fillna(self._runs["Start"])
+        queue_time = begin - end.reindex(runs - 1).values
+        queue_time[runs <= 1] = datetime.timedelta(0)
+        diffs = pd.DataFrame(
+            {"Wall Time": end - begin, "Queue Time": queue_time},
+            index=pd.Index(runs, name="Run Number"),
         )
         throughput = (datetime.timedelta(1) / diffs.mean())["Wall Time"]
         return pd.DataFrame({"Simulation Average": diffs.mean()}), throughput, diffs
@@ -111,3 +408,119 @@ class Logfile(object):
             # columns=["Run Statistics"],
         )
         return df
+
+
+def find_logfiles(paths):
+    """
+    The logfiles of the experiments in ``paths``
+
+    Parameters
+    ----------
+    paths : list of str
+        Experiments (directories with a ``.top_of_exp_tree`` file), their
+        IDs, or directories containing experiments, see
+        ``esm_analysis.batch.find_experiments``
+
+    Returns
+    -------
+    list of str
+        The ``scripts/<EXP_ID>_*.log`` files of each experiment
+    """
+    fnames = []
+    for experiment in find_experiments(paths):
+        exp_id = os.path.basename(os.path.normpath(experiment))
+        pattern = os.path.join(experiment, "scripts", exp_id + "_*.log")
+        fnames.extend(sorted(glob.glob(pattern)))
+    return fnames
+
+
+def _read_logfile(fname, esm_style=True):
+    """``Logfile.from_file``, or ``None`` if ``fname`` cannot be parsed"""
+    try:
+        return Logfile.from_file(fname, esm_style=esm_style)
+    except Exception as error:
+        logging.warning("Cannot parse %s: %s", fname, error)
+        return None
+
+
+def read_logfiles(fnames, esm_style=True, max_workers=None):
+    """
+    Reads many logfiles at once, in a pool of processes
+
+    Parameters
+    ----------
+    fnames : list of str
+    esm_style : bool
+    max_workers : int, optional
+        By default ``ESM_ANALYSIS_MAX_WORKERS``, or the number of CPUs
+
+    Returns
+    -------
+    list
+        A ``Logfile`` for each of ``fnames``, or ``None`` for logfiles which
+        could not be parsed
+    """
+    fnames = list(fnames)
+    if max_workers is None:
+        max_workers = int(
+            os.environ.get("ESM_ANALYSIS_MAX_WORKERS", os.cpu_count() or 1)
+        )
+    workers = min(max_workers, len(fnames))
+    if workers <= 1:
+        return [_read_logfile(fname, esm_style) for fname in fnames]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(_read_logfile, fnames, itertools.repeat(esm_style), chunksize=1)
+        )
+
+
+def combine_run_stats(logs, sort_by=None, ascending=True):
+    """
+    The ``run_stats`` of several logfiles, in one table
+
+    Parameters
+    ----------
+    logs : dict
+        A ``Logfile`` for each label, e.g. the file name. Logfiles without
+        any runs (or ``None``) give an empty row.
+    sort_by : str, optional
+        A column of ``Logfile.run_stats``, or a unique part of its name
+        (ignoring case), e.g. ``efficiency``
+    ascending : bool
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per logfile, one column per statistic
+    """
+    rows = {
+        label: (
+            log.run_stats()[0]
+            if log is not None and not log.log_df.empty
+            else pd.Series(dtype=object)
+        )
+        for label, log in logs.items()
+    }
+    table = pd.DataFrame.from_dict(rows, orient="index", columns=RUN_STATISTICS)
+    # Empty rows are dropped by from_dict:
+    table = table.infer_objects().reindex(list(logs))
+    table.index.name = "Logfile"
+    if sort_by is not None:
+        table = table.sort_values(run_statistic(sort_by), ascending=ascending)
+    return table
+
+
+def run_statistic(name):
+    """
+    The column of ``Logfile.run_stats`` called ``name``, or containing it
+    (ignoring case)
+    """
+    if name in RUN_STATISTICS:
+        return name
+    matches = [column for column in RUN_STATISTICS if name.lower() in column.lower()]
+    if len(matches) != 1:
+        raise ValueError(
+            "%s does not name exactly one of the statistics %s"
+            % (name, ", ".join(RUN_STATISTICS))
+        )
+    return matches[0]
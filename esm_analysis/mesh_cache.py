@@ -0,0 +1,252 @@
+"""
+On-disk cache of FESOM meshes as memory-mappable NumPy arrays.
+
+Reading a FESOM mesh with ``pyfesom.load_mesh`` means parsing the ASCII
+``nod2d.out``/``elem2d.out``/``aux3d.out`` files and rotating all coordinates,
+which is slow and memory hungry for large meshes. The ``MeshCache`` stores the
+arrays of a loaded mesh (node coordinates, element connectivity, level
+information, ...) together with the node (cluster) areas as ``.npy`` files.
+Later processes memory-map these files instead of parsing the mesh again.
+
+Each cache entry is keyed on the mesh directory, the sizes and modification
+times of the files in it, and the rotation angles ``abg``; changing any of
+them automatically leads to a new entry. Entries are written to a temporary
+directory which is atomically renamed into place, so several users can
+safely share one cache directory (e.g. in a project's work space).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+"""Earth radius in meters, used for the node areas"""
+
+_META_FILE = "meta.json"
+
+
+def default_mesh_cache_dir():
+    """
+    The mesh cache directory, ``$ESM_ANALYSIS_MESH_CACHE`` if set, or
+    ``~/.cache/esm_analysis/meshes`` otherwise.
+    """
+    return os.environ.get(
+        "ESM_ANALYSIS_MESH_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "esm_analysis", "meshes"),
+    )
+
+
+def mesh_cache_key(mesh_dir, abg):
+    """
+    Determines the cache key of a mesh.
+
+    Parameters
+    ----------
+    mesh_dir : str
+        The mesh directory
+    abg : list
+        The rotation angles (alpha, beta, gamma) the mesh is loaded with
+
+    Returns
+    -------
+    str
+        A hex digest of the real path of ``mesh_dir``, the name, size and
+        modification time of every file in it, and ``abg``.
+    """
+    mesh_dir = os.path.realpath(mesh_dir)
+    sha = hashlib.sha1()
+    sha.update(mesh_dir.encode())
+    sha.update(json.dumps([float(angle) for angle in abg]).encode())
+    with os.scandir(mesh_dir) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            sha.update(
+                ("%s:%s:%s" % (entry.name, stat.st_size, stat.st_mtime_ns)).encode()
+            )
+    return sha.hexdigest()
+
+
+def compute_node_areas(x2, y2, elem, earth_radius=EARTH_RADIUS):
+    """
+    Computes the area of the (median dual) cluster around each mesh node.
+
+    Each triangle contributes one third of its area to each of its three
+    nodes. Triangles are treated as planar after scaling longitudes by the
+    cosine of the triangle's mean latitude; triangles crossing the dateline
+    are handled by wrapping longitude differences into [-180, 180).
+
+    Parameters
+    ----------
+    x2, y2 : np.ndarray
+        Node longitudes and latitudes in degrees
+    elem : np.ndarray
+        Zero-based element connectivity, shape ``(n_elements, 3)``
+    earth_radius : float
+        Radius of the sphere, in meters
+
+    Returns
+    -------
+    np.ndarray
+        The area of each node in square meters.
+    """
+    elem = np.asarray(elem)
+    lon = np.radians(np.asarray(x2, dtype=float))[elem]
+    lat = np.radians(np.asarray(y2, dtype=float))[elem]
+    dlon = lon[:, 1:] - lon[:, :1]
+    dlon = (dlon + np.pi) % (2 * np.pi) - np.pi
+    dlon *= np.cos(lat.mean(axis=1))[:, np.newaxis]
+    dlat = lat[:, 1:] - lat[:, :1]
+    triangle_areas = (
+        0.5
+        * np.abs(dlon[:, 0] * dlat[:, 1] - dlat[:, 0] * dlon[:, 1])
+        * earth_radius**2
+    )
+    return np.bincount(
+        elem.ravel(), weights=np.repeat(triangle_areas / 3.0, 3), minlength=len(x2)
+    )
+
+
+class CachedMesh(object):
+    """
+    A FESOM mesh read back from the ``MeshCache``.
+
+    All array attributes of the originally loaded mesh (e.g. ``x2``, ``y2``,
+    ``elem``, ``zlevs``) are available as read-only memory maps; scalar
+    attributes (e.g. ``n2d``, ``e2d``) are restored as they were. The node
+    areas are available as ``node_areas``.
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+        self.cache_path = path
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+        for name, value in meta["attributes"].items():
+            setattr(self, name, value)
+        for name in meta["arrays"]:
+            setattr(
+                self,
+                name,
+                np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode),
+            )
+
+    def __repr__(self):
+        return "CachedMesh(%r)" % getattr(self, "path", self.cache_path)
+
+
+class MeshCache(object):
+    """
+    Cache of FESOM meshes stored as memory-mappable ``.npy`` arrays
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Where the cache lives. Defaults to ``default_mesh_cache_dir()``. For a
+        cache shared in a project, all users need write permissions here.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or default_mesh_cache_dir()
+
+    def load(self, mesh_dir, abg, loader):
+        """
+        Returns the mesh in ``mesh_dir``, from the cache if possible.
+
+        Parameters
+        ----------
+        mesh_dir : str
+            The mesh directory
+        abg : list
+            The rotation angles used to load the mesh
+        loader : callable
+            Called without arguments on a cache miss; needs to return the
+            loaded mesh, e.g. ``lambda: pf.load_mesh(mesh_dir, abg=abg)``
+
+        Returns
+        -------
+        CachedMesh
+        """
+        key = mesh_cache_key(mesh_dir, abg)
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isfile(os.path.join(path, _META_FILE)):
+            logging.info("Using cached mesh from %s", path)
+            return CachedMesh(path)
+        logging.info("Mesh %s not cached yet, loading it...", mesh_dir)
+        mesh = loader()
+        self.store(mesh, mesh_dir, abg, key)
+        return CachedMesh(path)
+
+    def store(self, mesh, mesh_dir, abg, key=None):
+        """
+        Writes the arrays of ``mesh`` into the cache.
+
+        Older entries for the same mesh directory and rotation are removed
+        (if permissions allow it), since their mesh files have changed.
+
+        Returns
+        -------
+        str
+            The path of the new cache entry
+        """
+        key = key or mesh_cache_key(mesh_dir, abg)
+        path = os.path.join(self.cache_dir, key)
+        mesh_dir = os.path.realpath(mesh_dir)
+        abg = [float(angle) for angle in abg]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix="." + key + "-", dir=self.cache_dir)
+        try:
+            arrays, attributes = [], {}
+            for name, value in vars(mesh).items():
+                if isinstance(value, np.ndarray) and value.dtype != object:
+                    np.save(os.path.join(tmp_path, name + ".npy"), value)
+                    arrays.append(name)
+                elif isinstance(value, (bool, int, float, str)):
+                    attributes[name] = value
+                elif isinstance(value, (np.integer, np.floating)):
+                    attributes[name] = value.item()
+            if "node_areas" not in arrays:
+                np.save(
+                    os.path.join(tmp_path, "node_areas.npy"),
+                    compute_node_areas(mesh.x2, mesh.y2, mesh.elem),
+                )
+                arrays.append("node_areas")
+            meta = {
+                "mesh_dir": mesh_dir,
+                "abg": abg,
+                "arrays": arrays,
+                "attributes": attributes,
+            }
+            with open(os.path.join(tmp_path, _META_FILE), "w") as f:
+                json.dump(meta, f)
+            # Readable (and removable) for everybody in the group:
+            os.chmod(tmp_path, 0o2775)
+            for fname in os.listdir(tmp_path):
+                os.chmod(os.path.join(tmp_path, fname), 0o664)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Someone else was faster in writing the same entry:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isfile(os.path.join(path, _META_FILE)):
+                raise
+        self._remove_stale_entries(mesh_dir, abg, key)
+        return path
+
+    def _remove_stale_entries(self, mesh_dir, abg, key):
+        for entry in os.listdir(self.cache_dir):
+            if entry == key or entry.startswith("."):
+                continue
+            meta_file = os.path.join(self.cache_dir, entry, _META_FILE)
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if meta["mesh_dir"] == mesh_dir and meta["abg"] == abg:
+                logging.info("Removing stale mesh cache entry %s", entry)
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
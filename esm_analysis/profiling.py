@@ -0,0 +1,377 @@
+"""
+Timing spans of the stages of an analysis.
+
+When an analysis is slow, the question is where the time goes: finding the
+experiment, looking up the files of a variable, hashing the inputs for the
+result cache, or the ``cdo`` calls themselves. With profiling enabled, each
+of these stages is recorded as a span, with its start, duration, and nested
+spans. Every ``cdo`` call (and every call of the xarray or streaming
+engine) additionally records its command line, and the bytes read and
+written.
+
+Profiling is off by default, and then costs a single check per instrumented
+call. Turn it on with ``esm_analysis --profile ...``, or from Python::
+
+    >>> from esm_analysis import profiling
+    >>> with profiling.profile() as profiler:
+    ...     analyser.fldmean("temp2")
+    >>> print(profiler.summary())
+    >>> profiler.write_chrome_trace("fldmean.trace.json")
+
+The summary merges spans of the same name below the same parent (e.g. the
+1000 ``cdo select`` calls of a chunked selection). The JSON output keeps
+every span; the Chrome trace can be opened in ``chrome://tracing`` or
+https://ui.perfetto.dev.
+
+Spans are only recorded in the process which enabled profiling; work done
+by the chunk worker processes shows up as the span of the whole pool.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+_PROFILER = None
+
+
+class Span(object):
+    """
+    A timed stage, with its nested stages
+
+    Parameters
+    ----------
+    name : str
+    attrs : dict
+        Further information, e.g. the ``command`` of a ``cdo`` call, and
+        ``bytes_in`` and ``bytes_out``
+    """
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.start = time.perf_counter()
+        self.duration = None
+        self.thread = threading.get_ident()
+        self.children = []
+
+    def to_dict(self, origin=0.0):
+        """
+        The span and its children as a dictionary, with times in seconds since
+        ``origin``
+        """
+        return {
+            "name": self.name,
+            "start": self.start - origin,
+            "duration": self.duration,
+            "attrs": self.attrs,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+
+class Profiler(object):
+    """
+    Collects the spans of all threads of this process into one tree
+    """
+
+    def __init__(self):
+        self.root = Span("total")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = [self.root]
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Records the enclosed code as a span named ``name``"""
+        stack = self._stack()
+        span = Span(name, attrs)
+        with self._lock:
+            stack[-1].children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            stack.pop()
+
+    def stop(self):
+        """Ends the root span"""
+        self.root.duration = time.perf_counter() - self.root.start
+
+    @property
+    def duration(self):
+        """The time since profiling started (or until it stopped)"""
+        if self.root.duration is not None:
+            return self.root.duration
+        return time.perf_counter() - self.root.start
+
+    def summary(self, min_fraction=0.001):
+        """
+        The spans as a tree, with the number of calls, the total duration,
+        the fraction of the total time, and the bytes read and written
+
+        Parameters
+        ----------
+        min_fraction : float
+            Spans taking less than this fraction of the total time are left
+            out.
+
+        Returns
+        -------
+        str
+        """
+        total = self.duration
+        rows = []
+
+        def visit(spans, depth):
+            for name, merged in _merge(spans).items():
+                duration = sum(span.duration or 0.0 for span in merged)
+                if total and duration / total < min_fraction:
+                    continue
+                columns = [
+                    "  " * depth + name,
+                    "%d x" % len(merged) if len(merged) > 1 else "",
+                    "%10.3f s" % duration,
+                    "%5.1f%%" % (100 * duration / total if total else 0.0),
+                ]
+                for key, label in (("bytes_in", "in"), ("bytes_out", "out")):
+                    size = sum(span.attrs.get(key, 0) for span in merged)
+                    columns.append(
+                        "%s %s" % (label, _format_bytes(size)) if size else ""
+                    )
+                rows.append(columns)
+                visit([child for span in merged for child in span.children], depth + 1)
+
+        visit(self.root.children, 1)
+        widths = [max([len(row[i]) for row in rows] + [0]) for i in range(6)]
+        lines = ["Profile: %.3f s in total" % total]
+        for row in rows:
+            lines.append(
+                "  ".join(
+                    column.ljust(width) if i == 0 else column.rjust(width)
+                    for i, (column, width) in enumerate(zip(row, widths))
+                ).rstrip()
+            )
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """All spans as nested dictionaries, times in seconds since the start"""
+        tree = self.root.to_dict(origin=self.root.start)
+        tree["duration"] = self.duration
+        return tree
+
+    def write_json(self, fname):
+        """Writes all spans (see ``to_dict``) to ``fname``"""
+        with open(fname, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+
+    def chrome_trace(self):
+        """
+        All spans in the Trace Event Format, for ``chrome://tracing`` or
+        https://ui.perfetto.dev
+        """
+        events = []
+        pid = os.getpid()
+
+        def visit(span):
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": (span.start - self.root.start) * 1e6,
+                    "dur": (
+                        self.duration if span is self.root else span.duration or 0.0
+                    )
+                    * 1e6,
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": {key: str(value) for key, value in span.attrs.items()},
+                }
+            )
+            for child in span.children:
+                visit(child)
+
+        visit(self.root)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, fname):
+        """Writes the spans as a Chrome trace (see ``chrome_trace``) to ``fname``"""
+        with open(fname, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def _merge(spans):
+    merged = {}
+    for span in spans:
+        merged.setdefault(span.name, []).append(span)
+    return merged
+
+
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return "%.1f %s" % (size, unit) if unit != "B" else "%d B" % size
+        size /= 1024.0
+    return "%.1f TB" % size
+
+
+def enable():
+    """Starts recording spans, and returns the new ``Profiler``"""
+    global _PROFILER
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def disable():
+    """Stops recording spans, and returns the ``Profiler`` (or ``None``)"""
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def enabled():
+    """Whether spans are being recorded"""
+    return _PROFILER is not None
+
+
+@contextlib.contextmanager
+def profile():
+    """Records spans within the ``with`` block, see the module documentation"""
+    profiler = enable()
+    try:
+        yield profiler
+    finally:
+        disable()
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Records the enclosed code as a span named ``name``, with further
+    information ``attrs``, if profiling is enabled.
+    """
+    if _PROFILER is None:
+        yield None
+        return
+    with _PROFILER.span(name, **attrs) as recorded:
+        yield recorded
+
+
+def timed(function):
+    """
+    Decorator recording each call of ``function`` as a span, named by its
+    qualified name
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _PROFILER is None:
+            return function(*args, **kwargs)
+        with _PROFILER.span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument(tool, label):
+    """
+    Wraps ``tool`` (a ``cdo.Cdo`` object or an analysis engine) so that each
+    of its method calls is recorded as a span ``<label> <method>``, with the
+    command, and the bytes read from input files and written to the output.
+
+    Returns ``tool`` itself if profiling is disabled.
+    """
+    if _PROFILER is None:
+        return tool
+    return _Instrumented(tool, label)
+
+
+class _Instrumented(object):
+    def __init__(self, tool, label):
+        self._tool = tool
+        self._label = label
+
+    def __getattr__(self, name):
+        static = getattr(type(self._tool), name, None)
+        if (
+            name.startswith("_")
+            or name in getattr(self._tool, "__dict__", {})
+            or (static is not None and not callable(static))
+        ):
+            return getattr(self._tool, name)
+
+        def call(*args, **kwargs):
+            if _PROFILER is None:
+                return getattr(self._tool, name)(*args, **kwargs)
+            with _PROFILER.span(
+                "%s %s" % (self._label, name),
+                command=_command(self._label, name, args, kwargs),
+                bytes_in=_input_bytes(args, kwargs),
+            ) as recorded:
+                # The method is looked up within the span, since python-cdo
+                # runs cdo to look up its operators:
+                result = getattr(self._tool, name)(*args, **kwargs)
+                recorded.attrs["bytes_out"] = _output_bytes(
+                    kwargs.get("output"), result
+                )
+            return result
+
+        return call
+
+
+def _command(label, name, args, kwargs):
+    """The command line of a ``cdo`` call, or a description of an engine call"""
+    if label == "cdo":
+        operator = "-" + ",".join([name] + [str(arg) for arg in args])
+        parts = [kwargs.get("options"), operator, kwargs.get("input")]
+        parts.append(kwargs.get("output"))
+        return " ".join(
+            ["cdo"]
+            + [
+                " ".join(str(p) for p in part) if isinstance(part, list) else str(part)
+                for part in parts
+                if part is not None
+            ]
+        )
+    arguments = [_describe(arg) for arg in args]
+    arguments += ["%s=%s" % (key, _describe(value)) for key, value in kwargs.items()]
+    return "%s.%s(%s)" % (label, name, ", ".join(arguments))
+
+
+def _describe(value):
+    """``repr`` of ``value``, with long lists of files shortened to their length"""
+    if isinstance(value, (list, tuple)) and len(value) > 3:
+        return "[%s files]" % len(value)
+    return repr(value)
+
+
+def _paths(value):
+    """Words in ``value`` (a string, or a list of strings) which are existing files"""
+    if isinstance(value, str):
+        return [word for word in value.split() if os.path.isfile(word)]
+    if isinstance(value, (list, tuple)):
+        return [path for item in value for path in _paths(item)]
+    return []
+
+
+def _input_bytes(args, kwargs):
+    paths = _paths(kwargs.get("input")) + [path for arg in args for path in _paths(arg)]
+    return sum(os.path.getsize(path) for path in set(paths))
+
+
+def _output_bytes(output, result):
+    candidates = result.values() if isinstance(result, dict) else [result, output]
+    return sum(
+        os.path.getsize(path)
+        for path in {c for c in candidates if isinstance(c, str)}
+        if os.path.isfile(path)
+    )
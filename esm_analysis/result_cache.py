@@ -0,0 +1,298 @@
+"""
+Provenance-aware cache of analysis results.
+
+Checking whether an output file already exists is not enough to know whether
+it can be reused: the list of input files, the operator options, or the
+number of years going into a climatology might have changed since it was
+made. The ``ResultCache`` keys every result on a hash of
+
+* the operator chain,
+* the variable,
+* the operator options, and
+* the sorted input files, together with their sizes and modification times.
+
+Results are stored content-addressed as ``<cache_dir>/objects/<key>.nc`` and
+hard-linked (or copied, if linking is not possible) to their usual, readable
+name in the analysis directory. A result which is computed again must
+therefore be written to a new file (see ``detach``), not in place. When a
+new result for an output is stored, the result it replaces is dropped from
+the cache. A small SQLite manifest records the size, creation time, last
+access, hits and misses of each entry. Once the total size exceeds the quota
+(``DEFAULT_QUOTA`` unless given), the least recently used entries are
+evicted. This only removes the cached objects: the readable output files in
+the analysis directory are kept.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+from . import profiling
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    description TEXT,
+    output TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    created REAL,
+    last_access REAL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_by_last_access ON entries (last_access);
+"""
+
+DEFAULT_QUOTA = "10G"
+"""The quota of a ``ResultCache``, unless another one is given"""
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size):
+    """
+    Parses a size such as ``500M``, ``50G`` or ``1.5T`` into bytes.
+
+    Parameters
+    ----------
+    size : str or int or None
+        ``None`` or ``"none"`` for no limit
+
+    Returns
+    -------
+    int or None
+    """
+    if size is None or isinstance(size, int):
+        return size
+    if str(size).strip().lower() == "none":
+        return None
+    match = re.match(r"^\s*([\d.]+)\s*([KMGT]?)i?B?\s*$", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError("Cannot understand size: %s" % size)
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+
+@profiling.timed
+def cache_key(operators, varname, options, inputs):
+    """
+    Computes the cache key of a result.
+
+    Parameters
+    ----------
+    operators : list of str
+        The operator chain, e.g. ``["fldmean", "select,name=temp2"]``
+    varname : str
+        The variable
+    options : str
+        Further options which change the result, e.g. ``"-f nc -t echam6"``
+    inputs : list of str
+        The input files. These need to exist.
+
+    Returns
+    -------
+    str
+        A hex digest
+    """
+    signatures = []
+    for fname in sorted(inputs):
+        stat = os.stat(fname)
+        signatures.append([fname, stat.st_size, stat.st_mtime_ns])
+    description = json.dumps([list(operators), varname, options, signatures])
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def detach(output):
+    """
+    Removes ``output`` before it is computed again
+
+    After ``ResultCache.fetch`` or ``ResultCache.store``, ``output`` is a
+    hard link to a cached result. Writing it in place (as ``cdo`` or
+    ``to_netcdf`` do) would also change the cached result of other inputs.
+    """
+    try:
+        os.remove(output)
+    except FileNotFoundError:
+        pass
+
+
+def _link_or_copy(src, dst):
+    """Makes ``dst`` the same file as ``src``, atomically replacing ``dst``"""
+    # Unique to this thread, since the same result may be stored concurrently:
+    tmp = "%s.%s-%s.cache-tmp" % (dst, os.getpid(), threading.get_ident())
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ResultCache(object):
+    """
+    Content-addressed, size-bounded cache of analysis results
+
+    Parameters
+    ----------
+    cache_dir : str
+        Where the objects and the manifest are kept
+    quota : int or str, optional
+        Maximum total size of the cached results, e.g. ``"50G"``; by default
+        ``DEFAULT_QUOTA``. With ``None`` (or ``"none"``), nothing is evicted.
+
+    The cache can be used from several threads; its methods take turns.
+    """
+
+    def __init__(self, cache_dir, quota=DEFAULT_QUOTA):
+        self.cache_dir = cache_dir
+        self._lock = threading.RLock()
+        self.object_dir = os.path.join(cache_dir, "objects")
+        self.quota = parse_size(quota)
+        os.makedirs(self.object_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "manifest.sqlite"),
+            timeout=60,
+            check_same_thread=False,
+        )
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def object_path(self, key):
+        """Where the result with ``key`` is stored"""
+        return os.path.join(self.object_dir, key + ".nc")
+
+    @profiling.timed
+    def fetch(self, key, output):
+        """
+        Makes ``output`` the cached result of ``key``, if there is one.
+
+        Returns
+        -------
+        bool
+            ``True`` on a cache hit, ``False`` otherwise.
+        """
+        obj = self.object_path(key)
+        now = time.time()
+        if not os.path.isfile(obj):
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO entries (key, output, created) "
+                    "VALUES (?, ?, ?)",
+                    (key, output, now),
+                )
+                self._conn.execute(
+                    "UPDATE entries SET misses = misses + 1 WHERE key = ?", (key,)
+                )
+            logging.debug("Cache miss for %s", output)
+            return False
+        if not (os.path.exists(output) and os.path.samefile(obj, output)):
+            _link_or_copy(obj, output)
+        with self._lock, self._conn:
+            self._drop_replaced(key, output)
+            self._conn.execute(
+                "UPDATE entries SET hits = hits + 1, last_access = ?, output = ? "
+                "WHERE key = ?",
+                (now, output, key),
+            )
+        logging.info("Using cached result for %s", output)
+        return True
+
+    @profiling.timed
+    def store(self, key, output, description=None):
+        """
+        Puts the freshly computed ``output`` into the cache under ``key``.
+
+        The previous results for ``output`` are dropped, since they were
+        replaced. Afterwards, entries are evicted if the quota is exceeded.
+        """
+        _link_or_copy(output, self.object_path(key))
+        now = time.time()
+        with self._lock, self._conn:
+            self._drop_replaced(key, output)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO entries (key, created) VALUES (?, ?)",
+                (key, now),
+            )
+            self._conn.execute(
+                "UPDATE entries SET description = ?, output = ?, size = ?, "
+                "last_access = ? WHERE key = ?",
+                (description, output, os.path.getsize(output), now, key),
+            )
+        self.evict(keep=key)
+
+    def total_size(self):
+        """The size of all cached results, in bytes"""
+        with self._lock:
+            (size,) = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return size
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used results until the quota is met.
+
+        Only the cached objects are removed; output files linked to them stay
+        in the analysis directory, but are computed again when used next.
+
+        Parameters
+        ----------
+        keep : str, optional
+            A key which should never be evicted, e.g. the one just stored.
+        """
+        if self.quota is None:
+            return
+        with self._lock:
+            self._evict(keep)
+
+    def _evict(self, keep):
+        total = self.total_size()
+        if total <= self.quota:
+            return
+        for key, output, size in self._conn.execute(
+            "SELECT key, output, size FROM entries WHERE size > 0 "
+            "ORDER BY last_access"
+        ).fetchall():
+            if total <= self.quota:
+                break
+            if key == keep:
+                continue
+            logging.info("Evicting cached result %s (%s bytes)", output, size)
+            self._remove_object(key)
+            with self._conn:
+                self._conn.execute("UPDATE entries SET size = 0 WHERE key = ?", (key,))
+            total -= size
+
+    def _drop_replaced(self, key, output):
+        """Removes the other results which were linked to ``output``"""
+        for (previous,) in self._conn.execute(
+            "SELECT key FROM entries WHERE output = ? AND key != ?", (output, key)
+        ).fetchall():
+            logging.debug("Dropping replaced result %s of %s", previous, output)
+            self._remove_object(previous)
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (previous,))
+
+    def _remove_object(self, key):
+        try:
+            os.remove(self.object_path(key))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            The number of entries, their total size, hits and misses.
+        """
+        with self._lock:
+            entries, size, hits, misses = self._conn.execute(
+                "SELECT COALESCE(SUM(size > 0), 0), COALESCE(SUM(size), 0), "
+                "COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0) FROM entries"
+            ).fetchone()
+        return {"entries": entries, "size": size, "hits": hits, "misses": misses}
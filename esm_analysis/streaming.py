@@ -0,0 +1,295 @@
+"""
+Streaming reductions with constant memory.
+
+A climatology over many years with ``cdo timmean`` (or ``xarray``) gets all
+files at once, and memory or temporary space grow with the length of the
+climatology. The ``StreamingEngine`` instead reads the files one at a time,
+in blocks of time steps, and feeds them to online accumulators (Welford's
+algorithm, in the blockwise form of Chan et al.) for the count, mean,
+variance, minimum and maximum of every grid point. Per group (calendar
+month, season, year or all time steps), only these few fields are kept,
+regardless of how many files go into the result.
+
+The operators are named like their ``cdo`` equivalents: a grouping
+(``tim``, ``ymon``, ``yseas`` or ``year``) followed by a statistic (``mean``,
+``std``, ``std1``, ``var``, ``var1``, ``min`` or ``max``), e.g. ``ymonstd``.
+As in ``cdo``, ``std`` and ``var`` are normalized by ``n``, ``std1`` and
+``var1`` by ``n - 1``. ``fldmean`` is supported as well. All operators
+asked for at once share a single read of the input, and operators with the
+same grouping share their accumulators, so e.g. ``ymonstd`` comes for free
+with ``ymonmean``.
+
+Choose it with ``engine: streaming`` in ``.top_of_exp_tree`` (or
+``EsmAnalysis(engine="streaming")``).
+"""
+
+import collections
+import logging
+import re
+
+import numpy as np
+import xarray as xr
+
+from .xarray_engine import XarrayEngine, check_variables
+
+BLOCK_BYTES = 64 * 1024**2
+"""Approximate size of the blocks of time steps read at once, in bytes"""
+
+GROUPINGS = {"tim": None, "ymon": "month", "yseas": "season", "year": "year"}
+STATISTICS = ("mean", "std", "std1", "var", "var1", "min", "max")
+
+_OPERATOR = re.compile(
+    r"^(%s)(%s)$" % ("|".join(GROUPINGS), "|".join(sorted(STATISTICS, key=len)[::-1]))
+)
+
+
+def parse_operator(operator):
+    """
+    Splits a streaming operator into its grouping and statistic
+
+    Parameters
+    ----------
+    operator : str
+        e.g. ``ymonstd``
+
+    Returns
+    -------
+    tuple
+        The grouping (``None``, ``"month"``, ``"season"`` or ``"year"``) and
+        the statistic, e.g. ``("month", "std")``
+    """
+    match = _OPERATOR.match(operator)
+    if not match:
+        raise ValueError("The streaming engine cannot compute %s" % operator)
+    return GROUPINGS[match.group(1)], match.group(2)
+
+
+class Accumulator(object):
+    """
+    Online count, mean, variance, minimum and maximum of a series of fields
+
+    Missing values (NaN) are skipped for each grid point separately.
+    """
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def update(self, block):
+        """
+        Adds a block of fields.
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Several fields, stacked along the first axis
+        """
+        block = np.asarray(block, dtype=float)
+        valid = ~np.isnan(block)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(
+                count > 0, np.where(valid, block, 0.0).sum(axis=0) / count, 0.0
+            )
+        m2 = np.where(valid, (block - mean) ** 2, 0.0).sum(axis=0)
+        block_min = np.fmin.reduce(block, axis=0)
+        block_max = np.fmax.reduce(block, axis=0)
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+            self.min, self.max = block_min, block_max
+            return
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(total > 0, count / total, 0.0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * fraction
+        self.m2 = self.m2 + m2 + delta**2 * self.count * fraction
+        self.count = total
+        self.min = np.fmin(self.min, block_min)
+        self.max = np.fmax(self.max, block_max)
+
+    def result(self, statistic):
+        """
+        Parameters
+        ----------
+        statistic : str
+            One of ``STATISTICS``
+
+        Returns
+        -------
+        np.ndarray
+            NaN where there were no (or, for ``std1`` and ``var1``, too few)
+            valid values.
+        """
+        if statistic in ("min", "max"):
+            return getattr(self, statistic)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if statistic == "mean":
+                return np.where(self.count > 0, self.mean, np.nan)
+            ddof = 1 if statistic.endswith("1") else 0
+            variance = np.where(
+                self.count > ddof, self.m2 / (self.count - ddof), np.nan
+            )
+        if statistic.startswith("std"):
+            return np.sqrt(variance)
+        return variance
+
+
+class GroupedAccumulators(object):
+    """
+    One ``Accumulator`` per group of time steps
+
+    Parameters
+    ----------
+    grouping : str or None
+        ``"month"``, ``"season"``, ``"year"``, or ``None`` for a single group
+    """
+
+    def __init__(self, grouping):
+        self.grouping = grouping
+        self.accumulators = collections.OrderedDict()
+        self.end_times = {}
+
+    def keys(self, time):
+        """The group of each time step in ``time`` (an ``xr.DataArray``)"""
+        if self.grouping is None:
+            return np.zeros(time.size, dtype=int)
+        if self.grouping == "season":
+            return (time.dt.month.values % 12) // 3
+        return getattr(time.dt, self.grouping).values
+
+    def update(self, block, time):
+        """Adds the fields in ``block``, with their time steps ``time``"""
+        keys = self.keys(time)
+        for key in np.unique(keys):
+            selected = keys == key
+            accumulator = self.accumulators.setdefault(key, Accumulator())
+            accumulator.update(block[selected])
+            self.end_times[key] = time.values[selected][-1]
+
+    def result(self, statistic):
+        """
+        Returns
+        -------
+        tuple
+            The time stamp (the last time step, like ``cdo``) of each group,
+            and the stacked results, in the order months, seasons (starting
+            with DJF) or years come in the calendar.
+        """
+        keys = sorted(self.accumulators)
+        return (
+            np.array([self.end_times[key] for key in keys]),
+            np.stack([self.accumulators[key].result(statistic) for key in keys]),
+        )
+
+
+class StreamingEngine(XarrayEngine):
+    """
+    Reductions of model output, one file and block of time steps at a time
+
+    Parameters
+    ----------
+    block_bytes : int
+        Approximate size of the blocks read at once
+    """
+
+    NAME = "streaming"
+
+    def __init__(self, block_bytes=BLOCK_BYTES):
+        super().__init__(scheduler="synchronous")
+        self.block_bytes = block_bytes
+
+    def reductions(self, operators, varnames, file_list, outputs=None):
+        """
+        Applies several ``operators`` to ``varnames`` from ``file_list``,
+        with one read of the files.
+
+        Parameters
+        ----------
+        operators : list of str
+            ``fldmean``, or any combination of a grouping and a statistic,
+            see the module documentation
+        varnames : list of str
+        file_list : list of str
+            The files, in time order
+        outputs : dict, optional
+            The output file of each operator; temporary files (which the
+            caller has to remove) for any operator without one.
+
+        Returns
+        -------
+        dict
+            The output file of each operator
+        """
+        plans = {
+            operator: (
+                (None, None) if operator == "fldmean" else parse_operator(operator)
+            )
+            for operator in operators
+        }
+        outputs = self._output_files(operators, outputs)
+        groupings = {grouping for (grouping, statistic) in plans.values() if statistic}
+        accumulators = {
+            (varname, grouping): GroupedAccumulators(grouping)
+            for varname in varnames
+            for grouping in groupings
+        }
+        fldmeans = collections.defaultdict(list)
+        times, template = [], {}
+        logging.info(
+            "Streaming %s of %s through %s files",
+            ", ".join(operators),
+            ", ".join(varnames),
+            len(file_list),
+        )
+        for fname in file_list:
+            with xr.open_dataset(fname) as ds:
+                check_variables(varnames, ds, fname)
+                times.append(ds.time.values)
+                for varname in varnames:
+                    var = ds[varname]
+                    if varname not in template:
+                        template[varname] = (
+                            var.dims,
+                            {d: ds[d].values for d in var.dims[1:] if d in ds.coords},
+                            var.attrs,
+                        )
+                    step_bytes = max(1, int(np.prod(var.shape[1:])) * 8)
+                    block_size = max(1, self.block_bytes // step_bytes)
+                    for start in range(0, var.sizes["time"], block_size):
+                        block = var[start : start + block_size].load()
+                        values = block.values.astype(float)
+                        for grouping in groupings:
+                            accumulators[varname, grouping].update(values, block.time)
+                        if "fldmean" in plans:
+                            fldmeans[varname].append(
+                                self.fldmean(block.to_dataset()).compute()[varname]
+                            )
+        if not times:
+            raise ValueError("No files to reduce")
+        for operator, (grouping, statistic) in plans.items():
+            if operator == "fldmean":
+                result = xr.Dataset(
+                    {
+                        varname: xr.concat(fldmeans[varname], dim="time")
+                        for varname in varnames
+                    }
+                )
+            else:
+                result = xr.Dataset()
+                for varname in varnames:
+                    dims, coords, attrs = template[varname]
+                    end_times, values = accumulators[varname, grouping].result(
+                        statistic
+                    )
+                    result[varname] = xr.DataArray(
+                        values,
+                        dims=dims,
+                        coords=dict(coords, time=end_times),
+                        attrs=attrs,
+                    )
+            self._write(result, outputs[operator])
+        return {operator: outputs[operator] for operator in operators}
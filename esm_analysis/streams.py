@@ -0,0 +1,155 @@
+"""
+Classification of model output files by stream.
+
+The output of a component is written as files named::
+
+    <EXP_ID>_<component>_<stream>[_<date>]<extension>
+
+e.g. ``LGM_011_echam6_co2_185001.grb`` or ``LGM_011_fesom_sst_18500101.nc``.
+``parse_filename`` splits such a name with one precompiled grammar, and a
+``StreamIndex`` lists an output directory once (with ``os.scandir``) and
+keeps the sorted files of each stream, so that finding the files of a
+stream does not mean matching every file against a pattern per stream.
+
+A stream is named by the component, stream and extension of its files, e.g.
+``echam6_echam.grb`` or ``echam6_echam.codes`` (see ``OutputFile.key``):
+the same stream is often written in several formats, and the ``.codes``
+files only describe the variables of the ``.grb`` files.
+"""
+
+import collections
+import os
+import re
+
+# <component>_<stream>[_<date>]<extension>, after the EXP_ID. Component
+# names have no underscores, streams may have them (and digits, but no
+# dots). The date is the last group of digits before the extension, if it
+# is YYYY, YYYYMM, YYYYMMDD or YYYYMMDDHH (or YYYY-MM[-DD]):
+_GRAMMAR = re.compile(
+    r"([A-Za-z][A-Za-z0-9]*)_([^.]+?)"
+    r"(?:_(\d{4}(?:(?:\d\d){1,3}|(?:-\d\d){1,2})?))?"
+    r"((?:\.[A-Za-z]\w*)*)"
+)
+
+OutputFile = collections.namedtuple(
+    "OutputFile", ["exp_id", "component", "stream", "date", "ext"]
+)
+OutputFile.__doc__ = """
+The parts of the name of an output file, see ``parse_filename``
+
+``date`` is a string of digits (as in the filename) or ``None``, ``ext``
+includes the leading dot and may be empty.
+"""
+OutputFile.key = property(
+    lambda self: "%s_%s%s" % (self.component, self.stream, self.ext),
+    doc="The component, stream and extension, e.g. ``echam6_echam.grb``",
+)
+
+
+def parse_filename(fname, exp_id=None):
+    """
+    Splits the name of an output file into its parts
+
+    Parameters
+    ----------
+    fname : str
+        The filename, with or without directory
+    exp_id : str, optional
+        The experiment the file belongs to. Needed if the ``EXP_ID`` may
+        contain underscores; without it, the ``EXP_ID`` is everything up
+        to the first underscore.
+
+    Returns
+    -------
+    OutputFile or None
+        ``None`` if the name does not follow the naming scheme (or belongs
+        to another experiment)
+    """
+    name = os.path.basename(fname)
+    if exp_id is None:
+        exp_id = name.partition("_")[0]
+    if not name.startswith(exp_id + "_"):
+        return None
+    match = _GRAMMAR.fullmatch(name, len(exp_id) + 1)
+    if match is None:
+        return None
+    return OutputFile(exp_id, *match.groups())
+
+
+def classify(name, exp_id=None):
+    """
+    The stream and date of a file, as ``parse_filename``, but faster
+
+    Parameters
+    ----------
+    name : str
+        The filename, without directory
+    exp_id : str, optional
+
+    Returns
+    -------
+    tuple or None
+        The stream (``OutputFile.key``) and the date (or ``None``), or
+        ``None`` if the name does not follow the naming scheme
+    """
+    if exp_id is None:
+        start = name.find("_") + 1
+    elif name.startswith(exp_id + "_"):
+        start = len(exp_id) + 1
+    else:
+        return None
+    match = _GRAMMAR.fullmatch(name, start) if start else None
+    if match is None:
+        return None
+    component, stream, date, ext = match.groups()
+    return "%s_%s%s" % (component, stream, ext), date
+
+
+class StreamIndex(object):
+    """
+    The files of one output directory, by stream
+
+    Parameters
+    ----------
+    directory : str
+        The directory to list. A missing directory gives an empty index.
+    exp_id : str, optional
+        See ``parse_filename``
+
+    Files which are not named as described in ``parse_filename`` are left
+    out.
+    """
+
+    def __init__(self, directory, exp_id=None):
+        self.directory = directory
+        self.exp_id = exp_id
+        self._files = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    classified = classify(entry.name, exp_id)
+                    if classified is not None and entry.is_file():
+                        self._files.setdefault(classified[0], []).append(entry.path)
+        except FileNotFoundError:
+            pass
+        for files in self._files.values():
+            files.sort()
+
+    def __contains__(self, key):
+        return key in self._files
+
+    def keys(self):
+        """The streams found, e.g. ``echam6_echam.grb``, sorted"""
+        return sorted(self._files)
+
+    def files(self, key):
+        """The sorted paths of the files of stream ``key``, or an empty list"""
+        return list(self._files.get(key, []))
+
+    def first(self, key):
+        """The ``OutputFile`` of the first file of stream ``key``"""
+        return parse_filename(self._files[key][0], self.exp_id)
+
+    def with_extension(self, ext):
+        """The streams whose files have the extension ``ext``, sorted"""
+        return sorted(key for key in self._files if self.first(key).ext == ext)
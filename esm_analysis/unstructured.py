@@ -0,0 +1,165 @@
+"""
+Reductions on unstructured meshes, such as FESOM's.
+
+Model output on an unstructured mesh is stored per node, and the nodes
+represent (very) different areas. A field mean therefore needs to weight each
+node by the area of its cluster, see ``esm_analysis.mesh_cache``. Here, this
+is done with NumPy dot products over whole blocks of time steps at once,
+reading the input files block by block, so that the memory needed does not
+depend on the length of the time series.
+
+Three layouts of the output are understood, based on the shape of the
+variable:
+
+* ``(time, nodes_2d)``: surface fields, e.g. ``sst``
+* ``(time, level, nodes_2d)``: levelwise 3D fields
+* ``(time, nodes_3d)``: 3D fields stored as one vector per time step; this
+  needs the mapping ``n32`` of 2D nodes and levels to 3D nodes from the mesh.
+"""
+
+import logging
+
+import numpy as np
+import xarray as xr
+
+BLOCK_BYTES = 256 * 1024**2
+"""Approximate size of the blocks of time steps read at once, in bytes"""
+
+
+def level_thickness(depths):
+    """
+    Thickness of the layer around each level.
+
+    Each level represents the layer between the midpoints to its neighbours,
+    the uppermost and lowermost ones reach to their own depth.
+
+    Parameters
+    ----------
+    depths : array-like
+        Depth of each level, monotonic (FESOM gives them as negative numbers)
+
+    Returns
+    -------
+    np.ndarray
+    """
+    depths = np.asarray(depths, dtype=float)
+    if len(depths) == 1:
+        return np.ones(1)
+    bounds = np.concatenate([depths[:1], (depths[1:] + depths[:-1]) / 2.0, depths[-1:]])
+    return np.abs(np.diff(bounds))
+
+
+def _weighted_sums(block, node_areas, n32=None):
+    """
+    Area weighted sums of a block of data, and the sum of the areas of the
+    valid (not missing) nodes.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Both of shape ``(time,)`` for 2D data, and ``(time, level)`` for 3D
+        data.
+    """
+    if n32 is not None:
+        # (time, nodes_3d): gather each level's nodes, then as levelwise
+        levels = []
+        for level_nodes in np.asarray(n32).T:
+            present = level_nodes > 0
+            column = np.full((block.shape[0], len(node_areas)), np.nan)
+            column[:, present] = block[:, level_nodes[present] - 1]
+            levels.append(column)
+        block = np.stack(levels, axis=1)
+    valid = ~np.isnan(block)
+    sums = np.dot(np.where(valid, block, 0.0), node_areas)
+    areas = np.dot(valid, node_areas)
+    return sums, areas
+
+
+def fldmean(file_list, varname, node_areas, n32=None, depths=None):
+    """
+    Area weighted field mean of ``varname`` on an unstructured mesh
+
+    Parameters
+    ----------
+    file_list : list of str
+        The files to use, in order. Each is read in blocks of time steps of
+        about ``BLOCK_BYTES``.
+    varname : str
+        The variable in the files
+    node_areas : np.ndarray
+        The area of each 2D node
+    n32 : np.ndarray, optional
+        One-based index of the 3D node for each 2D node and level (with
+        non-positive values for missing levels); only needed for output on
+        3D nodes.
+    depths : array-like, optional
+        The depth of each level, for 3D output. If not given, the depth
+        coordinate of the files is used, if there is one.
+
+    Returns
+    -------
+    xr.Dataset
+        ``varname`` holds the global mean. For 3D data, it is weighted by
+        the volume around each node (area and level thickness), and the mean
+        of each level is given in ``<varname>_levels``.
+    """
+    node_areas = np.asarray(node_areas, dtype=float)
+    times, sums, areas = [], [], []
+    attrs, level_dim, level_coord = {}, None, None
+    for fname in file_list:
+        with xr.open_dataset(fname) as ds:
+            var = ds[varname]
+            attrs = var.attrs
+            on_3d_nodes = var.ndim == 2 and var.shape[1] != len(node_areas)
+            if on_3d_nodes and n32 is None:
+                raise ValueError(
+                    "%s is stored on 3D nodes, this needs n32 from the mesh" % varname
+                )
+            if var.ndim == 3:
+                level_dim = var.dims[1]
+                if level_dim in ds.coords:
+                    level_coord = ds[level_dim].values
+            elif on_3d_nodes:
+                level_dim = "level"
+            step_bytes = max(1, int(np.prod(var.shape[1:])) * 8)
+            block_size = max(1, BLOCK_BYTES // step_bytes)
+            ntime = var.sizes["time"]
+            logging.debug(
+                "Field mean of %s from %s in blocks of %s time steps",
+                varname,
+                fname,
+                block_size,
+            )
+            for start in range(0, ntime, block_size):
+                block = var[start : start + block_size].values.astype(float)
+                block_sums, block_areas = _weighted_sums(
+                    block, node_areas, n32=n32 if on_3d_nodes else None
+                )
+                sums.append(block_sums)
+                areas.append(block_areas)
+            times.append(ds["time"].values)
+    if not times:
+        raise ValueError("No files to compute the field mean of %s" % varname)
+    sums, areas = np.concatenate(sums), np.concatenate(areas)
+    time = np.concatenate(times)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if level_dim is None:
+            return xr.Dataset(
+                {varname: ("time", sums / areas, attrs)}, coords={"time": time}
+            )
+        nlevels = sums.shape[1]
+        if depths is None:
+            depths = level_coord if level_coord is not None else np.arange(nlevels)
+        depths = np.asarray(depths, dtype=float)[:nlevels]
+        thickness = level_thickness(depths)
+        return xr.Dataset(
+            {
+                varname: (
+                    "time",
+                    np.dot(sums, thickness) / np.dot(areas, thickness),
+                    attrs,
+                ),
+                varname + "_levels": (("time", level_dim), sums / areas, attrs),
+            },
+            coords={"time": time, level_dim: depths},
+        )
@@ -0,0 +1,362 @@
+"""
+Pure Python analysis engine based on ``xarray`` and ``dask``.
+
+By default, all reductions are done by calling ``cdo``. As an alternative,
+the ``XarrayEngine`` opens the model output lazily with
+``xarray.open_mfdataset`` and computes the same reductions with ``dask``,
+either with a pool of threads or of processes. Choose it per analysis
+object::
+
+    >>> analyser = EsmAnalysis(engine="xarray")
+
+or for an experiment with ``engine: xarray`` in its ``.top_of_exp_tree``
+file (or the environment variable ``ESM_ANALYSIS_ENGINE``). The scheduler
+is chosen with ``dask_scheduler: threads`` or ``dask_scheduler: processes``
+(``ESM_ANALYSIS_DASK_SCHEDULER``).
+
+The field mean is weighted by the area of each latitude band, like in
+``cdo fldmean``: on Gaussian grids (as used by ECHAM), these are the Gaussian
+quadrature weights, otherwise the band between the midpoints of neighbouring
+latitudes is used. The weights only depend on the latitudes, so they are
+computed once and cached.
+
+Note
+----
+The files need to be readable by ``xarray``, i.e. NetCDF (or GRIB with
+``cfgrib`` installed and variable names set in the files).
+"""
+
+import functools
+import logging
+import os
+import tempfile
+
+import numpy as np
+import xarray as xr
+
+SCHEDULERS = ("threads", "processes", "synchronous")
+"""The dask schedulers the ``XarrayEngine`` can use"""
+
+OPERATORS = ("fldmean", "yearmean", "ymonmean", "ymonstd", "yseasmean", "timmean")
+"""The reductions implemented by the ``XarrayEngine``"""
+
+_SEASONS = ["DJF", "MAM", "JJA", "SON"]
+
+
+def gaussian_latitudes(nlat):
+    """
+    The latitudes and weights of a Gaussian grid, from north to south.
+
+    Parameters
+    ----------
+    nlat : int
+        The number of latitudes, e.g. 96 for T63
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The latitudes in degrees, and the weights (summing up to 2)
+    """
+    nodes, weights = np.polynomial.legendre.leggauss(nlat)
+    return np.degrees(np.arcsin(nodes))[::-1], weights[::-1]
+
+
+def area_weights(lat):
+    """
+    Relative area of each latitude band of a regular or Gaussian grid.
+
+    Parameters
+    ----------
+    lat : array-like
+        The latitudes of the grid in degrees, in either order
+
+    Returns
+    -------
+    np.ndarray
+        One weight per latitude, summing up to 1
+    """
+    return _area_weights(tuple(float(value) for value in np.asarray(lat)))
+
+
+@functools.lru_cache(maxsize=32)
+def _area_weights(lat):
+    lat = np.array(lat)
+    order = np.argsort(lat)
+    gaussian_lat, gaussian_weights = gaussian_latitudes(len(lat))
+    if np.allclose(np.sort(lat), np.sort(gaussian_lat), atol=1e-4):
+        logging.debug("Using Gaussian weights for %s latitudes", len(lat))
+        weights = np.empty(len(lat))
+        weights[order] = gaussian_weights[np.argsort(gaussian_lat)]
+    else:
+        logging.debug("Using latitude band weights for %s latitudes", len(lat))
+        sorted_lat = lat[order]
+        bounds = np.concatenate(
+            [[-90.0], (sorted_lat[1:] + sorted_lat[:-1]) / 2.0, [90.0]]
+        )
+        weights = np.empty(len(lat))
+        weights[order] = np.diff(np.sin(np.radians(bounds)))
+    return weights / weights.sum()
+
+
+def check_variables(names, available, source):
+    """
+    Raises a ``ValueError`` naming the variables of ``names`` which are not
+    ``available`` in ``source`` (a description of the input files)
+    """
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise ValueError(
+            "Variable(s) %s not found in %s" % (", ".join(missing), source)
+        )
+
+
+def _lat_name(ds):
+    for name in ("lat", "latitude"):
+        if name in ds.dims:
+            return name
+    raise ValueError("Cannot find a latitude dimension in %s" % list(ds.dims))
+
+
+def _lon_name(ds):
+    for name in ("lon", "longitude"):
+        if name in ds.dims:
+            return name
+    raise ValueError("Cannot find a longitude dimension in %s" % list(ds.dims))
+
+
+def _group_end_times(ds, groups, keys):
+    """The last time step of each group, which ``cdo`` uses as time stamp"""
+    end_times = {
+        key: ds.time.values[indices][-1] for key, indices in groups.groups.items()
+    }
+    return np.array([end_times[key] for key in keys])
+
+
+class XarrayEngine(object):
+    """
+    Reductions of model output with ``xarray`` and ``dask``
+
+    Parameters
+    ----------
+    scheduler : str
+        The dask scheduler, ``"threads"`` or ``"processes"``. ``"synchronous"``
+        computes everything in the calling thread, which is helpful for
+        debugging.
+    num_workers : int, optional
+        Number of threads or processes, by default the number of CPUs
+    """
+
+    #: The engine's name, as in ``EsmAnalysis(engine=...)``
+    NAME = "xarray"
+
+    def __init__(self, scheduler="threads", num_workers=None):
+        if scheduler not in SCHEDULERS:
+            raise ValueError(
+                "Unknown dask scheduler %s, choose from %s" % (scheduler, SCHEDULERS)
+            )
+        self.scheduler = scheduler
+        self.num_workers = num_workers
+
+    def open(self, varnames, file_list):
+        """
+        Opens ``varnames`` from all files in ``file_list`` as one lazy dataset
+
+        Parameters
+        ----------
+        varnames : list of str
+        file_list : list of str
+            The files, which are concatenated along time in this order
+
+        Returns
+        -------
+        xr.Dataset
+        """
+        # The files are opened one after the other: opening them in dask
+        # threads (``parallel=True``) intermittently fails with "NetCDF: HDF
+        # error", since the netCDF library is not thread-safe.
+        ds = xr.open_mfdataset(
+            list(file_list),
+            combine="nested",
+            concat_dim="time",
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+        )
+        check_variables(varnames, ds, "%s and the other input files" % file_list[0])
+        return ds[list(varnames)]
+
+    # The reductions, all on lazy datasets:
+    def fldmean(self, ds):
+        """Area weighted mean over the horizontal dimensions"""
+        lat, lon = _lat_name(ds), _lon_name(ds)
+        weights = xr.DataArray(area_weights(ds[lat].values), dims=lat)
+        out = ds.weighted(weights).mean((lat, lon), keep_attrs=True)
+        # Keep the (now single) horizontal dimensions, like cdo:
+        return out.expand_dims({lat: [0.0], lon: [0.0]}).transpose("time", ...)
+
+    def yearmean(self, ds):
+        """Mean of each year"""
+        groups = ds.groupby("time.year")
+        out = groups.mean("time", keep_attrs=True)
+        return out.assign_coords(
+            year=_group_end_times(ds, groups, out.year.values)
+        ).rename(year="time")
+
+    def ymonmean(self, ds):
+        """Mean of each calendar month over all years"""
+        groups = ds.groupby("time.month")
+        out = groups.mean("time", keep_attrs=True)
+        return out.assign_coords(
+            month=_group_end_times(ds, groups, out.month.values)
+        ).rename(month="time")
+
+    def ymonstd(self, ds):
+        """Standard deviation of each calendar month over all years (like
+        ``cdo ymonstd``, normalized by n)"""
+        groups = ds.groupby("time.month")
+        out = groups.std("time", ddof=0, keep_attrs=True)
+        return out.assign_coords(
+            month=_group_end_times(ds, groups, out.month.values)
+        ).rename(month="time")
+
+    def yseasmean(self, ds):
+        """Mean of each season (DJF, MAM, JJA, SON) over all years"""
+        groups = ds.groupby("time.season")
+        out = groups.mean("time", keep_attrs=True)
+        out = out.sel(season=[season for season in _SEASONS if season in out.season])
+        return out.assign_coords(
+            season=_group_end_times(ds, groups, out.season.values)
+        ).rename(season="time")
+
+    def timmean(self, ds):
+        """Mean over all time steps"""
+        out = ds.mean("time", keep_attrs=True)
+        return out.expand_dims(time=[ds.time.values[-1]])
+
+    def _compute(self, collections):
+        import dask
+
+        with dask.config.set(scheduler=self.scheduler, num_workers=self.num_workers):
+            return dask.compute(*collections)
+
+    def reduce(self, operator, varnames, file_list, output=None):
+        """
+        Applies ``operator`` to ``varnames`` from ``file_list``
+
+        Parameters
+        ----------
+        operator : str
+            One of ``OPERATORS``
+        varnames : list of str
+        file_list : list of str
+        output : str, optional
+            The output file; a temporary file if not given, which the caller
+            has to remove.
+
+        Returns
+        -------
+        str
+            The output file
+        """
+        return self.reductions([operator], varnames, file_list, {operator: output})[
+            operator
+        ]
+
+    def reductions(self, operators, varnames, file_list, outputs=None):
+        """
+        Applies several ``operators`` to ``varnames`` from ``file_list``
+
+        All results are computed in a single dask graph, so every chunk of
+        the input is only read once, no matter how many operators need it.
+
+        Parameters
+        ----------
+        operators : list of str
+        varnames : list of str
+        file_list : list of str
+        outputs : dict, optional
+            The output file of each operator; temporary files (which the
+            caller has to remove) for any operator without one.
+
+        Returns
+        -------
+        dict
+            The output file of each operator
+        """
+        for operator in operators:
+            if operator not in OPERATORS:
+                raise ValueError("The xarray engine cannot compute %s" % operator)
+        outputs = self._output_files(operators, outputs)
+        ds = self.open(varnames, file_list)
+        logging.info(
+            "Computing %s of %s from %s files with %s",
+            ", ".join(operators),
+            ", ".join(varnames),
+            len(file_list),
+            self.scheduler,
+        )
+        # The results are small, so they are computed into memory (which
+        # also works with the process pool) and written afterwards:
+        results = self._compute([getattr(self, operator)(ds) for operator in operators])
+        ds.close()
+        for operator, result in zip(operators, results):
+            self._write(result, outputs[operator])
+        return {operator: outputs[operator] for operator in operators}
+
+    @staticmethod
+    def _output_files(operators, outputs=None):
+        """
+        ``outputs``, with temporary files for operators without one, which
+        the caller has to remove
+        """
+        outputs = dict(outputs or {})
+        for operator in operators:
+            if outputs.get(operator) is None:
+                fd, outputs[operator] = tempfile.mkstemp(
+                    prefix="esm_analysis_" + operator + "_", suffix=".nc"
+                )
+                os.close(fd)
+        return outputs
+
+    @staticmethod
+    def _write(result, output):
+        """Writes the dataset ``result`` to ``output``, atomically"""
+        result.to_netcdf(output + ".tmp")
+        os.replace(output + ".tmp", output)
+
+    def split(self, combined, outputs):
+        """
+        Writes each variable of the file ``combined`` into its own file.
+
+        Parameters
+        ----------
+        combined : str
+            The file with all variables; it is removed afterwards.
+        outputs : dict
+            The output file of each variable
+        """
+        with xr.open_dataset(combined) as ds:
+            check_variables(outputs, ds, "the input files")
+            for varname, output in outputs.items():
+                ds[[varname]].to_netcdf(output + ".tmp")
+                os.replace(output + ".tmp", output)
+        os.remove(combined)
+
+    def mergetime(self, existing, new_part, output, drop_years=None):
+        """
+        Merges two files along time into ``output``
+
+        Parameters
+        ----------
+        existing, new_part : str
+            The files to merge
+        output : str
+        drop_years : list of int, optional
+            Years to remove from ``existing`` before merging, since they are
+            (again) contained in ``new_part``.
+        """
+        with xr.open_dataset(existing) as old, xr.open_dataset(new_part) as new:
+            if drop_years:
+                old = old.sel(time=~old.time.dt.year.isin(drop_years))
+            merged = xr.concat([old, new], dim="time", data_vars="minimal")
+            merged.sortby("time").to_netcdf(output)
@@ -11,7 +11,14 @@ with open("README.rst") as readme_file:
 with open("HISTORY.rst") as history_file:
     history = history_file.read()
 
-requirements = ["cdo", "Click>=6.0", "pandas", "tabulate", "regex-engine", "pyyaml"]
+requirements = [
+    "cdo",
+    "Click>=6.0",
+    "pandas>=2.0",
+    "tabulate",
+    "regex-engine",
+    "pyyaml",
+]
 
 setup_requirements = []
 
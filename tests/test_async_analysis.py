@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.async_analysis`."""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+import esm_analysis as package
+from esm_analysis.async_analysis import AsyncEsmAnalysis
+
+from .test_xarray_engine import write_monthly_files
+
+
+class TestAsyncEsmAnalysis(unittest.TestCase):
+    """Concurrent analyses from an event loop"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "EXP")
+        self.outdata = os.path.join(self.exp_base, "outdata", "echam")
+        os.makedirs(self.outdata)
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\nengine: xarray\n")
+        files = write_monthly_files(
+            self.outdata,
+            [1850, 1851],
+            np.linspace(-80, 80, 8),
+            np.arange(0, 360, 30),
+            varnames=("temp2", "aprl"),
+        )
+        for fname in files:
+            os.rename(fname, fname.replace(".nc", ".grb"))
+        with open(
+            os.path.join(self.outdata, "EXP_echam6_echam_185001.codes"), "w"
+        ) as f:
+            f.write("  167   1  temp2  0 0  2m temperature\n")
+            f.write("  142   1  aprl  0 0  large scale precipitation\n")
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_gather(self):
+        async def analyze():
+            async with AsyncEsmAnalysis(
+                exp_base=self.exp_base, max_concurrency=2
+            ) as analyser:
+                return await asyncio.gather(
+                    analyser.fldmean("temp2"),
+                    analyser.fldmean(["temp2", "aprl"]),
+                    analyser.ymonmean(["aprl", "temp2"]),
+                    analyser.run([("yearmean", "aprl"), ("fldmean", "aprl")]),
+                )
+
+        t2m, fldmeans, ymonmeans, results = asyncio.run(analyze())
+        self.assertEqual(fldmeans["temp2"], t2m)
+        self.assertEqual(list(ymonmeans), ["aprl", "temp2"])
+        self.assertEqual(list(results), ["yearmean", "fldmean"])
+        self.assertEqual(results["fldmean"]["aprl"], fldmeans["aprl"])
+        with xr.open_dataset(t2m) as ds:
+            self.assertEqual(ds.temp2.shape[0], 24)
+        with xr.open_dataset(ymonmeans["aprl"]) as ds:
+            self.assertEqual(ds.aprl.shape[0], 12)
+        with xr.open_dataset(results["yearmean"]["aprl"]) as ds:
+            self.assertEqual(ds.aprl.shape[0], 2)
+        # The same results as without asyncio:
+        sync = package.EsmAnalysis(exp_base=self.exp_base)
+        sync.initialize_analysis_components()
+        self.assertEqual(sync.fldmean("temp2"), t2m)
+
+    def test_unknown_operator(self):
+        analyser = AsyncEsmAnalysis(exp_base=self.exp_base)
+        self.addCleanup(analyser.close)
+        with self.assertRaisesRegex(ValueError, "Unknown analysis"):
+            asyncio.run(analyser.analyze("fldmaen", "temp2"))
+        with self.assertRaisesRegex(ValueError, "Unknown analysis"):
+            asyncio.run(analyser.run([("__init__", "temp2")]))
+        self.assertIs(package.AsyncEsmAnalysis, AsyncEsmAnalysis)
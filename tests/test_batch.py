@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.batch`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from esm_analysis import batch, cli
+
+from .test_xarray_engine import write_monthly_files
+
+
+def crash(*args):
+    """Stands in for an analysis which takes down its process"""
+    os._exit(1)
+
+
+def make_experiment(base, exp_id, with_output=True):
+    """An experiment with two years of ECHAM output, analysed with xarray"""
+    outdata = os.path.join(base, exp_id, "outdata", "echam")
+    os.makedirs(outdata)
+    with open(os.path.join(base, exp_id, ".top_of_exp_tree"), "w") as f:
+        f.write("# Top of experiment\nengine: xarray\n")
+    if with_output:
+        files = write_monthly_files(
+            outdata, [1850, 1851], np.linspace(-80, 80, 8), np.arange(0, 360, 30)
+        )
+        for fname in files:
+            os.rename(fname, fname.replace(".nc", ".grb").replace("EXP_", exp_id + "_"))
+        with open(
+            os.path.join(outdata, exp_id + "_echam6_echam_185001.codes"), "w"
+        ) as f:
+            f.write("  167   1  temp2  0 0  2m temperature\n")
+    return os.path.join(base, exp_id)
+
+
+class TestBatch(unittest.TestCase):
+    """Tests for the analysis of many experiments"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.experiments = [
+            make_experiment(self.tmpdir, "PI"),
+            make_experiment(self.tmpdir, "LGM"),
+            make_experiment(self.tmpdir, "EMPTY", with_output=False),
+        ]
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_experiments(self):
+        os.makedirs(os.path.join(self.tmpdir, "not_an_experiment"))
+        self.assertEqual(
+            batch.find_experiments([self.tmpdir]), sorted(self.experiments)
+        )
+        self.assertEqual(
+            batch.find_experiments(self.experiments[:1]), self.experiments[:1]
+        )
+
+    def test_failures_do_not_stop_the_others(self):
+        results = batch.run_across_experiments(
+            [self.tmpdir], "fldmean", "temp2", max_workers=2, memory_limit="4G"
+        )
+        self.assertEqual([result.exp_id for result in results], ["EMPTY", "LGM", "PI"])
+        self.assertIsNotNone(results[0].error)
+        for result in results[1:]:
+            self.assertIsNone(result.error)
+            with xr.open_dataset(result.output) as ds:
+                self.assertEqual(ds.temp2.shape[0], 24)
+        rows = batch.summary(results)
+        self.assertEqual([row["status"] for row in rows], ["failed", "ok", "ok"])
+        with self.assertRaisesRegex(ValueError, "Unknown analysis"):
+            batch.run_across_experiments([self.tmpdir], "__init__", "temp2")
+
+    def test_crashes_do_not_stop_the_others(self):
+        with mock.patch.object(batch, "_analyze_experiment", crash):
+            results = batch.run_across_experiments(
+                self.experiments[:2], "fldmean", "temp2", max_workers=2
+            )
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIn("worker process died", result.error)
+
+    def test_command_line_interface(self):
+        result = CliRunner().invoke(
+            cli.main,
+            ["batch", "-e", self.experiments[0], "-e", self.experiments[1]]
+            + ["ymonmean", "temp2"],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("PI_echam6_temp2_ymonmean.nc", result.output)
+        self.assertIn("LGM_echam6_temp2_ymonmean.nc", result.output)
+        result = CliRunner().invoke(
+            cli.main, ["batch", "--experiments", self.tmpdir, "fldmean", "temp2"]
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("1 of 3 experiments failed", result.output)
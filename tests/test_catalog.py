@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.catalog`."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from esm_analysis.catalog import OutdataCatalog, date_key, parse_date_from_filename
+
+
+class TestOutdataCatalog(unittest.TestCase):
+    """Tests for the SQLite outdata catalog"""
+
+    def setUp(self):
+        """Set up a small fake ECHAM outdata directory"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.outdata = os.path.join(self.tmpdir, "echam") + "/"
+        os.makedirs(self.outdata)
+        for year in (1850, 1851):
+            for month in range(1, 13):
+                self._touch("EXP_echam6_echam_%04d%02d.grb" % (year, month))
+        self.variables = {
+            "echam6_echam.grb": {"temp2": {"short_name": "temp2", "code_number": "167"}}
+        }
+        self.catalog = OutdataCatalog(os.path.join(self.tmpdir, "catalog.sqlite"))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.catalog.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, fname):
+        open(self.outdata + fname, "w").close()
+
+    def test_parse_date(self):
+        self.assertEqual(
+            parse_date_from_filename("EXP_echam6_echam_185002.grb"), 18500201
+        )
+        self.assertEqual(
+            parse_date_from_filename("EXP_fesom_sst_18500101.nc"), 18500101
+        )
+        self.assertIsNone(parse_date_from_filename("EXP_fesom_sst.nc"))
+
+    def test_date_lengths(self):
+        for date, key in [
+            ("1850", 18500101),
+            ("185002", 18500201),
+            ("18500203", 18500203),
+            ("1850020306", 18500203),
+        ]:
+            self.assertEqual(
+                parse_date_from_filename("EXP_echam6_6h_%s.grb" % date), key
+            )
+            self.assertEqual(date_key(date), key)
+        for date in ("18501", "1850011", "185001010", "18500101000"):
+            self.assertIsNone(parse_date_from_filename("EXP_echam6_6h_%s.grb" % date))
+            with self.assertRaisesRegex(ValueError, "Cannot understand date"):
+                date_key(date)
+        self.assertEqual(date_key("1850-02"), 18500201)
+
+    def test_files_for_variable_in_date_range(self):
+        self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        [(component, _, files)] = self.catalog.files_for_variable("temp2")
+        self.assertEqual(component, "echam")
+        self.assertEqual(len(files), 24)
+        [(_, _, files)] = self.catalog.files_for_variable(
+            "temp2", start="1851", end="1851-03"
+        )
+        self.assertEqual(
+            [os.path.basename(f) for f in files],
+            ["EXP_echam6_echam_1851%02d.grb" % month for month in (1, 2, 3)],
+        )
+        self.assertEqual(self.catalog.files_for_variable("aprl"), [])
+
+    def test_incremental_refresh(self):
+        self.assertTrue(
+            self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        )
+        # Nothing changed, so the variables should not even be asked for:
+        self.assertFalse(self.catalog.refresh("echam", self.outdata, None))
+        time.sleep(0.01)
+        self._touch("EXP_echam6_echam_185201.grb")
+        os.remove(self.outdata + "EXP_echam6_echam_185001.grb")
+        self.assertTrue(
+            self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        )
+        [(_, _, files)] = self.catalog.files_for_variable("temp2")
+        self.assertEqual(len(files), 24)
+        self.assertEqual(os.path.basename(files[0]), "EXP_echam6_echam_185002.grb")
+        self.assertEqual(os.path.basename(files[-1]), "EXP_echam6_echam_185201.grb")
+
+    def test_directories_are_kept_apart(self):
+        other = os.path.join(self.tmpdir, "OTHER", "echam") + "/"
+        os.makedirs(other)
+        open(other + "OTHER_echam6_echam_190001.grb", "w").close()
+        self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        self.catalog.refresh("echam", other, lambda: self.variables)
+        self.assertEqual(len(self.catalog.files_for_variable("temp2")), 2)
+        [(_, _, files)] = self.catalog.files_for_variable("temp2", directories=[other])
+        self.assertEqual(files, [other + "OTHER_echam6_echam_190001.grb"])
+        [(_, _, files)] = self.catalog.files_for_variable(
+            "temp2", directories=[self.outdata]
+        )
+        self.assertEqual(len(files), 24)
+        # Refreshing one directory leaves the other one alone:
+        self.assertFalse(self.catalog.refresh("echam", self.outdata, None))
+
+    def test_outdated_catalog_is_emptied(self):
+        self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        with self.catalog._conn:
+            self.catalog._conn.execute(
+                "UPDATE meta SET value = '1' WHERE key = 'schema_version'"
+            )
+        self.catalog.close()
+        self.catalog = OutdataCatalog(os.path.join(self.tmpdir, "catalog.sqlite"))
+        self.assertEqual(self.catalog.files_for_variable("temp2"), [])
+        # The directory did not change, but is scanned again:
+        self.assertTrue(
+            self.catalog.refresh("echam", self.outdata, lambda: self.variables)
+        )
+        self.assertEqual(len(self.catalog.files_for_variable("temp2")[0][2]), 24)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.daemon`."""
+
+import glob
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from esm_analysis import cli, daemon
+
+from .test_xarray_engine import write_monthly_files
+
+
+def components_available():
+    try:
+        importlib.import_module("esm_analysis.components.echam")
+    except ImportError:
+        return False
+    return True
+
+
+class TestAnalysisDaemon(unittest.TestCase):
+    """Tests for the daemon and its client"""
+
+    def setUp(self):
+        """Set up an experiment, and a daemon in a thread"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "EXP")
+        self.outdata = os.path.join(self.exp_base, "outdata", "echam")
+        os.makedirs(self.outdata)
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\n")
+        self.socket_path = os.path.join(self.tmpdir, "daemon.sock")
+        self.daemon = daemon.AnalysisDaemon(socket_path=self.socket_path)
+        self.daemon.bind()
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.daemon.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def analyze(self, method, varname, **kwargs):
+        return daemon.analyze(
+            method, varname, socket_path=self.socket_path, engine="xarray", **kwargs
+        )
+
+    def test_status(self):
+        self.assertTrue(daemon.is_running(self.socket_path))
+        status = daemon.request("status", socket_path=self.socket_path)
+        self.assertEqual(status["pid"], os.getpid())
+        self.assertEqual(status["experiments"], [])
+        # Only the user can connect:
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o077, 0)
+
+    def test_socket_of_another_user(self):
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            self.assertFalse(daemon.is_running(self.socket_path))
+            with self.assertRaisesRegex(PermissionError, "another user"):
+                daemon.request("status", socket_path=self.socket_path)
+
+    def test_only_one_daemon_per_socket(self):
+        with self.assertRaises(daemon.DaemonError):
+            daemon.AnalysisDaemon(socket_path=self.socket_path).bind()
+        with self.assertRaises(daemon.DaemonError):
+            daemon.start(socket_path=self.socket_path)
+
+    def test_errors_are_sent_back(self):
+        with self.assertRaisesRegex(daemon.DaemonError, "not within an experiment"):
+            self.analyze("fldmean", "temp2", cwd=self.tmpdir)
+        with self.assertRaisesRegex(daemon.DaemonError, "Unknown analysis"):
+            self.analyze("__init__", "temp2", cwd=self.exp_base)
+        # The daemon keeps running:
+        self.assertTrue(daemon.is_running(self.socket_path))
+
+    def test_experiments_are_kept_loaded(self):
+        # No components, so the variable cannot be found:
+        for _ in range(2):
+            with self.assertRaises(daemon.DaemonError):
+                self.analyze("fldmean", "temp2", cwd=self.outdata)
+        (experiment,) = self.daemon._experiments.values()
+        self.assertEqual(
+            daemon.request("status", socket_path=self.socket_path)["experiments"],
+            [os.path.realpath(self.exp_base)],
+        )
+        with self.assertRaises(daemon.DaemonError):
+            self.analyze("fldmean", "temp2", exp_base=self.exp_base)
+        self.assertIs(list(self.daemon._experiments.values())[0], experiment)
+        # A changed configuration loads the experiment again:
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "a") as f:
+            f.write("result_cache_quota: 1G\n")
+        with self.assertRaises(daemon.DaemonError):
+            self.analyze("fldmean", "temp2", exp_base=self.exp_base)
+        (reloaded,) = self.daemon._experiments.values()
+        self.assertIsNot(reloaded, experiment)
+        self.assertEqual(reloaded.analyser.RESULT_CACHE_QUOTA, "1G")
+
+    def test_command_line_client(self):
+        with mock.patch.dict(os.environ, {"ESM_ANALYSIS_SOCKET": self.socket_path}):
+            result = CliRunner().invoke(cli.main, ["daemon", "status"])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn(self.socket_path, result.output)
+            cwd = os.getcwd()
+            os.chdir(self.outdata)
+            try:
+                result = CliRunner().invoke(cli.main, ["fldmean", "temp2"])
+            finally:
+                os.chdir(cwd)
+        # The error comes from the daemon:
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("Error: IndexError", result.output)
+
+    @unittest.skipUnless(components_available(), "components cannot be imported")
+    def test_analysis(self):
+        files = write_monthly_files(
+            self.outdata, [1850, 1851], np.linspace(-80, 80, 8), np.arange(0, 360, 30)
+        )
+        for fname in files:
+            os.rename(fname, fname.replace(".nc", ".grb"))
+        with open(
+            os.path.join(self.outdata, "EXP_echam6_echam_185001.codes"), "w"
+        ) as f:
+            f.write("  167   1  temp2  0 0  2m temperature\n")
+        output = self.analyze("fldmean", "temp2", cwd=self.outdata)
+        with xr.open_dataset(output) as ds:
+            self.assertEqual(ds.temp2.shape[0], 24)
+        outputs = self.analyze("reductions", "temp2", cwd=self.outdata)
+        self.assertEqual(outputs["fldmean"], output)
+        self.assertEqual(
+            sorted(outputs),
+            sorted(["fldmean", "yearmean", "ymonmean", "yseasmean", "timmean"]),
+        )
+        self.assertTrue(
+            glob.glob(os.path.join(self.exp_base, "analysis", "echam", "*"))
+        )
+
+    def test_experiments_are_loaded_in_parallel(self):
+        other = os.path.join(self.tmpdir, "OTHER")
+        shutil.copytree(self.exp_base, other)
+        released = threading.Event()
+        original = daemon._Experiment.__init__
+
+        def load(experiment, exp_base, *args):
+            if exp_base == self.exp_base:
+                released.wait(10)
+            original(experiment, exp_base, *args)
+
+        with mock.patch.object(
+            daemon._Experiment, "__init__", autospec=True, side_effect=load
+        ) as init:
+            threads = [
+                threading.Thread(
+                    target=self.daemon._experiment, args=(self.exp_base, None, None)
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            # Not blocked by the experiment being loaded:
+            thread = threading.Thread(
+                target=self.daemon._experiment, args=(other, None, None)
+            )
+            thread.start()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+            released.set()
+            for thread in threads:
+                thread.join()
+        # Once each:
+        self.assertEqual(
+            sorted(call.args[1] for call in init.call_args_list),
+            [self.exp_base, other],
+        )
+
+
+class TestSocketPath(unittest.TestCase):
+    """Tests for the default socket"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        mock.patch.object(tempfile, "tempdir", self.tmpdir).start()
+        environ = {
+            key: value
+            for key, value in os.environ.items()
+            if key not in ("ESM_ANALYSIS_SOCKET", "XDG_RUNTIME_DIR")
+        }
+        mock.patch.dict(os.environ, environ, clear=True).start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        mock.patch.stopall()
+        shutil.rmtree(self.tmpdir)
+
+    def test_private_directory(self):
+        path = daemon.default_socket_path()
+        directory = os.path.join(self.tmpdir, "esm_analysis-%s" % os.getuid())
+        self.assertEqual(os.path.dirname(path), directory)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+        self.assertEqual(daemon.default_socket_path(), path)
+        # Which others could write to:
+        os.chmod(directory, 0o777)
+        with self.assertRaises(PermissionError):
+            daemon.default_socket_path()
+
+    def test_directory_of_another_user(self):
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            os.mkdir(os.path.join(self.tmpdir, "esm_analysis-%s" % os.getuid()))
+            with self.assertRaises(PermissionError):
+                daemon.default_socket_path()
+
+    def test_runtime_directory(self):
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": self.tmpdir}):
+            self.assertEqual(
+                daemon.default_socket_path(),
+                os.path.join(self.tmpdir, "esm_analysis-%s.sock" % os.getuid()),
+            )
+        self.assertEqual(os.listdir(self.tmpdir), [])
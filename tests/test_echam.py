@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.components.echam`, with the fake ``cdo``."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from benchmarks.synthetic import ECHAM_STREAMS, FAKE_CDO, make_experiment
+from esm_analysis.components import echam
+from esm_analysis.esm_analysis import EsmAnalysis
+from esm_analysis.result_cache import cache_key
+
+
+def values(fname, varname="temp2"):
+    """The values of ``varname`` in ``fname``, without the singleton dimensions"""
+    with xr.open_dataset(fname) as ds:
+        return ds[varname].values.squeeze()
+
+
+class EchamTestCase(unittest.TestCase):
+    """Two years of monthly ECHAM output, with data"""
+
+    ENGINE = "cdo"
+    CDO = FAKE_CDO
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.environ = mock.patch.dict(os.environ, {"CDO": self.CDO})
+        self.environ.start()
+        self.exp_base = make_experiment(
+            self.tmpdir,
+            "EXP",
+            # A .grb and a .codes file per month:
+            nfiles=2 * 24,
+            streams={"echam": ECHAM_STREAMS["echam"]},
+            netcdf_streams=(),
+            fesom_variables=(),
+            log_lines=0,
+            data=True,
+        )
+        analyser = EsmAnalysis(exp_base=self.exp_base, engine=self.ENGINE)
+        analyser.initialize_analysis_components()
+        self.echam = analyser.echam6
+        self.flist = self.echam._get_files_for_variable_short_name_single_component(
+            "temp2"
+        )
+        self.spy = mock.patch.object(
+            self.echam, "_select_and_reduce", wraps=self.echam._select_and_reduce
+        ).start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        mock.patch.stopall()
+        self.environ.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def reference(self, operator, varname="temp2", file_list=None):
+        """``operator`` on ``varname`` computed from scratch, without any cache"""
+        output = os.path.join(self.tmpdir, "%s_%s.nc" % (varname, operator))
+        self.echam._select_and_reduce(
+            operator, varname, file_list or self.flist, output
+        )
+        return output
+
+    def processed(self):
+        """The file lists given to ``_select_and_reduce`` so far"""
+        return [call.args[2] for call in self.spy.call_args_list]
+
+
+class TestIncremental(EchamTestCase):
+    """The three ways ``_incremental`` brings an output up to date"""
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = os.path.join(self.tmpdir, "tmp")
+        os.makedirs(self.tempdir)
+        mock.patch.object(tempfile, "tempdir", self.tempdir).start()
+
+    def assertNoTemporaryFiles(self):
+        self.assertEqual(os.listdir(self.tempdir), [])
+        self.assertEqual(
+            [f for f in os.listdir(self.echam.ANALYSIS_DIR) if "tmp" in f], []
+        )
+
+    def test_append(self):
+        self.echam.fldmean("temp2", self.flist[:18], incremental=True)
+        output = self.echam.fldmean("temp2", self.flist, incremental=True)
+        self.assertEqual(self.processed(), [self.flist[:18], self.flist[18:]])
+        np.testing.assert_allclose(values(output), values(self.reference("fldmean")))
+        self.assertEqual(values(output).shape, (24,))
+        self.assertNoTemporaryFiles()
+
+    def test_yearmean_replaces_partial_year(self):
+        self.echam.yearmean("temp2", self.flist[:18], incremental=True)
+        output = self.echam.yearmean("temp2", self.flist, incremental=True)
+        # All of 1851 again, and nothing of 1850:
+        self.assertEqual(self.processed(), [self.flist[:18], self.flist[12:]])
+        self.assertEqual(values(output).shape[0], 2)
+        np.testing.assert_allclose(values(output), values(self.reference("yearmean")))
+        self.assertNoTemporaryFiles()
+
+    def test_rebuild_when_inputs_change(self):
+        output = self.echam.fldmean("temp2", self.flist, incremental=True)
+        first = values(output)
+        first_key = cache_key(
+            ["fldmean", "select,name=temp2"],
+            "temp2",
+            self.echam._cache_options,
+            self.flist,
+        )
+        with xr.open_dataset(self.flist[0]) as ds:
+            changed = ds.load()
+        changed["temp2"] = changed.temp2 + 100
+        changed.to_netcdf(self.flist[0])
+        output = self.echam.fldmean("temp2", self.flist, incremental=True)
+        self.assertEqual(self.processed(), [self.flist, self.flist])
+        # Not written in place, where the cached result would change as well:
+        self.assertNotEqual(self.spy.call_args.args[3], output)
+        np.testing.assert_allclose(values(output)[0], first[0] + 100)
+        np.testing.assert_allclose(values(output)[1:], first[1:])
+        # The replaced result is dropped from the cache:
+        self.assertFalse(os.path.exists(self.echam.result_cache.object_path(first_key)))
+
+
+class TestIncrementalXarray(TestIncremental):
+    """The same, with the xarray engine"""
+
+    ENGINE = "xarray"
+
+
+class TestReduceMany(EchamTestCase):
+    """Several variables from one read, split into a file each"""
+
+    def test_split(self):
+        log = os.path.join(self.tmpdir, "cdo.log")
+        with mock.patch.dict(os.environ, {"FAKE_CDO_LOG": log}):
+            outputs = self.echam.fldmean(["temp2", "aprl", "aprc"], self.flist)
+        self.assertEqual(list(outputs), ["temp2", "aprl", "aprc"])
+        # The synthetic fields of the variables scatter around 0, 1 and 2:
+        for index, (varname, output) in enumerate(outputs.items()):
+            self.assertEqual(
+                os.path.basename(output), "EXP_echam6_%s_fldmean.nc" % varname
+            )
+            with xr.open_dataset(output) as ds:
+                self.assertEqual(list(ds.data_vars), [varname])
+                self.assertLess(abs(float(ds[varname].mean()) - index), 0.5)
+        if self.ENGINE == "cdo":
+            with open(log) as f:
+                reading = [c for c in f.read().splitlines() if self.flist[0] in c]
+            self.assertEqual(len(reading), 1)
+            self.assertIn("-select,name=temp2,aprl,aprc", reading[0])
+
+    def test_missing_variable(self):
+        with self.assertRaisesRegex(ValueError, "nope not found"):
+            self.echam.fldmean(["temp2", "nope"], self.flist)
+        self.assertFalse(os.path.exists(self.echam._analysis_file("temp2", "fldmean")))
+        self.assertEqual(self.echam.result_cache.stats()["entries"], 0)
+        self.assertEqual(
+            [f for f in os.listdir(self.echam.ANALYSIS_DIR) if "split" in f], []
+        )
+
+
+class TestReduceManyXarray(TestReduceMany):
+    """The same, with the xarray engine"""
+
+    ENGINE = "xarray"
+
+
+class TestReductions(EchamTestCase):
+    """Several reductions from one read of the files"""
+
+    def test_reductions(self):
+        log = os.path.join(self.tmpdir, "cdo.log")
+        with mock.patch.dict(os.environ, {"FAKE_CDO_LOG": log}):
+            outputs = self.echam.reductions("temp2", self.flist)
+        self.assertEqual(sorted(outputs), sorted(echam.REDUCTIONS))
+        if self.ENGINE == "cdo":
+            with open(log) as f:
+                reading = [c for c in f.read().splitlines() if self.flist[0] in c]
+            self.assertEqual(len(reading), 1)
+            self.assertIn("select", reading[0])
+        # Nothing is left of the selection and the intermediate results:
+        leftovers = [
+            os.path.join(root, fname)
+            for root, _, fnames in os.walk(self.echam.ANALYSIS_DIR)
+            for fname in fnames + [os.path.basename(root)]
+            if "selected" in fname or "reductions" in fname
+        ]
+        self.assertEqual(leftovers, [])
+        for operator, output in outputs.items():
+            with self.subTest(operator=operator):
+                self.assertEqual(output, self.echam._analysis_file("temp2", operator))
+                np.testing.assert_allclose(
+                    values(output), values(self.reference(operator))
+                )
+        # Each result is in the cache, as if computed on its own:
+        self.spy.reset_mock()
+        self.assertEqual(self.echam.ymonmean("temp2", self.flist), outputs["ymonmean"])
+        self.spy.assert_not_called()
+
+
+class TestReductionsXarray(TestReductions):
+    """The same, with the xarray engine"""
+
+    ENGINE = "xarray"
+
+
+class TestSelectAndReduce(EchamTestCase):
+    """The fused ``-operator -select`` chain"""
+
+    def test_same_as_select_then_reduce(self):
+        log = os.path.join(self.tmpdir, "cdo.log")
+        selected = os.path.join(self.tmpdir, "selected.nc")
+        self.echam._select("temp2", self.flist, selected)
+        with mock.patch.dict(os.environ, {"FAKE_CDO_LOG": log}):
+            for operator in ("fldmean", "yearmean", "ymonmean", "yseasmean", "timmean"):
+                with self.subTest(operator=operator):
+                    fused = self.reference(operator)
+                    two_steps = getattr(self.echam.CDO, operator)(
+                        input=selected,
+                        output=os.path.join(self.tmpdir, operator + "_2.nc"),
+                    )
+                    with xr.open_dataset(fused) as ds, xr.open_dataset(
+                        two_steps
+                    ) as expected:
+                        xr.testing.assert_allclose(ds.temp2, expected.temp2)
+        with open(log) as f:
+            reading = [c for c in f.read().splitlines() if self.flist[0] in c]
+        # One call each, which never writes the selection:
+        self.assertEqual(len(reading), 5)
+        self.assertTrue(all("-select,name=temp2" in c for c in reading))
+
+
+class TestChunks(EchamTestCase):
+    """Chunked reductions give the same results as unchunked ones"""
+
+    def setUp(self):
+        super().setUp()
+        # A second time step in each file of 1851, so that the two chunks
+        # (years) have different numbers of time steps, and some missing
+        # values, which are left out of the sums and the counts:
+        for index, fname in enumerate(self.flist[12:]):
+            with xr.open_dataset(fname) as ds:
+                ds = ds.load()
+            later = (ds * 3).assign_coords(time=ds.time + np.timedelta64(5, "D"))
+            ds = xr.concat([ds, later], dim="time")
+            ds["temp2"][0, 0, : index % 3] = np.nan
+            ds.to_netcdf(fname, encoding={"temp2": {"_FillValue": -9e33}})
+        self.log = os.path.join(self.tmpdir, "cdo.log")
+        os.environ["FAKE_CDO_LOG"] = self.log
+        self.echam.CDO_THREADS = 2
+        self.echam.MAX_WORKERS = 2
+
+    def chunked(self, operator):
+        output = os.path.join(self.tmpdir, "chunked_%s.nc" % operator)
+        self.echam.CHUNK_SIZE = 12
+        try:
+            self.echam._select_and_reduce(operator, "temp2", self.flist, output)
+        finally:
+            self.echam.CHUNK_SIZE = echam.EchamAnalysis.CHUNK_SIZE
+        return output
+
+    def test_chunks_equal_no_chunks(self):
+        for operator in ("timmean", "ymonmean", "fldmean"):
+            with self.subTest(operator=operator):
+                np.testing.assert_allclose(
+                    values(self.chunked(operator)),
+                    values(self.reference(operator)),
+                    rtol=1e-5,
+                )
+        if self.CDO != FAKE_CDO:
+            return
+        with open(self.log) as f:
+            reading = [c for c in f.read().splitlines() if self.flist[0] in c]
+        # Each chunk is read by a CDO with two threads (in the chunk pool),
+        # for the sums and the counts of the means, and all files are read
+        # once for each reference:
+        self.assertEqual(
+            ["-P 2" in command for command in reading],
+            [True, True, False, True, True, False, True, False],
+        )
+        self.assertTrue(all("-select,name=temp2" in c for c in reading))
+
+    def test_incomplete_year(self):
+        # The second chunk misses August to December:
+        self.flist = self.flist[:-5]
+        for operator in ("ymonmean", "yseasmean", "timmean", "ymonstd"):
+            with self.subTest(operator=operator):
+                chunked, reference = self.chunked(operator), self.reference(operator)
+                np.testing.assert_allclose(
+                    values(chunked), values(reference), rtol=1e-5
+                )
+                with xr.open_dataset(chunked) as a, xr.open_dataset(reference) as b:
+                    np.testing.assert_array_equal(a.time.values, b.time.values)
+        if self.CDO != FAKE_CDO:
+            return
+        with open(self.log) as f:
+            reading = [c for c in f.read().splitlines() if self.flist[-1] in c]
+        # The chunks are only summed, the selection is never written:
+        in_chunks = [c for c in reading if "-P 2" in c]
+        self.assertEqual(len(in_chunks), 2 + 2 + 2 + 3)
+        self.assertTrue(all("sum -" in c for c in in_chunks), in_chunks)
+
+    def test_init_chunk_worker(self):
+        with mock.patch.dict(os.environ), mock.patch.object(echam, "_WORKER_CDO"):
+            echam._init_chunk_worker(3)
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "3")
+            self.assertEqual(type(echam._WORKER_CDO).__name__, "Cdo")
+
+
+@unittest.skipIf(shutil.which("cdo") is None, "cdo is not installed")
+class TestChunksRealCdo(TestChunks):
+    """The same, with the real ``cdo`` and its handling of missing values"""
+
+    CDO = shutil.which("cdo")
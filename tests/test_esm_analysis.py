@@ -11,12 +11,49 @@
 
 """Tests for `esm_analysis` package."""
 
-
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 from click.testing import CliRunner
 
+import numpy as np
+import xarray as xr
+
+import esm_analysis as package
 from esm_analysis import esm_analysis
 from esm_analysis import cli
+from esm_analysis import components
+from esm_analysis.components.echam import EchamAnalysis
+
+from .test_xarray_engine import write_monthly_files
+
+HEAVY_MODULES = ("cdo", "dask", "numpy", "pandas", "pyfesom", "tabulate", "xarray")
+"""Modules which must not be imported just to start the command line interface"""
+
+
+def import_times(code):
+    """
+    Runs ``code`` in a new interpreter with ``-X importtime``, and returns the
+    cumulative import time of each module, in seconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative) / 1e6
+    return times
 
 
 class TestEsm_analysis(unittest.TestCase):
@@ -39,3 +76,172 @@ class TestEsm_analysis(unittest.TestCase):
         assert ("--help" in help_result.output) and (
             "Show this message and exit." in help_result.output
         )
+
+
+class TestStartup(unittest.TestCase):
+    """The command line interface only imports what a command needs"""
+
+    def test_help_imports_no_heavy_modules(self):
+        # Which modules are imported is checked, not how long this takes,
+        # which depends on the load of the machine:
+        times = import_times("from esm_analysis import cli; cli.main(['--help'])")
+        self.assertIn("esm_analysis.cli", times)
+        self.assertEqual(
+            [module for module in times if module.split(".")[0] in HEAVY_MODULES], []
+        )
+
+    def test_lazy_attributes(self):
+        self.assertIs(package.EsmAnalysis, esm_analysis.EsmAnalysis)
+        self.assertIn("EsmAnalysis", dir(package) + package.__all__)
+        with self.assertRaises(AttributeError):
+            package.NoSuchThing
+        self.assertIs(components.EchamAnalysis, EchamAnalysis)
+        with self.assertRaises(AttributeError):
+            components.NoSuchAnalysis
+
+
+class TestLazyComponents(unittest.TestCase):
+    """Components are only constructed when they are first needed"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "EXP")
+        outdata = os.path.join(self.exp_base, "outdata", "echam")
+        os.makedirs(outdata)
+        # A component without an analysis class:
+        os.makedirs(os.path.join(self.exp_base, "outdata", "hamocc"))
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\n")
+        for month in (1, 2):
+            open(
+                os.path.join(outdata, "EXP_echam6_echam_1850%02d.grb" % month), "w"
+            ).close()
+        with open(os.path.join(outdata, "EXP_echam6_echam_185001.codes"), "w") as f:
+            f.write("  167   1  temp2  0 0  2m temperature\n")
+        self.analyser = esm_analysis.EsmAnalysis(exp_base=self.exp_base)
+        self.constructed = mock.patch.object(
+            EchamAnalysis,
+            "__init__",
+            autospec=True,
+            side_effect=EchamAnalysis.__init__,
+        )
+        self.init = self.constructed.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.constructed.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_constructed_once_on_first_lookup(self):
+        self.analyser.initialize_analysis_components()
+        self.assertEqual(
+            self.analyser._component_registry, {"echam": None, "hamocc": None}
+        )
+        self.assertEqual(self.init.call_count, 0)
+        flist, component = self.analyser.get_component_for_variable_short_name("temp2")
+        self.assertIsInstance(component, EchamAnalysis)
+        self.assertEqual(len(flist), 2)
+        self.assertEqual(self.init.call_count, 1)
+        self.analyser.get_component_for_variable_short_name("temp2")
+        self.assertIs(self.analyser.echam6, component)
+        self.assertIs(self.analyser.echam, component)
+        self.assertEqual(self.init.call_count, 1)
+        # hamocc has no analysis class, and is forgotten:
+        self.assertNotIn("hamocc", self.analyser._component_registry)
+
+    def test_constructed_on_attribute_access(self):
+        self.analyser.initialize_analysis_components()
+        component = self.analyser.echam6
+        self.assertIsInstance(component, EchamAnalysis)
+        self.assertIs(self.analyser.echam6, component)
+        self.assertEqual(self.init.call_count, 1)
+
+    def test_unknown_attribute(self):
+        self.analyser.initialize_analysis_components()
+        for name in ("no_such_thing", "hamocc", "_private"):
+            with self.assertRaises(AttributeError):
+                getattr(self.analyser, name)
+        self.assertEqual(self.init.call_count, 0)
+
+
+class TestRun(unittest.TestCase):
+    """Several analyses of several variables on one analyzer"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "EXP")
+        self.outdata = os.path.join(self.exp_base, "outdata", "echam")
+        os.makedirs(self.outdata)
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\nengine: xarray\n")
+        files = write_monthly_files(
+            self.outdata,
+            [1850, 1851],
+            np.linspace(-80, 80, 8),
+            np.arange(0, 360, 30),
+            varnames=("temp2", "aprl"),
+        )
+        for fname in files:
+            os.rename(fname, fname.replace(".nc", ".grb"))
+        with open(
+            os.path.join(self.outdata, "EXP_echam6_echam_185001.codes"), "w"
+        ) as f:
+            f.write("  167   1  temp2  0 0  2m temperature\n")
+            f.write("  142   1  aprl  0 0  large scale precipitation\n")
+        self.cwd = os.getcwd()
+        os.chdir(self.outdata)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def analyser(self):
+        analyser = esm_analysis.EsmAnalysis(exp_base=self.exp_base)
+        analyser.initialize_analysis_components()
+        return analyser
+
+    def test_run(self):
+        results = self.analyser().run(
+            [
+                ("fldmean", "temp2"),
+                ("ymonmean", "temp2"),
+                ("fldmean", "aprl"),
+                ("fldmean", "temp2"),
+            ],
+            max_workers=2,
+        )
+        self.assertEqual(list(results), ["fldmean", "ymonmean"])
+        self.assertEqual(list(results["fldmean"]), ["temp2", "aprl"])
+        with xr.open_dataset(results["fldmean"]["aprl"]) as ds:
+            self.assertEqual(ds.aprl.shape[0], 24)
+        with xr.open_dataset(results["ymonmean"]["temp2"]) as ds:
+            self.assertEqual(ds.temp2.shape[0], 12)
+        with self.assertRaisesRegex(ValueError, "Unknown analysis"):
+            self.analyser().run([("__init__", "temp2")])
+
+    def test_command_line_interface(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ["--no-daemon", "fldmean", "temp2", "aprl"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("fldmean for: temp2, aprl", result.output)
+        job_file = os.path.join(self.tmpdir, "analyses.txt")
+        with open(job_file, "w") as f:
+            f.write("# Monthly climatologies\nymonmean:temp2,aprl\n\n")
+        result = runner.invoke(
+            cli.main, ["--no-daemon", "run", "yearmean:temp2", "--file", job_file]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("run 3 analyses of 2 variables", result.output)
+        analysis_dir = os.path.join(self.exp_base, "analysis", "echam")
+        for varname, operator in [
+            ("temp2", "yearmean"),
+            ("temp2", "ymonmean"),
+            ("aprl", "ymonmean"),
+        ]:
+            fname = "EXP_echam6_%s_%s.nc" % (varname, operator)
+            with xr.open_dataset(os.path.join(analysis_dir, fname)) as ds:
+                self.assertIn(varname, ds)
+        result = runner.invoke(cli.main, ["--no-daemon", "run", "fldmaen:temp2"])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("OPERATOR:VARNAME", result.output)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.experiments`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+from esm_analysis import batch, cli, experiments
+from esm_analysis.esm_analysis import EsmAnalysis
+
+
+def make_experiment(path, config="", components=("echam", "fesom")):
+    for component in components:
+        os.makedirs(os.path.join(path, "outdata", component))
+    os.makedirs(os.path.join(path, "scripts"), exist_ok=True)
+    with open(os.path.join(path, experiments.MARKER), "w") as f:
+        f.write("Top of experiment\n" + config)
+    return path
+
+
+class TestExperimentCatalog(unittest.TestCase):
+    """Tests for finding experiments, and the catalog of them"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "cache", "experiments.sqlite")
+        self.environ = mock.patch.dict(
+            os.environ, {"ESM_ANALYSIS_EXPERIMENTS": self.db_path}
+        )
+        self.environ.start()
+        self.project = os.path.join(self.tmpdir, "work", "ab0123")
+        self.pi = make_experiment(
+            os.path.join(self.project, "PMIP", "PI"), "engine: xarray\n"
+        )
+        self.lgm = make_experiment(
+            os.path.join(self.project, "PMIP", "LGM"), components=("echam",)
+        )
+        self.hol = make_experiment(os.path.join(self.project, "user", "x", "HOL"))
+        # Not searched: the experiments themselves, outdata and restart
+        # directories elsewhere, and hidden directories
+        make_experiment(os.path.join(self.pi, "run_18500101", "PI"))
+        for hidden in ("outdata", "restart", ".snapshot"):
+            make_experiment(os.path.join(self.project, hidden, "COPY"))
+        os.symlink(self.project, os.path.join(self.project, "user", "loop"))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.environ.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_scan(self):
+        self.assertEqual(
+            experiments.scan([self.project], max_workers=4),
+            sorted([self.pi, self.lgm, self.hol]),
+        )
+        self.assertEqual(experiments.scan([self.pi]), [self.pi])
+        self.assertEqual(experiments.scan([os.path.join(self.tmpdir, "nothing")]), [])
+
+    def test_find_top_of_tree(self):
+        self.assertEqual(
+            experiments.find_top_of_tree(os.path.join(self.pi, "outdata", "echam")),
+            os.path.realpath(self.pi),
+        )
+        self.assertIsNone(experiments.find_top_of_tree(self.project))
+
+    def test_update_and_lookup(self):
+        catalog = experiments.ExperimentCatalog()
+        self.addCleanup(catalog.close)
+        found = catalog.update([self.project])
+        self.assertEqual(len(found), 3)
+        (pi,) = catalog.lookup("PI")
+        self.assertEqual(pi.path, self.pi)
+        self.assertEqual(pi.components, ["echam", "fesom"])
+        self.assertEqual(pi.config, {"engine": "xarray"})
+        self.assertEqual(catalog.lookup("LGM")[0].components, ["echam"])
+        self.assertEqual(
+            [e.exp_id for e in catalog.experiments(os.path.join(self.project, "PMIP"))],
+            ["LGM", "PI"],
+        )
+        # Rescanning forgets experiments which are gone:
+        shutil.rmtree(self.hol)
+        catalog.update([os.path.join(self.project, "user")])
+        self.assertEqual(catalog.lookup("HOL"), [])
+        self.assertEqual(len(catalog.experiments()), 2)
+
+    def test_resolve_experiment(self):
+        self.assertEqual(experiments.resolve_experiment(self.lgm), self.lgm)
+        with self.assertRaisesRegex(ValueError, "experiments scan"):
+            experiments.resolve_experiment("PI")
+        catalog = experiments.ExperimentCatalog()
+        catalog.update([self.project])
+        self.assertEqual(experiments.resolve_experiment("PI"), self.pi)
+        analyser = EsmAnalysis(exp_base="PI")
+        self.assertEqual(analyser.EXP_BASE, self.pi)
+        self.assertEqual(analyser.ENGINE, "xarray")
+        self.assertEqual(
+            batch.find_experiments(["LGM", os.path.join(self.project, "user")]),
+            [self.lgm, self.hol],
+        )
+        # Another PI in a second project:
+        other = make_experiment(os.path.join(self.tmpdir, "work", "cd4567", "PI"))
+        catalog.update([os.path.dirname(other)])
+        catalog.close()
+        with self.assertRaisesRegex(ValueError, "several experiments called PI"):
+            experiments.resolve_experiment("PI")
+
+    def test_command_line_interface(self):
+        result = CliRunner().invoke(cli.main, ["experiments", "scan", self.project])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Found 3 experiments", result.output)
+        result = CliRunner().invoke(cli.main, ["experiments", "list", "LGM"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn(self.lgm, result.output)
+        self.assertNotIn(self.pi, result.output)
+        result = CliRunner().invoke(
+            cli.main, ["logfile-stats", "--experiments", "UNKNOWN"]
+        )
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("neither a directory nor a known experiment", result.output)
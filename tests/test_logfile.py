@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.logfile`."""
+
+import datetime
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+from click.testing import CliRunner
+
+from esm_analysis import cli, logfile
+from esm_analysis.logfile import (
+    Logfile,
+    combine_run_stats,
+    find_logfiles,
+    parse_log,
+    read_logfiles,
+)
+
+_DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+
+def synthetic_log(nruns, duplicate_every=7, missing=(), not_started=(), seed=0):
+    """
+    Lines of an ESM style log file with ``nruns`` runs, some of them started
+    twice, some ``missing`` entirely, and some ``not_started`` (only done)
+    """
+    rng = random.Random(seed)
+    time = datetime.datetime(2019, 3, 20, 10, 0, 0)
+
+    def line(run, state):
+        return "%s : %s %s %s - %s\n" % (
+            time.strftime(_DATE_FORMAT),
+            run,
+            18500101 + 10000 * run,
+            1000 + run,
+            state,
+        )
+
+    lines = [time.strftime(_DATE_FORMAT) + " : # Beginning of Experiment EXP\n"]
+    for run in range(1, nruns + 1):
+        time += datetime.timedelta(seconds=rng.randint(10, 3600))
+        if run in missing:
+            continue
+        if run % duplicate_every == 0:
+            lines.append(line(run, "start"))
+            time += datetime.timedelta(seconds=rng.randint(10, 60))
+        if run not in not_started:
+            lines.append(line(run, "start"))
+        time += datetime.timedelta(seconds=rng.randint(600, 7200))
+        lines.append(line(run, "done"))
+    lines.append(time.strftime(_DATE_FORMAT) + " : # Experiment over\n")
+    return lines
+
+
+def mpimet_log(lines):
+    """The ``lines`` of an ESM style log in the format of the MPI-Met scripts"""
+    return [line.replace(" : ", " :  ").replace(" - ", " -  ") for line in lines]
+
+
+def former_esm_dataframe(lines):
+    """The former parser of ESM style logfiles"""
+    df = pd.DataFrame([l.split(" : ") for l in lines], columns=["Date", "Message"])
+    df2 = df["Message"].str.split(expand=True)
+    log_df = pd.concat([df[1:]["Date"], df2[1:]], axis=1)
+    lastrow = df2.tail(1)
+    if "Experimentover" in str(lastrow).replace(" ", ""):
+        log_df = log_df.head(-1)
+    log_df.columns = ["Date", "Run Number", "Exp Date", "Job ID", "Seperator", "State"]
+    log_df = log_df.drop("Seperator", axis=1).set_index("Date")
+    log_df.index = pd.to_datetime(log_df.index)
+    return log_df
+
+
+def former_mpimet_dataframe(lines):
+    """The former parser of MPI-Met logfiles"""
+    log_df = pd.read_table(
+        io.StringIO("".join(lines)),
+        sep=r" :  | -",
+        skiprows=1,
+        names=["Date", "Message", "State"],
+        engine="python",
+        index_col=0,
+    )
+    middle_column = log_df["Message"].apply(lambda x: pd.Series(str(x).split()))
+    log_df = log_df.drop("Message", axis=1)
+    middle_column.columns = ["Run Number", "Exp Date", "Job ID"]
+    log_df = pd.concat([log_df, middle_column], axis=1)
+    log_df.set_index(pd.to_datetime(log_df.index), inplace=True)
+    return log_df
+
+
+def loop_compute_throughput(log_df):
+    """The former implementation of ``Logfile.compute_throughput``"""
+    log_df = log_df.astype({"Run Number": str})
+    starts = log_df[log_df.State.str.contains("start")]
+    ends = log_df[log_df.State.str.contains("done")]
+    starts = starts.drop_duplicates(subset="Run Number", keep="last")
+    merged = pd.concat([starts, ends])
+    groupby = merged.groupby("Run Number")
+    run_diffs = {"Run Number": [], "Wall Time": [], "Queue Time": []}
+    for name, group in groupby:
+        if int(name) > 1:
+            previous_group = groupby.get_group(str(int(name) - 1))
+            run_diffs["Queue Time"].append(group.index[0] - previous_group.index[-1])
+        else:
+            run_diffs["Queue Time"].append(datetime.timedelta(0))
+        run_diffs["Run Number"].append(int(name))
+        run_diffs["Wall Time"].append(group.index[-1] - group.index[0])
+    diffs = pd.DataFrame(run_diffs).sort_values("Run Number").set_index("Run Number")
+    throughput = (datetime.timedelta(1) / diffs.mean())["Wall Time"]
+    return pd.DataFrame({"Simulation Average": diffs.mean()}), throughput, diffs
+
+
+class TestParseLog(unittest.TestCase):
+    """Compares the parser with the former ones"""
+
+    def assertSameDataFrame(self, log_df, former):
+        former = former.astype({"Run Number": "int64", "State": "category"})
+        pd.testing.assert_frame_equal(log_df, former)
+
+    def test_esm_style(self):
+        lines = synthetic_log(100)
+        self.assertSameDataFrame(parse_log(lines), former_esm_dataframe(lines))
+
+    def test_mpimet_style(self):
+        lines = mpimet_log(synthetic_log(100))[:-1]
+        self.assertSameDataFrame(
+            parse_log(lines, esm_style=False), former_mpimet_dataframe(lines)
+        )
+
+    def test_blocks(self):
+        lines = synthetic_log(100)
+        with mock.patch.object(logfile, "BLOCK_CHARACTERS", 200):
+            log_df = parse_log("".join(lines))
+        self.assertSameDataFrame(log_df, former_esm_dataframe(lines))
+
+    def test_dates(self):
+        lines = [
+            "Sat May 31 23:00:00 2036 : 1 18500101 4711 - start\n",
+            "Sun Jun  1 01:00:00 2036 : 1 18500101 4711 - done\n",
+            "2036-06-01 02:00:00 : 2 18510101 4712 - start\n",
+        ]
+        self.assertEqual(
+            list(parse_log(lines, header=False).index),
+            list(
+                pd.to_datetime(
+                    ["2036-05-31 23:00", "2036-06-01 01:00", "2036-06-01 02:00"]
+                )
+            ),
+        )
+
+    def test_other_lines_are_skipped(self):
+        lines = synthetic_log(10)
+        lines.insert(5, "Wed Mar 20 11:00:00 2019 : # Restarted\n")
+        lines.insert(6, "\n")
+        self.assertEqual(len(parse_log(lines)), len(synthetic_log(10)) - 2)
+
+    def test_empty(self):
+        log_df = parse_log([])
+        self.assertTrue(log_df.empty)
+        self.assertEqual(log_df["Run Number"].dtype, "int64")
+
+
+class TestComputeThroughput(unittest.TestCase):
+    """Compares the columnar throughput computation with the former loop"""
+
+    def assertSameThroughput(self, log):
+        averages, throughput, diffs = log.compute_throughput()
+        expected_averages, expected_throughput, expected_diffs = (
+            loop_compute_throughput(log.log_df)
+        )
+        pd.testing.assert_frame_equal(diffs, expected_diffs, check_dtype=False)
+        pd.testing.assert_frame_equal(averages, expected_averages, check_dtype=False)
+        self.assertAlmostEqual(throughput, expected_throughput)
+
+    def test_matches_loop(self):
+        log = Logfile(synthetic_log(150))
+        self.assertSameThroughput(log)
+        self.assertEqual(len(log.compute_throughput()[2]), 150)
+
+    def test_runs_without_start(self):
+        self.assertSameThroughput(Logfile(synthetic_log(30, not_started=(4, 5))))
+
+    def test_unfinished_run(self):
+        lines = synthetic_log(12)
+        # Drop "done" and "Experiment over" of the last run:
+        self.assertSameThroughput(Logfile(lines[:-2]))
+
+    def test_missing_runs(self):
+        log = Logfile(synthetic_log(20, missing=(8,)))
+        _, _, diffs = log.compute_throughput()
+        self.assertNotIn(8, diffs.index)
+        self.assertTrue(pd.isna(diffs.loc[9, "Queue Time"]))
+        self.assertGreater(diffs.loc[10, "Queue Time"], datetime.timedelta(0))
+        # The former implementation could not handle this:
+        with self.assertRaises(KeyError):
+            loop_compute_throughput(log.log_df)
+
+    def test_run_stats(self):
+        stats = Logfile(synthetic_log(40)).run_stats()
+        self.assertEqual(len(stats), 5)
+        self.assertGreater(stats.loc["Run Efficiency (Last 10 Runs)", 0], 0)
+
+
+class TestUpdate(unittest.TestCase):
+    """Tests for reading a growing logfile incrementally"""
+
+    def setUp(self):
+        """Set up the lines of a logfile with 40 runs"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, "EXP_compute.log")
+        self.lines = synthetic_log(40)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _append(self, text):
+        with open(self.fname, "a") as f:
+            f.write(text)
+
+    def test_update_matches_full_read(self):
+        self._append("".join(self.lines[:1]))
+        log = Logfile.from_file(self.fname)
+        self.assertTrue(log.log_df.empty)
+        self._append("".join(self.lines[1:30]))
+        # A line which is not completely written yet:
+        self._append(self.lines[30][:12])
+        self.assertEqual(log.update(), 29)
+        self._append(self.lines[30][12:])
+        self.assertEqual(log.update(), 1)
+        self.assertEqual(log.update(), 0)
+        self._append("".join(self.lines[31:]))
+        log.update()
+        expected = Logfile.from_file(self.fname)
+        pd.testing.assert_frame_equal(log.log_df, expected.log_df)
+        pd.testing.assert_frame_equal(
+            log.compute_throughput()[2], expected.compute_throughput()[2]
+        )
+        pd.testing.assert_frame_equal(log.run_stats(), expected.run_stats())
+
+    def test_replaced_file_is_read_again(self):
+        self._append("".join(self.lines))
+        log = Logfile.from_file(self.fname)
+        with open(self.fname, "w") as f:
+            f.write("".join(self.lines[:11]))
+        log.update()
+        self.assertEqual(len(log.compute_throughput()[2]), 5)
+
+    def test_update_needs_a_file(self):
+        with self.assertRaises(ValueError):
+            Logfile(self.lines).update()
+
+
+class TestManyLogfiles(unittest.TestCase):
+    """Tests for the run statistics of several experiments"""
+
+    def setUp(self):
+        """Set up three experiments, one of which has no runs yet"""
+        self.tmpdir = tempfile.mkdtemp()
+        for seed, (exp_id, nruns) in enumerate([("PI", 20), ("LGM", 30), ("NEW", 0)]):
+            scripts = os.path.join(self.tmpdir, exp_id, "scripts")
+            os.makedirs(scripts)
+            open(os.path.join(self.tmpdir, exp_id, ".top_of_exp_tree"), "w").close()
+            with open(os.path.join(scripts, exp_id + "_awicm.log"), "w") as f:
+                f.writelines(synthetic_log(nruns, seed=seed))
+            # Not a logfile of the experiment:
+            open(os.path.join(scripts, "namelist.log"), "w").close()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_logfiles(self):
+        fnames = find_logfiles([self.tmpdir, os.path.join(self.tmpdir, "PI")])
+        self.assertEqual(
+            [os.path.relpath(fname, self.tmpdir) for fname in fnames],
+            [
+                "LGM/scripts/LGM_awicm.log",
+                "NEW/scripts/NEW_awicm.log",
+                "PI/scripts/PI_awicm.log",
+                "PI/scripts/PI_awicm.log",
+            ],
+        )
+
+    def test_combined_table(self):
+        fnames = find_logfiles([self.tmpdir])
+        logs = read_logfiles(fnames, max_workers=2)
+        table = combine_run_stats(
+            dict(zip(fnames, logs)), sort_by="efficiency", ascending=False
+        )
+        self.assertEqual(list(table.index[-1:]), [fnames[1]])
+        self.assertTrue(table.iloc[-1].isna().all())
+        for fname in fnames[0], fnames[2]:
+            pd.testing.assert_series_equal(
+                table.loc[fname],
+                Logfile.from_file(fname).run_stats()[0].rename(fname),
+                check_dtype=False,
+            )
+        self.assertGreaterEqual(
+            table.iloc[0]["Run Efficiency (Last 10 Runs)"],
+            table.iloc[1]["Run Efficiency (Last 10 Runs)"],
+        )
+
+    def test_command_line_interface(self):
+        output = os.path.join(self.tmpdir, "stats.csv")
+        result = CliRunner().invoke(
+            cli.main,
+            [
+                "logfile-stats",
+                os.path.join(self.tmpdir, "P*", "scripts", "P*_awicm.log"),
+                "--experiments",
+                os.path.join(self.tmpdir, "LGM"),
+                "--sort-by",
+                "walltime",
+                "--output",
+                output,
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(pd.read_csv(output)), 2)
+        result = CliRunner().invoke(
+            cli.main, ["logfile-stats", "--experiments", self.tmpdir, "--sort-by", "t"]
+        )
+        self.assertNotEqual(result.exit_code, 0)
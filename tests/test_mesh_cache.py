@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.mesh_cache`."""
+
+import os
+import shutil
+import tempfile
+import time
+import types
+import unittest
+
+import numpy as np
+
+from esm_analysis.mesh_cache import MeshCache, compute_node_areas
+
+
+def fake_mesh():
+    mesh = types.SimpleNamespace()
+    mesh.x2 = np.array([0.0, 1.0, 0.0, 1.0])
+    mesh.y2 = np.array([0.0, 0.0, 1.0, 1.0])
+    mesh.elem = np.array([[0, 1, 2], [1, 3, 2]])
+    mesh.zlevs = np.array([0.0, 10.0, 20.0])
+    mesh.n2d = 4
+    mesh.path = "/somewhere"
+    return mesh
+
+
+class TestMeshCache(unittest.TestCase):
+    """Tests for the FESOM mesh cache"""
+
+    def setUp(self):
+        """Set up a fake mesh directory and an empty cache"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.mesh_dir = os.path.join(self.tmpdir, "mesh")
+        os.makedirs(self.mesh_dir)
+        with open(os.path.join(self.mesh_dir, "nod2d.out"), "w") as f:
+            f.write("4\n")
+        self.cache = MeshCache(os.path.join(self.tmpdir, "cache"))
+        self.loads = 0
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _loader(self):
+        self.loads += 1
+        return fake_mesh()
+
+    def test_node_areas_add_up(self):
+        mesh = fake_mesh()
+        areas = compute_node_areas(mesh.x2, mesh.y2, mesh.elem, earth_radius=1.0)
+        triangles = [
+            0.5 * np.radians(1.0) ** 2 * np.cos(np.radians(mean_lat))
+            for mean_lat in (1.0 / 3, 2.0 / 3)
+        ]
+        self.assertAlmostEqual(areas.sum(), sum(triangles), places=12)
+        self.assertAlmostEqual(areas[0], triangles[0] / 3, places=12)
+
+    def test_second_load_is_mmapped(self):
+        first = self.cache.load(self.mesh_dir, [50, 15, -90], self._loader)
+        second = self.cache.load(self.mesh_dir, [50, 15, -90], self._loader)
+        self.assertEqual(self.loads, 1)
+        self.assertIsInstance(second.x2, np.memmap)
+        np.testing.assert_array_equal(second.elem, fake_mesh().elem)
+        np.testing.assert_array_equal(second.node_areas, first.node_areas)
+        self.assertEqual(second.n2d, 4)
+
+    def test_invalidated_by_rotation_and_mesh_change(self):
+        self.cache.load(self.mesh_dir, [50, 15, -90], self._loader)
+        self.cache.load(self.mesh_dir, [0, 0, 0], self._loader)
+        self.assertEqual(self.loads, 2)
+        time.sleep(0.01)
+        with open(os.path.join(self.mesh_dir, "nod2d.out"), "a") as f:
+            f.write("changed\n")
+        self.cache.load(self.mesh_dir, [50, 15, -90], self._loader)
+        self.assertEqual(self.loads, 3)
+        # The stale entry for the old mesh files is gone:
+        self.assertEqual(len(os.listdir(self.cache.cache_dir)), 2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.profiling`."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from esm_analysis import cli, profiling
+
+from .test_logfile import synthetic_log
+
+
+class Copier(object):
+    """A stand-in for ``cdo.Cdo``, copying its input to its output"""
+
+    def copy(self, options=None, input=None, output=None):
+        with open(output, "w") as f:
+            for fname in input.split():
+                with open(fname) as source:
+                    f.write(source.read())
+        return output
+
+
+@profiling.timed
+def step():
+    with profiling.span("inner", detail=1):
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+    """Tests for the recorded spans and their output"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        profiling.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_nothing_is_recorded_when_disabled(self):
+        step()
+        tool = Copier()
+        self.assertIs(profiling.instrument(tool, "cdo"), tool)
+        self.assertFalse(profiling.enabled())
+
+    def test_spans_are_nested_and_merged(self):
+        with profiling.profile() as profiler:
+            for _ in range(3):
+                step()
+        self.assertFalse(profiling.enabled())
+        tree = profiler.to_dict()
+        self.assertEqual([child["name"] for child in tree["children"]], ["step"] * 3)
+        self.assertEqual(tree["children"][0]["children"][0]["attrs"], {"detail": 1})
+        lines = profiler.summary(min_fraction=0).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split()[:3], ["step", "3", "x"])
+        self.assertTrue(lines[2].startswith("    inner"))
+
+    def test_instrumented_calls(self):
+        fnames = []
+        for index in range(2):
+            fnames.append(os.path.join(self.tmpdir, "in%s.txt" % index))
+            with open(fnames[-1], "w") as f:
+                f.write("x" * 100)
+        output = os.path.join(self.tmpdir, "out.txt")
+        with profiling.profile() as profiler:
+            profiling.instrument(Copier(), "cdo").copy(
+                options="-f nc", input=" ".join(fnames), output=output
+            )
+        (span,) = profiler.root.children
+        self.assertEqual(span.name, "cdo copy")
+        self.assertEqual(
+            span.attrs["command"], "cdo -f nc -copy %s %s" % (" ".join(fnames), output)
+        )
+        self.assertEqual(span.attrs["bytes_in"], 200)
+        self.assertEqual(span.attrs["bytes_out"], 200)
+        self.assertIn("in 200 B", profiler.summary())
+
+    def test_output_files(self):
+        with profiling.profile() as profiler:
+            step()
+        profiler.write_json(os.path.join(self.tmpdir, "profile.json"))
+        profiler.write_chrome_trace(os.path.join(self.tmpdir, "trace.json"))
+        with open(os.path.join(self.tmpdir, "profile.json")) as f:
+            self.assertEqual(json.load(f)["children"][0]["name"], "step")
+        with open(os.path.join(self.tmpdir, "trace.json")) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual(
+            [event["name"] for event in events], ["total", "step", "inner"]
+        )
+        self.assertTrue(all(event["ph"] == "X" for event in events))
+        self.assertLessEqual(events[1]["ts"], events[2]["ts"])
+
+    def test_command_line_interface(self):
+        fname = os.path.join(self.tmpdir, "EXP_compute.log")
+        with open(fname, "w") as f:
+            f.writelines(synthetic_log(10))
+        trace = os.path.join(self.tmpdir, "trace.json")
+        result = CliRunner().invoke(
+            cli.main,
+            [
+                "--profile-output",
+                trace,
+                "--profile-format",
+                "chrome",
+                "logfile-stats",
+                fname,
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Profile:", result.output)
+        self.assertFalse(profiling.enabled())
+        with open(trace) as f:
+            names = [event["name"] for event in json.load(f)["traceEvents"]]
+        self.assertIn("Logfile.from_file", names)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.result_cache`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from esm_analysis.esm_analysis import EsmAnalysis
+from esm_analysis.result_cache import (
+    DEFAULT_QUOTA,
+    ResultCache,
+    cache_key,
+    parse_size,
+)
+
+
+class TestResultCache(unittest.TestCase):
+    """Tests for the content-addressed result cache"""
+
+    def setUp(self):
+        """Set up an input file and an empty cache"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.input = os.path.join(self.tmpdir, "input.grb")
+        with open(self.input, "w") as f:
+            f.write("data")
+        self.cache = ResultCache(os.path.join(self.tmpdir, ".cache"), quota="1K")
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _compute(self, key, name, size=100):
+        output = os.path.join(self.tmpdir, name)
+        if not self.cache.fetch(key, output):
+            with open(output, "w") as f:
+                f.write("x" * size)
+            self.cache.store(key, output)
+        return output
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("1K"), 1024)
+        self.assertEqual(parse_size("1.5G"), int(1.5 * 1024**3))
+        self.assertEqual(parse_size(None), None)
+        self.assertEqual(parse_size("none"), None)
+        self.assertEqual(ResultCache(self.tmpdir).quota, parse_size(DEFAULT_QUOTA))
+
+    def test_key_depends_on_inputs_and_options(self):
+        key = cache_key(["fldmean"], "temp2", "-f nc", [self.input])
+        self.assertNotEqual(key, cache_key(["fldmean"], "temp2", "", [self.input]))
+        self.assertNotEqual(
+            key, cache_key(["yearmean"], "temp2", "-f nc", [self.input])
+        )
+        with open(self.input, "a") as f:
+            f.write("more data")
+        self.assertNotEqual(key, cache_key(["fldmean"], "temp2", "-f nc", [self.input]))
+
+    def test_hit_and_miss(self):
+        key = cache_key(["fldmean"], "temp2", "", [self.input])
+        output = self._compute(key, "fldmean.nc")
+        os.remove(output)
+        self._compute(key, "fldmean.nc")
+        self.assertTrue(os.path.isfile(output))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_lru_eviction(self):
+        first = self._compute("a", "a.nc", size=600)
+        second = self._compute("b", "b.nc", size=600)
+        self.assertEqual(os.listdir(self.cache.object_dir), ["b.nc"])
+        self.assertEqual(self.cache.stats()["size"], 600)
+        # The analysis results themselves are kept:
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        self.assertFalse(self.cache.fetch("a", first))
+
+    def test_replaced_results_are_dropped(self):
+        output = self._compute("a", "fldmean.nc")
+        os.remove(output)
+        self._compute("b", "fldmean.nc")
+        self.assertEqual(os.listdir(self.cache.object_dir), ["b.nc"])
+        stats = self.cache.stats()
+        self.assertEqual((stats["entries"], stats["size"]), (1, 100))
+        # The same when the output is replaced by a cached result:
+        self._compute("c", "other.nc")
+        self.assertTrue(self.cache.fetch("c", output))
+        self.assertEqual(sorted(os.listdir(self.cache.object_dir)), ["c.nc"])
+
+
+class TestCachedResults(unittest.TestCase):
+    """Results computed again do not change the cached results"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "EXP")
+        os.makedirs(self.exp_base)
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\n")
+        self.analyser = EsmAnalysis(exp_base=self.exp_base)
+        self.output = os.path.join(self.analyser.ANALYSIS_DIR, "EXP_temp2_fldmean.nc")
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _compute(self, data):
+        """The result for an input ``data``, written in place as cdo would"""
+
+        def compute():
+            with open(self.output, "w") as f:
+                f.write("result of " + data)
+
+        fname = os.path.join(self.tmpdir, data + ".grb")
+        if not os.path.exists(fname):
+            with open(fname, "w") as f:
+                f.write(data)
+        self.analyser._cached(["fldmean"], "temp2", [fname], self.output, compute)
+        with open(self.output) as f:
+            return f.read()
+
+    def test_recompute_keeps_cached_result(self):
+        self.assertEqual(self._compute("A"), "result of A")
+        # Linked to the cached result of A, which is read again below:
+        other = os.path.join(self.analyser.ANALYSIS_DIR, "other.nc")
+        os.link(self.output, other)
+        self.assertEqual(self._compute("BB"), "result of BB")
+        with open(other) as f:
+            self.assertEqual(f.read(), "result of A")
+        # Only the newest result of an output is kept:
+        self.assertEqual(self._compute("A"), "result of A")
+        stats = self.analyser.result_cache.stats()
+        self.assertEqual((stats["entries"], stats["hits"]), (1, 0))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.streaming`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from esm_analysis import profiling
+from esm_analysis.esm_analysis import EsmAnalysis
+from esm_analysis.streaming import Accumulator, StreamingEngine, parse_operator
+from esm_analysis.xarray_engine import XarrayEngine, gaussian_latitudes
+
+from .test_xarray_engine import write_monthly_files
+
+
+class TestAccumulator(unittest.TestCase):
+    """Tests for the online statistics"""
+
+    def test_matches_numpy(self):
+        rng = np.random.default_rng(1)
+        data = rng.normal(5, 3, (50, 3, 4))
+        data[rng.random(data.shape) < 0.2] = np.nan
+        # A grid point without any valid values:
+        data[:, 0, 0] = np.nan
+        accumulator = Accumulator()
+        for start in range(0, 50, 7):
+            accumulator.update(data[start : start + 7])
+        with np.errstate(invalid="ignore"), self.assertWarns(RuntimeWarning):
+            expected = {
+                "mean": np.nanmean(data, axis=0),
+                "std": np.nanstd(data, axis=0),
+                "var1": np.nanvar(data, axis=0, ddof=1),
+                "min": np.nanmin(data, axis=0),
+                "max": np.nanmax(data, axis=0),
+            }
+        for statistic, values in expected.items():
+            np.testing.assert_allclose(
+                accumulator.result(statistic), values, err_msg=statistic
+            )
+
+    def test_parse_operator(self):
+        self.assertEqual(parse_operator("ymonstd"), ("month", "std"))
+        self.assertEqual(parse_operator("timvar1"), (None, "var1"))
+        self.assertEqual(parse_operator("yseasmean"), ("season", "mean"))
+        with self.assertRaises(ValueError):
+            parse_operator("fldsum")
+
+
+class TestStreamingEngine(unittest.TestCase):
+    """Compares the streaming engine with the xarray engine"""
+
+    def setUp(self):
+        """Set up two years of monthly output with two variables"""
+        self.tmpdir = tempfile.mkdtemp()
+        lat, _ = gaussian_latitudes(8)
+        lon = np.arange(0, 360, 22.5)
+        self.files = write_monthly_files(
+            self.tmpdir, [1850, 1851, 1852], lat, lon, varnames=("temp2", "aprl")
+        )
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_xarray_engine(self):
+        operators = ["fldmean", "ymonmean", "ymonstd", "yseasmean", "timmean"]
+        varnames = ["temp2", "aprl"]
+        streamed = StreamingEngine(block_bytes=8).reductions(
+            operators,
+            varnames,
+            self.files,
+            {op: os.path.join(self.tmpdir, "stream_" + op + ".nc") for op in operators},
+        )
+        expected = XarrayEngine(scheduler="synchronous").reductions(
+            operators,
+            varnames,
+            self.files,
+            {op: os.path.join(self.tmpdir, "xr_" + op + ".nc") for op in operators},
+        )
+        for operator in operators:
+            with xr.open_dataset(streamed[operator]) as a, xr.open_dataset(
+                expected[operator]
+            ) as b:
+                np.testing.assert_array_equal(a.time.values, b.time.values)
+                for varname in varnames:
+                    np.testing.assert_allclose(
+                        a[varname].values,
+                        b[varname].values,
+                        err_msg=operator,
+                    )
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            StreamingEngine().reductions(["seasmean"], ["temp2"], self.files)
+
+
+class TestFesomTimeStatistic(unittest.TestCase):
+    """FESOM statistics computed with the streaming engine"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        exp_base = os.path.join(self.tmpdir, "EXP")
+        fesom = os.path.join(exp_base, "outdata", "fesom")
+        os.makedirs(fesom)
+        with open(os.path.join(exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\n")
+        rng = np.random.default_rng(3)
+        self.files = []
+        for year in (1850, 1851):
+            fname = os.path.join(fesom, "EXP_fesom_sst_%s0101.nc" % year)
+            xr.Dataset(
+                {"sst": (("time", "nodes_2d"), rng.normal(size=(12, 5)))},
+                coords={
+                    "time": xr.date_range("%s-01-15" % year, periods=12, freq="MS")
+                },
+            ).to_netcdf(fname)
+            self.files.append(fname)
+        analyser = EsmAnalysis(exp_base=exp_base, engine="streaming")
+        analyser.initialize_analysis_components()
+        self.fesom = analyser.fesom
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_key_without_profiling(self):
+        with mock.patch.object(
+            StreamingEngine, "reduce", autospec=True, side_effect=StreamingEngine.reduce
+        ) as reduce:
+            self.fesom.ymonstd("sst", self.files).close()
+            # The engine is wrapped in a proxy now, which must not change the key:
+            with profiling.profile():
+                self.fesom.ymonstd("sst", self.files).close()
+        self.assertEqual(reduce.call_count, 1)
+        self.assertEqual(self.fesom.result_cache.stats()["hits"], 1)
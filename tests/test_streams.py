@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.streams`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from esm_analysis.components.echam import EchamAnalysis
+from esm_analysis.components.fesom import FesomAnalysis
+from esm_analysis.streams import StreamIndex, parse_filename
+
+
+class TestStreams(unittest.TestCase):
+    """Tests for the classification of output files"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exp_base = os.path.join(self.tmpdir, "LGM_011")
+        self.echam = os.path.join(self.exp_base, "outdata", "echam")
+        self.fesom = os.path.join(self.exp_base, "outdata", "fesom")
+        os.makedirs(self.echam)
+        os.makedirs(self.fesom)
+        with open(os.path.join(self.exp_base, ".top_of_exp_tree"), "w") as f:
+            f.write("# Top of experiment\n")
+        # Two streams which only differ in their digits:
+        for stream, code in (
+            ("stream123", "167   1  temp2"),
+            ("stream456", "4 1 aprl"),
+        ):
+            for month in (1, 2):
+                name = "LGM_011_echam6_%s_1850%02d" % (stream, month)
+                self._touch(self.echam, name + ".grb")
+                with open(os.path.join(self.echam, name + ".codes"), "w") as f:
+                    f.write("  %s  0 0  some variable\n" % code)
+        self._touch(self.echam, "LGM_011_echam6_accw_185001.nc")
+        self._touch(self.echam, "OTHER_echam6_stream123_185001.grb")
+        for variable in ("sst", "sss", "u2"):
+            for year in (1850, 1851):
+                self._touch(self.fesom, "LGM_011_fesom_%s_%s0101.nc" % (variable, year))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, directory, fname):
+        open(os.path.join(directory, fname), "w").close()
+
+    def test_parse_filename(self):
+        parsed = parse_filename("/out/LGM_011_echam6_BOT_mm_185001.grb", "LGM_011")
+        self.assertEqual(parsed, ("LGM_011", "echam6", "BOT_mm", "185001", ".grb"))
+        self.assertEqual(parsed.key, "echam6_BOT_mm.grb")
+        self.assertEqual(
+            parse_filename("EXP_fesom_sst.nc"), ("EXP", "fesom", "sst", None, ".nc")
+        )
+        self.assertEqual(
+            parse_filename("EXP_fesom_sst_1850-01-01.nc").date, "1850-01-01"
+        )
+        self.assertIsNone(parse_filename("OTHER_fesom_sst.nc", "EXP"))
+        self.assertIsNone(parse_filename("notes.txt"))
+        # Not a date, so part of the stream name:
+        self.assertEqual(
+            parse_filename("EXP_echam6_echam_18501.grb")[2:4], ("echam_18501", None)
+        )
+
+    def test_stream_index(self):
+        streams = StreamIndex(self.echam, "LGM_011")
+        self.assertEqual(
+            streams.keys(),
+            [
+                "echam6_accw.nc",
+                "echam6_stream123.codes",
+                "echam6_stream123.grb",
+                "echam6_stream456.codes",
+                "echam6_stream456.grb",
+            ],
+        )
+        self.assertEqual(
+            [os.path.basename(f) for f in streams.files("echam6_stream123.grb")],
+            [
+                "LGM_011_echam6_stream123_185001.grb",
+                "LGM_011_echam6_stream123_185002.grb",
+            ],
+        )
+        self.assertEqual(streams.files("echam6_missing.grb"), [])
+        self.assertEqual(streams.with_extension(".nc"), ["echam6_accw.nc"])
+        self.assertEqual(StreamIndex(os.path.join(self.tmpdir, "missing")).keys(), [])
+
+    def test_echam_variables(self):
+        echam = EchamAnalysis(exp_base=self.exp_base)
+        self.assertEqual(
+            {stream: sorted(names) for stream, names in echam._variables.items()},
+            {"echam6_stream123.grb": ["temp2"], "echam6_stream456.grb": ["aprl"]},
+        )
+        files = echam._get_files_for_variable_short_name_single_component("aprl")
+        self.assertEqual(
+            [os.path.basename(f) for f in files],
+            [
+                "LGM_011_echam6_stream456_185001.grb",
+                "LGM_011_echam6_stream456_185002.grb",
+            ],
+        )
+
+    def test_fesom_variables(self):
+        fesom = FesomAnalysis(exp_base=self.exp_base)
+        self.assertEqual(
+            fesom._variables,
+            {
+                "fesom_%s.nc" % variable: {variable: {"short_name": variable}}
+                for variable in ("sss", "sst", "u2")
+            },
+        )
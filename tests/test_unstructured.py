@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.unstructured`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from esm_analysis import unstructured
+
+
+class TestFldmean(unittest.TestCase):
+    """Tests for the area weighted mean on unstructured meshes"""
+
+    def setUp(self):
+        """Set up a tiny mesh with four nodes"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.node_areas = np.array([1.0, 2.0, 3.0, 4.0])
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def _write_years(self, varname, dims, shape, years=(1850, 1851)):
+        files, data = [], []
+        for year in years:
+            values = self.rng.normal(size=(12,) + shape)
+            time = pd.date_range("%s-01-01" % year, periods=12, freq="MS")
+            fname = os.path.join(
+                self.tmpdir, "EXP_fesom_%s_%s0101.nc" % (varname, year)
+            )
+            xr.Dataset(
+                {varname: (("time",) + dims, values)}, coords={"time": time}
+            ).to_netcdf(fname)
+            files.append(fname)
+            data.append(values)
+        return files, np.concatenate(data)
+
+    def test_surface_field(self):
+        files, data = self._write_years("sst", ("nodes_2d",), (4,))
+        # Tiny blocks, so that the files are read in several pieces:
+        with mock.patch.object(unstructured, "BLOCK_BYTES", 5 * 4 * 8):
+            result = unstructured.fldmean(files, "sst", self.node_areas)
+        expected = data @ self.node_areas / self.node_areas.sum()
+        np.testing.assert_allclose(result.sst.values, expected)
+        self.assertEqual(result.sizes["time"], 24)
+
+    def test_missing_values_are_ignored(self):
+        files, data = self._write_years("sst", ("nodes_2d",), (4,), years=[1850])
+        with xr.open_dataset(files[0]) as ds:
+            ds = ds.load()
+        ds.sst[:, 0] = np.nan
+        ds.to_netcdf(files[0])
+        result = unstructured.fldmean(files, "sst", self.node_areas)
+        expected = data[:, 1:] @ self.node_areas[1:] / self.node_areas[1:].sum()
+        np.testing.assert_allclose(result.sst.values, expected)
+
+    def test_levelwise_field(self):
+        files, data = self._write_years("temp", ("depth", "nodes_2d"), (2, 4))
+        result = unstructured.fldmean(
+            files, "temp", self.node_areas, depths=[0.0, -20.0]
+        )
+        levels = data @ self.node_areas / self.node_areas.sum()
+        np.testing.assert_allclose(result.temp_levels.values, levels)
+        # Both levels are 10 m thick:
+        np.testing.assert_allclose(result.temp.values, levels.mean(axis=1))
+
+    def test_field_on_3d_nodes(self):
+        # Node 3 has no second level:
+        n32 = np.array([[1, 5], [2, 6], [3, 7], [4, -999]])
+        files, data = self._write_years("temp", ("nodes_3d",), (7,), years=[1850])
+        result = unstructured.fldmean(files, "temp", self.node_areas, n32=n32)
+        surface = data[:, :4] @ self.node_areas / self.node_areas.sum()
+        second = data[:, 4:] @ self.node_areas[:3] / self.node_areas[:3].sum()
+        np.testing.assert_allclose(result.temp_levels.values[:, 0], surface)
+        np.testing.assert_allclose(result.temp_levels.values[:, 1], second)
+        with self.assertRaises(ValueError):
+            unstructured.fldmean(files, "temp", self.node_areas)
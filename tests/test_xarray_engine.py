@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `esm_analysis.xarray_engine`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from esm_analysis.xarray_engine import (
+    OPERATORS,
+    XarrayEngine,
+    area_weights,
+    gaussian_latitudes,
+)
+
+
+def write_monthly_files(directory, years, lat, lon, varnames=("temp2",)):
+    """Writes one NetCDF file per month with random fields"""
+    rng = np.random.default_rng(42)
+    files = []
+    for year in years:
+        for month in range(1, 13):
+            time = pd.DatetimeIndex(["%04d-%02d-15" % (year, month)])
+            ds = xr.Dataset(
+                {
+                    name: (
+                        ("time", "lat", "lon"),
+                        rng.normal(280, 10, (1, len(lat), len(lon))),
+                    )
+                    for name in varnames
+                },
+                coords={"time": time, "lat": lat, "lon": lon},
+            )
+            fname = os.path.join(
+                directory, "EXP_echam6_echam_%04d%02d.nc" % (year, month)
+            )
+            ds.to_netcdf(fname)
+            files.append(fname)
+    return files
+
+
+class TestAreaWeights(unittest.TestCase):
+    """Tests for the latitude weights"""
+
+    def test_gaussian_grid(self):
+        lat, weights = gaussian_latitudes(48)
+        np.testing.assert_allclose(area_weights(lat), weights / weights.sum())
+        # Order of the latitudes doesn't matter:
+        np.testing.assert_allclose(
+            area_weights(lat[::-1]), (weights / weights.sum())[::-1]
+        )
+
+    def test_regular_grid(self):
+        lat = np.array([-60.0, 0.0, 60.0])
+        # Bands -90..-30, -30..30, 30..90:
+        np.testing.assert_allclose(area_weights(lat), [0.25, 0.5, 0.25])
+
+
+class TestXarrayEngine(unittest.TestCase):
+    """Compares the xarray engine with cdo"""
+
+    def setUp(self):
+        """Set up two years of monthly output on a Gaussian grid"""
+        self.tmpdir = tempfile.mkdtemp()
+        lat, _ = gaussian_latitudes(16)
+        lon = np.arange(0, 360, 11.25)
+        self.files = write_monthly_files(self.tmpdir, [1850, 1851], lat, lon)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        shutil.rmtree(self.tmpdir)
+
+    def test_reductions_shapes(self):
+        engine = XarrayEngine(scheduler="synchronous")
+        outputs = engine.reductions(
+            OPERATORS,
+            ["temp2"],
+            self.files,
+            {op: os.path.join(self.tmpdir, op + ".nc") for op in OPERATORS},
+        )
+        expected_steps = {
+            "fldmean": 24,
+            "yearmean": 2,
+            "ymonmean": 12,
+            "yseasmean": 4,
+            "timmean": 1,
+        }
+        for operator, steps in expected_steps.items():
+            with xr.open_dataset(outputs[operator]) as ds:
+                self.assertEqual(ds.sizes["time"], steps, operator)
+        with xr.open_dataset(outputs["timmean"]) as ds:
+            expected = np.mean(
+                [xr.open_dataset(f).temp2.values[0] for f in self.files], axis=0
+            )
+            np.testing.assert_allclose(ds.temp2.values[0], expected)
+
+    @unittest.skipIf(shutil.which("cdo") is None, "cdo is not installed")
+    def test_matches_cdo(self):
+        import cdo
+
+        cdo = cdo.Cdo()
+        for scheduler in ("threads", "processes"):
+            engine = XarrayEngine(scheduler=scheduler, num_workers=2)
+            for operator in OPERATORS:
+                ours = engine.reduce(
+                    operator,
+                    ["temp2"],
+                    self.files,
+                    os.path.join(self.tmpdir, "ours_%s.nc" % operator),
+                )
+                theirs = getattr(cdo, operator)(
+                    input="-select,name=temp2 " + " ".join(self.files),
+                    output=os.path.join(self.tmpdir, "cdo_%s.nc" % operator),
+                )
+                with xr.open_dataset(ours) as a, xr.open_dataset(theirs) as b:
+                    np.testing.assert_allclose(
+                        a.temp2.values.squeeze(),
+                        b.temp2.values.squeeze(),
+                        rtol=1e-5,
+                        err_msg=operator,
+                    )